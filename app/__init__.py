@@ -19,6 +19,7 @@ import os  # Import os for environment variables
 from app.config import DevelopmentConfig, ProductionConfig  # Import configuration classes
 from app.models import session_manager
 from app.models import init_session_manager
+from app.models import AlignmentCache, AlignmentViewCache, JobManager
 import logging
 from logging.handlers import RotatingFileHandler
 from apscheduler.schedulers.background import BackgroundScheduler
@@ -99,9 +100,12 @@ def create_app():
     
     app.config["UPLOADS_FOLDER"] = os.path.join(PRODUCT_ROOT,"uploads")
     app.config["RESULTS_FOLDER"] = os.path.join(PRODUCT_ROOT,"results")
+    # Results bundles shared by sessions of identical submissions, one directory per fingerprint
+    app.config["SHARED_RESULTS_FOLDER"] = os.path.join(app.config["RESULTS_FOLDER"], "shared")
     
     os.makedirs(app.config["UPLOADS_FOLDER"], exist_ok =True)   
     os.makedirs(app.config["RESULTS_FOLDER"], exist_ok =True)
+    os.makedirs(app.config["SHARED_RESULTS_FOLDER"], exist_ok =True)
     
     db_path = os.path.join(app.config["RESULTS_FOLDER"], 'user_sessions.db')
 
@@ -109,6 +113,19 @@ def create_app():
     # Initialize the session manager and attach it to the app
     app.session_manager = init_session_manager(app, db_path, session_timeout_minutes=20)
 
+    # Alignment cache shared by every session and worker
+    app.alignment_cache = None
+    if app.config.get("ALIGNMENT_CACHE_MAX_MB", 0) > 0:
+        cache_path = os.path.join(app.config["RESULTS_FOLDER"], 'alignment_cache.db')
+        app.alignment_cache = AlignmentCache(cache_path, app.config["ALIGNMENT_CACHE_MAX_MB"] * 1024 * 1024)
+
+    # Rendered alignment views of each session, kept in this process
+    app.alignment_view_cache = AlignmentViewCache(app.config.get("ALIGNMENT_VIEW_CACHE_ENTRIES", 0),
+                                                  app.config.get("ALIGNMENT_VIEW_CACHE_MAX_MB", 0) * 1024 * 1024)
+
+    # Background runner for the results pipeline, jobs stored next to the sessions
+    app.job_manager = JobManager(app, db_path, workers=app.config.get("PIPELINE_JOB_WORKERS", 2))
+
     # If SQLiteSessionManager supports init_app(), call it
     if hasattr(session_manager, 'init_app'):
         session_manager.init_app(app)
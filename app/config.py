@@ -5,10 +5,42 @@ class Config:
     DEBUG = False
     SESSION_COOKIE_SECURE = True  # Secure cookies for production
 
+    # Pairwise alignments run in a bounded pool; 1 keeps the serial behaviour.
+    # The pool is per job, so a server runs up to gunicorn workers x
+    # PIPELINE_JOB_WORKERS x ALIGNMENT_WORKERS alignments (EMBOSS processes)
+    # at once; size the product, not the factor, to the CPUs
+    ALIGNMENT_WORKERS = int(os.getenv("ALIGNMENT_WORKERS", 1))
+    # "thread" suits the EMBOSS subprocesses, "process" suits CPU-bound aligners
+    ALIGNMENT_EXECUTOR = os.getenv("ALIGNMENT_EXECUTOR", "thread")
+    # Budgets for the upload cost model; the first program in the fallback
+    # chain that fits both is used. Memory is per worker (75 MB keeps needle
+    # below ~3000 bases), time is the wall-clock estimate of the whole run
+    ALIGNMENT_MEMORY_LIMIT_MB = int(os.getenv("ALIGNMENT_MEMORY_LIMIT_MB", 75))
+    ALIGNMENT_TIME_LIMIT_SECONDS = int(os.getenv("ALIGNMENT_TIME_LIMIT_SECONDS", 1500))
+    # Alignments shared across sessions; 0 disables the cache
+    ALIGNMENT_CACHE_MAX_MB = int(os.getenv("ALIGNMENT_CACHE_MAX_MB", 512))
+    # Results pipelines run in the background, this many at a time per process
+    PIPELINE_JOB_WORKERS = int(os.getenv("PIPELINE_JOB_WORKERS", 2))
+    # Progress streams end after this many seconds so they do not hold a
+    # worker thread for a whole job; browsers reconnect after the retry delay
+    PROGRESS_STREAM_SECONDS = float(os.getenv("PROGRESS_STREAM_SECONDS", 10))
+    PROGRESS_RETRY_SECONDS = float(os.getenv("PROGRESS_RETRY_SECONDS", 2))
+    # Approximate mode: default k-mer identity (%) from which pairs are aligned
+    APPROXIMATE_IDENTITY_THRESHOLD = float(os.getenv("APPROXIMATE_IDENTITY_THRESHOLD", 95))
+    # Rows and columns of the approximate identity matrix shown at a time
+    APPROXIMATE_VIEW_BLOCK = int(os.getenv("APPROXIMATE_VIEW_BLOCK", 50))
+    # Sessions submitting the same sequences and parameters share one set of results
+    SHARE_IDENTICAL_RESULTS = os.getenv("SHARE_IDENTICAL_RESULTS", "true").lower() == "true"
+    # Widest window of columns the alignment viewer may request at once
+    ALIGNMENT_VIEW_MAX_COLUMNS = int(os.getenv("ALIGNMENT_VIEW_MAX_COLUMNS", 5000))
+    # Alignment view responses kept per session, and for all sessions of a
+    # worker in MB; 0 entries disables the cache
+    ALIGNMENT_VIEW_CACHE_ENTRIES = int(os.getenv("ALIGNMENT_VIEW_CACHE_ENTRIES", 32))
+    ALIGNMENT_VIEW_CACHE_MAX_MB = int(os.getenv("ALIGNMENT_VIEW_CACHE_MAX_MB", 64))
+
 class DevelopmentConfig(Config):
     DEBUG = True
     SESSION_COOKIE_SECURE = False  # Allow insecure cookies for local testing
 
 class ProductionConfig(Config):
     DEBUG = False  # Disable debugging in production
-    
\ No newline at end of file
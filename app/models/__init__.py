@@ -16,6 +16,9 @@
 
 
 from .sqlite_db import SQLiteSessionManager, SessionError, DatabaseError
+from .alignment_cache import AlignmentCache
+from .view_cache import AlignmentViewCache
+from .job_manager import JobManager
 
 # Create a global session manager instance that can be initialized later
 session_manager = None
@@ -45,6 +48,9 @@ __all__ = [
     'SQLiteSessionManager',
     'SessionError',
     'DatabaseError',
+    'AlignmentCache',
+    'AlignmentViewCache',
+    'JobManager',
     'session_manager',
     'init_session_manager'
 ]
\ No newline at end of file
@@ -0,0 +1,224 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import sqlite3
+import hashlib
+import logging
+import time
+import zlib
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class AlignmentCache:
+
+    """
+    Content-addressed store of pairwise alignments shared by all sessions.
+
+    Entries are keyed by the hashes of both sequences and the alignment
+    parameters, and for the in-process aligners by the version of their
+    code, so the same pair submitted again in any session is read back
+    instead of realigned. SQLite (WAL) serialises concurrent writers from
+    several gunicorn workers; the total size is bounded with LRU eviction,
+    against a running total kept with the counters.
+    """
+
+    MATRIX = "EDNAFULL"
+    # Fraction of max_bytes kept after an eviction pass
+    EVICT_TO = 0.9
+    # SQLite limits the number of host parameters per statement
+    BATCH_SIZE = 500
+
+    #SQL query constants
+    CREATE_CACHE_TABLE_QUERY = '''
+        CREATE TABLE IF NOT EXISTS alignment_cache(
+          cache_key TEXT PRIMARY KEY,
+          qaln BLOB,
+          saln BLOB,
+          score REAL,
+          size INTEGER,
+          last_used REAL
+        )
+    '''
+    CREATE_STATS_TABLE_QUERY = '''
+        CREATE TABLE IF NOT EXISTS alignment_cache_stats(
+          name TEXT PRIMARY KEY,
+          value INTEGER
+        )
+    '''
+    CREATE_INDEX_QUERY = '''
+        CREATE INDEX IF NOT EXISTS idx_cache_last_used ON alignment_cache(last_used);
+    '''
+    INIT_STATS_QUERY = '''
+        INSERT OR IGNORE INTO alignment_cache_stats(name, value) VALUES (?, 0)
+    '''
+    UPDATE_STATS_QUERY = '''
+        UPDATE alignment_cache_stats SET value = value + ? WHERE name = ?
+    '''
+    INSERT_ENTRY_QUERY = '''
+        INSERT OR REPLACE INTO alignment_cache(cache_key, qaln, saln, score, size, last_used)
+        VALUES(?, ?, ?, ?, ?, ?)
+    '''
+    TOUCH_ENTRY_QUERY = '''
+        UPDATE alignment_cache SET last_used = ? WHERE cache_key = ?
+    '''
+    SYNC_SIZE_QUERY = '''
+        UPDATE alignment_cache_stats SET value = (SELECT COALESCE(SUM(size), 0) FROM alignment_cache)
+        WHERE name = 'bytes'
+    '''
+    TOTAL_SIZE_QUERY = '''
+        SELECT value FROM alignment_cache_stats WHERE name = 'bytes'
+    '''
+    OLDEST_ENTRIES_QUERY = '''
+        SELECT cache_key, size FROM alignment_cache ORDER BY last_used LIMIT ?
+    '''
+
+    STATS = ("hits", "misses", "evictions", "bytes")
+
+    def __init__(self, db_path, max_bytes):
+        """
+        Parameters:
+        - db_path: Path to the SQLite cache file.
+        - max_bytes: Bound on the stored (compressed) alignment bytes.
+        """
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        with self.managed_connection() as conn:
+            conn.execute(self.CREATE_CACHE_TABLE_QUERY)
+            conn.execute(self.CREATE_STATS_TABLE_QUERY)
+            conn.execute(self.CREATE_INDEX_QUERY)
+            conn.executemany(self.INIT_STATS_QUERY, [(name,) for name in self.STATS])
+            # The running total starts from the entries, once per process
+            conn.execute(self.SYNC_SIZE_QUERY)
+            conn.commit()
+        logger.info(f"Initialized alignment cache at: {db_path}")
+
+    @contextmanager
+    def managed_connection(self):
+        """Short-lived connection; each gunicorn worker opens its own."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def sequence_hash(sequence):
+        return hashlib.sha256(sequence.encode()).hexdigest()
+
+    @classmethod
+    def make_key(cls, qseq, sseq, program, gap_open, gap_extend, version=None):
+        """
+        Key of (hash(qseq), hash(sseq), program, matrix, gap_open, gap_extend)
+        and, when given, the version of the program's code.
+        """
+        parts = (cls.sequence_hash(qseq), cls.sequence_hash(sseq), program, cls.MATRIX,
+                 repr(float(gap_open)), repr(float(gap_extend)))
+        if version:
+            parts += (version,)
+        return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+    def get_many(self, keys):
+        """
+        Return {key: (qaln, saln, score)} for the keys present in the cache
+        and count the hits and misses. Lookup errors count as misses.
+        """
+        found = {}
+        try:
+            with self.managed_connection() as conn:
+                for start in range(0, len(keys), self.BATCH_SIZE):
+                    batch = keys[start:start + self.BATCH_SIZE]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = conn.execute(
+                        f"SELECT cache_key, qaln, saln, score FROM alignment_cache WHERE cache_key IN ({placeholders})",
+                        batch).fetchall()
+                    for key, qaln, saln, score in rows:
+                        found[key] = (zlib.decompress(qaln).decode(), zlib.decompress(saln).decode(), score)
+
+                now = time.time()
+                conn.executemany(self.TOUCH_ENTRY_QUERY, [(now, key) for key in found])
+                self._count(conn, hits=len(found), misses=len(keys) - len(found))
+                conn.commit()
+        except (sqlite3.Error, zlib.error) as e:
+            logger.warning(f"Alignment cache lookup failed: {e}")
+        return found
+
+    def put_many(self, entries):
+        """Store [(key, qaln, saln, score), ...] and evict down to the size bound."""
+        if not entries:
+            return
+        now = time.time()
+        rows = []
+        for key, qaln, saln, score in entries:
+            qblob = zlib.compress(qaln.encode())
+            sblob = zlib.compress(saln.encode())
+            rows.append((key, qblob, sblob, score, len(qblob) + len(sblob), now))
+        try:
+            with self.managed_connection() as conn:
+                # Replaced entries are taken off the running total
+                conn.execute("BEGIN IMMEDIATE")
+                replaced = 0
+                for start in range(0, len(rows), self.BATCH_SIZE):
+                    batch = [row[0] for row in rows[start:start + self.BATCH_SIZE]]
+                    placeholders = ",".join("?" * len(batch))
+                    replaced += conn.execute(
+                        f"SELECT COALESCE(SUM(size), 0) FROM alignment_cache WHERE cache_key IN ({placeholders})",
+                        batch).fetchone()[0]
+                conn.executemany(self.INSERT_ENTRY_QUERY, rows)
+                self._count(conn, bytes=sum(row[4] for row in rows) - replaced)
+                self._evict(conn)
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Alignment cache write failed: {e}")
+
+    def _evict(self, conn):
+        """Drop least recently used entries while the cache is over its bound."""
+        total = conn.execute(self.TOTAL_SIZE_QUERY).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * self.EVICT_TO
+        evicted = freed = 0
+        while total > target:
+            oldest = conn.execute(self.OLDEST_ENTRIES_QUERY, (self.BATCH_SIZE,)).fetchall()
+            if not oldest:
+                break
+            doomed = []
+            for key, size in oldest:
+                if total <= target:
+                    break
+                doomed.append((key,))
+                total -= size
+                freed += size
+            conn.executemany("DELETE FROM alignment_cache WHERE cache_key = ?", doomed)
+            evicted += len(doomed)
+        self._count(conn, evictions=evicted, bytes=-freed)
+        logger.info(f"Alignment cache evicted {evicted} entries.")
+
+    def _count(self, conn, **counts):
+        conn.executemany(self.UPDATE_STATS_QUERY,
+                         [(value, name) for name, value in counts.items() if value])
+
+    def stats(self):
+        """Hit/miss/eviction counters, entry count and size in bytes."""
+        with self.managed_connection() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM alignment_cache_stats").fetchall())
+            entries = conn.execute("SELECT COUNT(*) FROM alignment_cache").fetchone()[0]
+        lookups = counters.get("hits", 0) + counters.get("misses", 0)
+        counters.update(entries=entries, hit_ratio=counters.get("hits", 0) / lookups if lookups else 0.0)
+        return counters
@@ -0,0 +1,271 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import sqlite3
+import logging
+import os
+import time
+import uuid
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class JobManager:
+
+    """
+    Runs the results pipeline outside the request in a local worker pool.
+
+    Jobs are recorded in the pipeline_jobs table of the session database, so
+    any gunicorn worker can answer status requests for a job another worker
+    is running. A job moves queued -> running -> done | failed.
+
+    Progress of the jobs running in this process is also kept in memory, so
+    progress streams wait on a condition instead of polling the database.
+    """
+
+    QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+    ACTIVE = (QUEUED, RUNNING)
+    # Minimum seconds between two progress writes of one job
+    PROGRESS_INTERVAL = 1.0
+
+    #SQL query constants
+    CREATE_JOBS_TABLE_QUERY = '''
+        CREATE TABLE IF NOT EXISTS pipeline_jobs(
+          job_id TEXT PRIMARY KEY,
+          session_id TEXT,
+          status TEXT,
+          pairs_done INTEGER DEFAULT 0,
+          pairs_total INTEGER DEFAULT 0,
+          error TEXT,
+          owner_pid INTEGER,
+          created_at DATETIME,
+          started_at DATETIME,
+          finished_at DATETIME,
+          FOREIGN KEY(session_id) REFERENCES user_sessions(session_id) ON DELETE CASCADE
+        )
+    '''
+    CREATE_INDEX_QUERY = '''
+        CREATE INDEX IF NOT EXISTS idx_jobs_session ON pipeline_jobs(session_id, created_at);
+    '''
+    INSERT_JOB_QUERY = '''
+        INSERT INTO pipeline_jobs(job_id, session_id, status, owner_pid, created_at)
+        VALUES(?, ?, ?, ?, ?)
+    '''
+    START_JOB_QUERY = '''
+        UPDATE pipeline_jobs SET status = ?, started_at = ? WHERE job_id = ?
+    '''
+    PROGRESS_QUERY = '''
+        UPDATE pipeline_jobs SET pairs_done = ?, pairs_total = ? WHERE job_id = ?
+    '''
+    FINISH_JOB_QUERY = '''
+        UPDATE pipeline_jobs SET status = ?, error = ?, finished_at = ? WHERE job_id = ?
+    '''
+    LATEST_JOB_QUERY = '''
+        SELECT * FROM pipeline_jobs WHERE session_id = ?
+        ORDER BY created_at DESC LIMIT 1
+    '''
+    ACTIVE_JOBS_QUERY = '''
+        SELECT job_id, owner_pid FROM pipeline_jobs WHERE status IN (?, ?)
+    '''
+
+    def __init__(self, app=None, db_path=None, workers=2):
+        """
+        Parameters:
+        - app: Flask application the jobs run under.
+        - db_path: Path to the session database holding pipeline_jobs.
+        - workers: Number of pipeline jobs run at the same time.
+        """
+        self.app = app
+        self.db_path = db_path
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline")
+        self._last_progress = {}
+        # job_id -> live progress of the jobs running in this process
+        self._live = {}
+        self._changed = threading.Condition()
+        with self.managed_connection() as conn:
+            conn.execute(self.CREATE_JOBS_TABLE_QUERY)
+            conn.execute(self.CREATE_INDEX_QUERY)
+            conn.commit()
+        self.fail_orphaned_jobs()
+
+    @contextmanager
+    def managed_connection(self):
+        """Short-lived connection, safe to use from the job threads."""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            yield conn
+        finally:
+            conn.close()
+
+    def _execute(self, query, params):
+        with self.managed_connection() as conn:
+            conn.execute(query, params)
+            conn.commit()
+
+    def fail_orphaned_jobs(self):
+        """Mark queued/running jobs whose owning process is gone as failed."""
+        with self.managed_connection() as conn:
+            jobs = conn.execute(self.ACTIVE_JOBS_QUERY, self.ACTIVE).fetchall()
+        for job in jobs:
+            if not _process_alive(job["owner_pid"]):
+                self._execute(self.FINISH_JOB_QUERY,
+                              (self.FAILED, "The server restarted while the job was running.", datetime.now(), job["job_id"]))
+                logger.warning(f"Marked orphaned job {job['job_id']} as failed.")
+
+    def submit(self, session_id, target, *args, **kwargs):
+        """
+        Queue target(*args, progress=callback, **kwargs) for a session and
+        return its job id. An active job of the session is reused instead.
+        """
+        latest = self.get_latest_job(session_id)
+        if latest and latest["status"] in self.ACTIVE:
+            return latest["job_id"]
+
+        job_id = uuid.uuid4().hex
+        self._execute(self.INSERT_JOB_QUERY, (job_id, session_id, self.QUEUED, os.getpid(), datetime.now()))
+        self.executor.submit(self._run, job_id, target, args, kwargs)
+        logger.info(f"Queued pipeline job {job_id} for session {session_id}")
+        return job_id
+
+    def _run(self, job_id, target, args, kwargs):
+        with self.managed_connection() as conn:
+            started = conn.execute(self.START_JOB_QUERY, (self.RUNNING, datetime.now(), job_id)).rowcount
+            conn.commit()
+        if not started:
+            # The session ended while the job was queued and took its row along
+            logger.info(f"Pipeline job {job_id} dropped, its session has ended")
+            return
+        with self._changed:
+            self._live[job_id] = {"pairs_done": 0, "pairs_total": 0, "started": time.monotonic()}
+            self._changed.notify_all()
+        try:
+            with self.app.app_context():
+                target(*args, progress=lambda done, total: self.report_progress(job_id, done, total), **kwargs)
+        except Exception as e:
+            logger.error(f"Pipeline job {job_id} failed: {e}", exc_info=True)
+            self._execute(self.FINISH_JOB_QUERY, (self.FAILED, str(e), datetime.now(), job_id))
+        else:
+            self._execute(self.FINISH_JOB_QUERY, (self.DONE, None, datetime.now(), job_id))
+            logger.info(f"Pipeline job {job_id} finished")
+        finally:
+            self._last_progress.pop(job_id, None)
+            with self._changed:
+                self._live.pop(job_id, None)
+                self._changed.notify_all()
+
+    def report_progress(self, job_id, done, total):
+        """Record pair progress; the database at most once per PROGRESS_INTERVAL."""
+        with self._changed:
+            live = self._live.get(job_id)
+            if live is not None:
+                live["pairs_done"], live["pairs_total"] = done, total
+                self._changed.notify_all()
+
+        now = time.monotonic()
+        if done < total and now - self._last_progress.get(job_id, 0.0) < self.PROGRESS_INTERVAL:
+            return
+        self._last_progress[job_id] = now
+        try:
+            self._execute(self.PROGRESS_QUERY, (done, total, job_id))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not record progress of job {job_id}: {e}")
+
+    def get_latest_job(self, session_id):
+        """Most recent job of a session as a dict, or None."""
+        with self.managed_connection() as conn:
+            job = conn.execute(self.LATEST_JOB_QUERY, (session_id,)).fetchone()
+        return dict(job) if job else None
+
+
+    def get_job(self, job_id):
+        with self.managed_connection() as conn:
+            job = conn.execute("SELECT * FROM pipeline_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(job) if job else None
+
+    def _snapshot(self, job_id):
+        """Progress of a job with its throughput (pairs/s) and ETA (s)."""
+        with self._changed:
+            live = dict(self._live[job_id]) if job_id in self._live else None
+
+        if live is not None:
+            status, message = self.RUNNING, None
+            done, total = live["pairs_done"], live["pairs_total"]
+            elapsed = time.monotonic() - live["started"]
+        else:
+            job = self.get_job(job_id)
+            if job is None:
+                return None
+            status, message = job["status"], job["error"]
+            done, total = job["pairs_done"], job["pairs_total"]
+            elapsed = 0.0
+            if job["started_at"]:
+                end = datetime.fromisoformat(job["finished_at"]) if job["finished_at"] else datetime.now()
+                elapsed = (end - datetime.fromisoformat(job["started_at"])).total_seconds()
+
+        rate = done / elapsed if elapsed > 0 and done else 0.0
+        eta = (total - done) / rate if rate and status == self.RUNNING else None
+        return {"job_id": job_id, "status": status, "pairs_done": done, "pairs_total": total,
+                "elapsed_seconds": round(elapsed, 1), "pairs_per_second": round(rate, 2),
+                "eta_seconds": None if eta is None else round(eta, 1), "message": message}
+
+    def watch(self, job_id, timeout, min_interval=0.5):
+        """
+        Yield progress snapshots of a job for at most `timeout` seconds, or
+        until it is done or failed. A job running in this process is followed
+        through the in-memory condition; a queued job or one of another process
+        is read once, and its client reconnects for the next snapshot.
+        """
+        last = None
+        deadline = time.monotonic() + timeout
+        while True:
+            snapshot = self._snapshot(job_id)
+            if snapshot is None:
+                return
+            state = (snapshot["status"], snapshot["pairs_done"], snapshot["pairs_total"])
+            if state != last:
+                yield snapshot
+                last = state
+                if snapshot["status"] not in self.ACTIVE:
+                    return
+
+            with self._changed:
+                remaining = deadline - time.monotonic()
+                if job_id not in self._live or remaining <= 0:
+                    return
+                seen = (self._live[job_id]["pairs_done"], self._live[job_id]["pairs_total"])
+                self._changed.wait_for(
+                    lambda: job_id not in self._live
+                    or (self._live[job_id]["pairs_done"], self._live[job_id]["pairs_total"]) != seen,
+                    timeout=remaining)
+            time.sleep(min_interval)
+
+def _process_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -18,6 +18,7 @@ import sqlite3
 from flask import current_app
 from datetime import datetime, timedelta
 import os
+import fcntl
 from contextlib import contextmanager # for connection pooling
 import shutil
 
@@ -68,6 +69,14 @@ class SQLiteSessionManager:
           transratio_matrix_path TEXT,
           summary_features_path TEXT,
           summary_alignment_path TEXT,
+          comparison_mode TEXT DEFAULT 'full',
+          identity_threshold REAL,
+          approx_identity_path TEXT,
+          reference_id TEXT,
+          fingerprint TEXT,
+          alignment_store_path TEXT,
+          statistics_store_path TEXT,
+          approx_identity_store_path TEXT,
           FOREIGN KEY(session_id) REFERENCES user_sessions(session_id) ON DELETE CASCADE
         )
     '''
@@ -80,10 +89,60 @@ class SQLiteSessionManager:
       INSERT INTO session_data(session_id, upload_file_path, psa_program, gap_open, gap_extend,
             num_sequences, alignment_file_path, user_alignment_file_path,
             processed_file_path, nucleotide_matrix_path, user_nucleotide_matrix_path, transratio_matrix_path,summary_features_path,
-          summary_alignment_path)
-      VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+          summary_alignment_path, comparison_mode, identity_threshold, approx_identity_path,
+          reference_id, fingerprint, alignment_store_path, statistics_store_path, approx_identity_store_path)
+      VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
       
     '''
+    # Columns added after the first release, created on databases that predate them
+    SESSION_DATA_MIGRATIONS = {
+        "comparison_mode": "ALTER TABLE session_data ADD COLUMN comparison_mode TEXT DEFAULT 'full'",
+        "identity_threshold": "ALTER TABLE session_data ADD COLUMN identity_threshold REAL",
+        "approx_identity_path": "ALTER TABLE session_data ADD COLUMN approx_identity_path TEXT",
+        "reference_id": "ALTER TABLE session_data ADD COLUMN reference_id TEXT",
+        "fingerprint": "ALTER TABLE session_data ADD COLUMN fingerprint TEXT",
+        "alignment_store_path": "ALTER TABLE session_data ADD COLUMN alignment_store_path TEXT",
+        "statistics_store_path": "ALTER TABLE session_data ADD COLUMN statistics_store_path TEXT",
+        "approx_identity_store_path": "ALTER TABLE session_data ADD COLUMN approx_identity_store_path TEXT",
+    }
+    # Results shared by the sessions of identical submissions, deleted with the last one
+    CREATE_BUNDLES_TABLE_QUERY = '''
+        CREATE TABLE IF NOT EXISTS result_bundles(
+          fingerprint TEXT PRIMARY KEY,
+          results_dir TEXT,
+          ref_count INTEGER DEFAULT 0,
+          created_at DATETIME
+        )
+    '''
+    ACQUIRE_BUNDLE_QUERIES = (
+        "INSERT OR IGNORE INTO result_bundles(fingerprint, results_dir, ref_count, created_at) VALUES(?, ?, 0, ?)",
+        "UPDATE result_bundles SET ref_count = ref_count + 1 WHERE fingerprint = ?",
+    )
+    RELEASE_BUNDLE_QUERY = '''
+      UPDATE result_bundles SET ref_count = ref_count - 1 WHERE fingerprint = ?
+    '''
+    GET_BUNDLE_QUERY = '''
+      SELECT * FROM result_bundles WHERE fingerprint = ?
+    '''
+    # Queued or running pipeline jobs of the sessions sharing a bundle
+    ACTIVE_BUNDLE_JOBS_QUERY = '''
+      SELECT 1 FROM pipeline_jobs JOIN session_data ON session_data.session_id = pipeline_jobs.session_id
+      WHERE session_data.fingerprint = ? AND pipeline_jobs.status IN ('queued', 'running') LIMIT 1
+    '''
+    RECOUNT_BUNDLES_QUERY = '''
+      UPDATE result_bundles SET ref_count =
+        (SELECT COUNT(*) FROM session_data WHERE session_data.fingerprint = result_bundles.fingerprint)
+    '''
+    # session_data columns holding result files, rewritten when a session leaves its bundle
+    RESULT_PATH_COLUMNS = [
+        "alignment_file_path", "user_alignment_file_path", "processed_file_path", "nucleotide_matrix_path",
+        "user_nucleotide_matrix_path", "transratio_matrix_path", "summary_features_path", "summary_alignment_path",
+        "approx_identity_path", "alignment_store_path", "statistics_store_path", "approx_identity_store_path"
+    ]
+    UPDATE_NUM_SEQUENCES_QUERY = '''
+      UPDATE session_data SET num_sequences = ?
+      WHERE session_id = ?
+    '''
     # Add indexes for faster queries
     CREATE_INDEX_QUERY = '''
         CREATE INDEX IF NOT EXISTS idx_last_activity ON user_sessions(last_activity);
@@ -199,6 +258,11 @@ class SQLiteSessionManager:
         with self.app.app_context():
           self.execute_query(SQLiteSessionManager.CREATE_TABLE_QUERY)
           self.execute_query(SQLiteSessionManager.CREATE_SESSION_DATA_ENTRY_TABLE)
+          columns = {row["name"] for row in self.execute_query("PRAGMA table_info(session_data)", fetch_all=True) or []}
+          for column, query in self.SESSION_DATA_MIGRATIONS.items():
+              if column not in columns:
+                  self.execute_query(query)
+          self.execute_query(self.CREATE_BUNDLES_TABLE_QUERY)
           self.execute_query(self.CREATE_INDEX_QUERY)  # Ensure index for optimization
           current_app.logger.info(f"Initialized database at: {self.db_path}")
 
@@ -237,15 +301,133 @@ class SQLiteSessionManager:
     def insert_session_data(self, session_id, upload_file_path, psa_program,
                         gap_open, gap_extend, num_sequences, alignment_file_path,
                         user_alignment_file_path, processed_fasta_file_path, 
-                        nucleotide_matrix_path, user_nucleotide_matrix_path, transratio_matrix_path, summary_features_path,  summary_alignment_path):
-        """ Insert session-specific data into the database."""
+                        nucleotide_matrix_path, user_nucleotide_matrix_path, transratio_matrix_path, summary_features_path,  summary_alignment_path,
+                        comparison_mode="full", identity_threshold=None, approx_identity_path=None, reference_id=None,
+                        fingerprint=None, alignment_store_path=None, statistics_store_path=None,
+                        approx_identity_store_path=None):
+        """
+        Insert session-specific data into the database. With a fingerprint the
+        result paths point into the shared bundle of that fingerprint, whose
+        reference count is taken in the same transaction.
+        """
         params = (session_id, upload_file_path, psa_program, gap_open, gap_extend, num_sequences, 
                   alignment_file_path, user_alignment_file_path, processed_fasta_file_path, 
-                  nucleotide_matrix_path, user_nucleotide_matrix_path, transratio_matrix_path, summary_features_path,  summary_alignment_path)
-        self.execute_query(self.INSERT_SESSION_DATA_QUERY, params)  # Pass params as a tuple
+                  nucleotide_matrix_path, user_nucleotide_matrix_path, transratio_matrix_path, summary_features_path,  summary_alignment_path,
+                  comparison_mode, identity_threshold, approx_identity_path, reference_id, fingerprint,
+                  alignment_store_path, statistics_store_path, approx_identity_store_path)
+        if fingerprint is None:
+            self.execute_query(self.INSERT_SESSION_DATA_QUERY, params)  # Pass params as a tuple
+        else:
+            try:
+                with self.managed_connection() as conn:
+                    conn.execute("BEGIN IMMEDIATE;")
+                    conn.execute(self.ACQUIRE_BUNDLE_QUERIES[0],
+                                 (fingerprint, os.path.dirname(alignment_file_path), datetime.now()))
+                    conn.execute(self.ACQUIRE_BUNDLE_QUERIES[1], (fingerprint,))
+                    conn.execute(self.INSERT_SESSION_DATA_QUERY, params)
+                    conn.commit()
+            except DatabaseError as e:
+                current_app.logger.error(f"Error inserting shared session data for {session_id}: {e}")
+                raise  # The upload must fail rather than redirect to a session without data
         current_app.logger.info(f"Session data inserted for session: {session_id}")
+
+    def count_bundle_references(self, fingerprint):
+        """Number of sessions sharing the results bundle of a fingerprint."""
+        bundle = self.execute_query(self.GET_BUNDLE_QUERY, (fingerprint,), fetch_one=True)
+        return bundle["ref_count"] if bundle else 0
+
+    def release_bundle(self, fingerprint):
+        """
+        Drop one reference to a results bundle; the last reference deletes it.
+        The directory is moved aside while the write lock is held, so a
+        session taking a new reference never sees it half deleted.
+        """
+        self._delete_unused_bundle(fingerprint, release=True)
+
+    def _delete_unused_bundle(self, fingerprint, release=False, results_dir=None):
+        """
+        Delete a bundle nobody references, optionally dropping one reference
+        first. While a job of the bundle is queued or running the deletion is
+        deferred: the bundle stays without references and the orphan cleanup
+        deletes it once the job is over.
+        """
+        doomed = None
+        with self.managed_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE;")
+            if release:
+                conn.execute(self.RELEASE_BUNDLE_QUERY, (fingerprint,))
+            bundle = conn.execute(self.GET_BUNDLE_QUERY, (fingerprint,)).fetchone()
+            if bundle is None or bundle["ref_count"] <= 0:
+                results_dir = bundle["results_dir"] if bundle else results_dir
+                if self._bundle_in_use(conn, fingerprint, results_dir):
+                    conn.commit()
+                    self.app.logger.info(f"Results bundle {fingerprint} is in use by a job, deletion deferred")
+                    return
+                conn.execute("DELETE FROM result_bundles WHERE fingerprint = ?", (fingerprint,))
+                if results_dir and os.path.isdir(results_dir):
+                    doomed = f"{results_dir}.deleted"
+                    os.replace(results_dir, doomed)
+            conn.commit()
+        if doomed:
+            shutil.rmtree(doomed, ignore_errors=True)
+            self.app.logger.info(f"Deleted results bundle: {results_dir}")
+
+    def _bundle_in_use(self, conn, fingerprint, results_dir):
+        """
+        True while a job of the bundle is queued or running. A running job
+        holds the results lock, which also covers jobs whose session has
+        already ended and taken its pipeline_jobs row with it.
+        """
+        from app.utils.pipeline import LOCK_NAME  # app.utils imports the models package
+
+        try:
+            if conn.execute(self.ACTIVE_BUNDLE_JOBS_QUERY, (fingerprint,)).fetchone():
+                return True
+        except sqlite3.OperationalError:
+            pass  # No job manager has created pipeline_jobs yet
+        lock_path = os.path.join(results_dir, LOCK_NAME) if results_dir else None
+        if not lock_path or not os.path.exists(lock_path):
+            return False
+        with open(lock_path) as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return False
+
+    def detach_session_results(self, session_id):
+        """
+        Copy-on-write for sessions about to change their results (appending
+        sequences or pairs): copy the shared bundle into the session's own
+        results directory, point the session at the copy and release the
+        bundle. Returns the updated session data.
+        """
+        from app.utils.pipeline import results_lock  # app.utils imports the models package
+
+        session_data = self.get_session_individual_details(session_id)
+        if not session_data or not session_data.get("fingerprint"):
+            return session_data
+
+        bundle_dir = os.path.dirname(session_data["alignment_file_path"])
+        results_dir = os.path.join(self.app.config.get("RESULTS_FOLDER", ""), session_id)
+        with results_lock(session_data):
+            shutil.copytree(bundle_dir, results_dir, dirs_exist_ok=True)
+        paths = {column: session_data[column] and os.path.join(results_dir, os.path.basename(session_data[column]))
+                 for column in self.RESULT_PATH_COLUMNS}
+        assignments = ", ".join(f"{column} = ?" for column in paths)
+        self.execute_query(f"UPDATE session_data SET {assignments}, fingerprint = NULL WHERE session_id = ?",
+                           (*paths.values(), session_id))
+        self.release_bundle(session_data["fingerprint"])
+        current_app.logger.info(f"Session {session_id} detached from results bundle {bundle_dir}")
+        return self.get_session_individual_details(session_id)
     
         
+    def update_num_sequences(self, session_id, num_sequences):
+        """ Record the sequence count after sequences were appended to a session."""
+        self.execute_query(self.UPDATE_NUM_SEQUENCES_QUERY, (num_sequences, session_id))
+        current_app.logger.info(f"Session {session_id} now has {num_sequences} sequences")
+
     def update_activity(self, session_id):
         """Update session last activity timestamp."""
         try:
@@ -444,9 +626,14 @@ class SQLiteSessionManager:
             uploads_folder = self.app.config.get("UPLOADS_FOLDER", "")
             results_folder = self.app.config.get("RESULTS_FOLDER", "")
 
+            shared_folder = self.app.config.get("SHARED_RESULTS_FOLDER", "")
+
             # Get a list of session directories in the uploads and results folders
             upload_session_dirs = [d for d in os.listdir(uploads_folder) if os.path.isdir(os.path.join(uploads_folder, d))]
-            result_session_dirs = [d for d in os.listdir(results_folder) if os.path.isdir(os.path.join(results_folder, d))]
+            result_session_dirs = [d for d in os.listdir(results_folder) if os.path.isdir(os.path.join(results_folder, d))
+                                   and os.path.join(results_folder, d) != shared_folder]
+
+            self._cleanup_orphaned_bundles(shared_folder)
 
             with self.managed_connection() as conn:
                 cursor = conn.cursor()
@@ -480,12 +667,41 @@ class SQLiteSessionManager:
     
     
     
+    def _cleanup_orphaned_bundles(self, shared_folder):
+        """Recount bundle references from session data and delete unreferenced bundles."""
+        if not shared_folder or not os.path.isdir(shared_folder):
+            return
+        with self.managed_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE;")
+            conn.execute(self.RECOUNT_BUNDLES_QUERY)
+            conn.commit()
+            live = {row["fingerprint"] for row in
+                    conn.execute("SELECT fingerprint FROM result_bundles WHERE ref_count > 0").fetchall()}
+
+        # Leave recently written bundles to a later round
+        recent = (datetime.now() - timedelta(minutes=self.session_timeout_minutes)).timestamp()
+        for fingerprint in os.listdir(shared_folder):
+            directory = os.path.join(shared_folder, fingerprint)
+            if fingerprint in live or not os.path.isdir(directory):
+                continue
+            if fingerprint.endswith(".deleted"):
+                shutil.rmtree(directory, ignore_errors=True)
+                continue
+            if os.path.getmtime(directory) > recent:
+                continue
+            self.app.logger.info(f"Deleting orphaned results bundle: {fingerprint}")
+            self._delete_unused_bundle(fingerprint, results_dir=directory)
+
     def _delete_session_files(self, session_data):
-        """Delete uploaded files and directories safely."""
-        file_paths = [
-            "upload_file_path", "alignment_file_path", "user_alignment_file_path",
-            "processed_file_path", "nucleotide_matrix_path", "user_nucleotide_matrix_path", "transratio_matrix_path", "summary_features_path", "summary_alignment_path"
-        ]
+        """
+        Delete uploaded files and directories safely. Results shared with
+        other sessions are only released; the last session deletes them.
+        """
+        file_paths = ["upload_file_path"] + self.RESULT_PATH_COLUMNS
+        fingerprint = session_data["fingerprint"] if "fingerprint" in session_data.keys() else None
+        if fingerprint:
+            file_paths = ["upload_file_path"]
+            self.release_bundle(fingerprint)
 
         # Delete individual files
         for file_field in file_paths:
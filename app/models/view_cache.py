@@ -0,0 +1,104 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class AlignmentViewCache:
+
+    """
+    Rendered alignment view responses, kept per session in memory.
+
+    Users flip between the same few pairs, so each session keeps its most
+    recently viewed responses (JSON bodies) in an LRU of max_entries.
+    Sessions are evicted least recently used first while all entries
+    together are over max_bytes. The cache is local to the process; each
+    gunicorn worker keeps its own and counts its own hits and misses.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        """
+        Parameters:
+        - max_entries: Bound on the responses kept per session.
+        - max_bytes: Bound on the size of the responses of all sessions.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()
+        self._bytes = 0
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+
+    def get(self, session_id, key):
+        """The response body stored for key in the session, or None; counts a hit or a miss."""
+        with self._lock:
+            entries = self._sessions.get(session_id)
+            body = entries.get(key) if entries is not None else None
+            if body is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["hits"] += 1
+            entries.move_to_end(key)
+            self._sessions.move_to_end(session_id)
+            return body
+
+    def put(self, session_id, key, body):
+        """Store a response body and evict down to the bounds; bodies over max_bytes are not kept."""
+        if self.max_entries <= 0 or len(body) > self.max_bytes:
+            return
+        with self._lock:
+            entries = self._sessions.setdefault(session_id, OrderedDict())
+            self._sessions.move_to_end(session_id)
+            previous = entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            entries[key] = body
+            self._bytes += len(body)
+
+            while len(entries) > self.max_entries:
+                self._drop_oldest(session_id)
+            while self._bytes > self.max_bytes:
+                self._drop_oldest(next(iter(self._sessions)))
+
+    def _drop_oldest(self, session_id):
+        entries = self._sessions[session_id]
+        _, body = entries.popitem(last=False)
+        self._bytes -= len(body)
+        self._counters["evictions"] += 1
+        if not entries:
+            del self._sessions[session_id]
+
+    def drop_session(self, session_id):
+        """Forget the responses of a session."""
+        with self._lock:
+            entries = self._sessions.pop(session_id, None)
+            if entries:
+                self._bytes -= sum(len(body) for body in entries.values())
+
+    def stats(self):
+        """Hit/miss/eviction counters, session and entry counts, size in bytes and hit ratio."""
+        with self._lock:
+            counters = dict(self._counters)
+            counters.update(sessions=len(self._sessions),
+                            entries=sum(len(entries) for entries in self._sessions.values()),
+                            bytes=self._bytes)
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_ratio"] = counters["hits"] / lookups if lookups else 0.0
+        return counters
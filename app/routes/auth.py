@@ -108,6 +108,7 @@ def end_session():
     # Call the session manager to end the session
     try:
         session_manager.end_session(session_id)
+        current_app.alignment_view_cache.drop_session(session_id)
         logger.info(f"Session ended successfully for session_id: {session_id}")  # Log successful session end
         return jsonify({'message': 'Session ended', 'session_id': session_id})
     except Exception as e:
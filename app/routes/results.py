@@ -19,10 +19,9 @@
 # app/route/results.py
 import logging
 from logging.handlers import RotatingFileHandler
-from flask import Blueprint, request, jsonify, render_template,current_app
+from flask import Blueprint, request, jsonify, render_template,current_app, Response, stream_with_context
 import pandas as pd
 import itertools
-import psa
 from Bio import SeqIO
 import os
 import numpy as np
@@ -30,8 +29,10 @@ from flask import Flask, render_template, redirect, url_for, request, send_file,
 from io import StringIO
 from flask_wtf.csrf import CSRFProtect,validate_csrf
 from app.routes import session_manager  # For using the global instance
-from app.utils.file_handlers import process_fasta_file, perform_alignment, process_alignments_files, calculate_transitions_transversions, count_transitions_transversions, extract_alignment_pair, colour_code_alignment
+from app.utils.file_handlers import process_fasta_file, perform_alignment, process_alignments_files, calculate_transitions_transversions, count_transitions_transversions, extract_alignment_pair, colour_code_alignment, extract_alignment_view, colour_code_window, colour_code_compact, COLOUR_LINE_LENGTH, transratio_table, summary_tables, nucleotide_matrices_of, approx_identity_block
 from app.utils.validators import validate_session
+from app.utils.pipeline import run_pipeline, run_selected_pairs, pair_counts, result_export, RESULT_EXPORT_PATHS
+from app.utils.alignment_store import AlignmentStore, store_version
 
 results_bp = Blueprint('results', __name__)
 
@@ -57,20 +58,14 @@ def align_fasta():
 
         
 
-        # Process the FASTA file and generate results
-        process_fasta_file(session_data['upload_file_path'], session_data['alignment_file_path'],
-                        session_data['user_alignment_file_path'], session_data['psa_program'],
-                        session_data['gap_open'], session_data['gap_extend'])
-        process_alignments_files(session_data['alignment_file_path'], session_data['processed_file_path'])
-        calculate_transitions_transversions(session_data['processed_file_path'],
-                                            session_data['nucleotide_matrix_path'],
-                                            session_data['user_nucleotide_matrix_path'],
-                                            session_data['transratio_matrix_path'],
-                                            session_data['summary_features_path'],
-                                            session_data['summary_alignment_path'])
-                                            
+        # Run the pipeline in the background; the page polls /results/status
+        job_id = current_app.job_manager.submit(
+            session_id, run_pipeline, session_data,
+            workers=current_app.config.get('ALIGNMENT_WORKERS', 1),
+            executor=current_app.config.get('ALIGNMENT_EXECUTOR', 'thread'),
+            cache=current_app.alignment_cache)
+        logger.info(f"Pipeline job {job_id} submitted for session {session_id}")
 
-        
         # Render and return the results.html template
         return render_template('results.html')
 
@@ -81,6 +76,60 @@ def align_fasta():
         return jsonify({"status": "error", "message": str(e)}), 500  # Return JSON error
     
 
+@results_bp.route('/results/status')
+@validate_session  # Ensures session is valid before running the route
+def results_status():
+    try:
+        session_id = request.cookies.get('session_id')  #  Read from cookie
+
+        job = current_app.job_manager.get_latest_job(session_id)
+        if not job:
+            return jsonify({"status": "error", "message": "No job found for this session"}), 404
+
+        return jsonify({
+            "job_id": job['job_id'],
+            "status": job['status'],
+            "pairs_done": job['pairs_done'],
+            "pairs_total": job['pairs_total'],
+            "message": job['error']
+        }), 200
+
+    except Exception as e:
+        logger.error(f"An error occurred: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@results_bp.route('/results/progress')
+@validate_session  # Ensures session is valid before running the route
+def results_progress():
+    """
+    Server-Sent Events stream of the session's pipeline job: one event per
+    progress change (pairs done/total, pairs per second, ETA). The stream
+    ends once the job is done or failed, and otherwise after
+    PROGRESS_STREAM_SECONDS so it does not hold a worker thread for the whole
+    job; the browser reconnects after the retry hint.
+    """
+    session_id = request.cookies.get('session_id')  #  Read from cookie
+    job_manager = current_app.job_manager
+
+    job = job_manager.get_latest_job(session_id)
+    if not job:
+        return jsonify({"status": "error", "message": "No job found for this session"}), 404
+
+    stream_seconds = current_app.config.get('PROGRESS_STREAM_SECONDS', 10)
+    retry_ms = int(current_app.config.get('PROGRESS_RETRY_SECONDS', 2) * 1000)
+
+    def stream():
+        yield f"retry: {retry_ms}\n\n"
+        for snapshot in job_manager.watch(job['job_id'], stream_seconds):
+            yield f"event: progress\ndata: {json.dumps(snapshot)}\n\n"
+
+    response = Response(stream_with_context(stream()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # let nginx pass events through unbuffered
+    return response
+
+
 @results_bp.route('/all_results')
 @validate_session  # Ensures session is valid before running the route
 def all_results_section():
@@ -99,44 +148,33 @@ def all_results_section():
         if not session_data:
             return jsonify({"status": "error", "message": "Session data not found"}), 404
 
-        # Read the transition/transversion ratio matrix
-        trans_matrix_path = session_data['transratio_matrix_path']
-        trans_matrix = pd.read_excel(trans_matrix_path, index_col=0)
+        # Read the transition/transversion ratio matrix from the statistics store
+        trans_matrix = transratio_table(session_data['statistics_store_path'])
 
-        # Read matrices from session-specific Excel file
-        nuc_matrix_path = session_data['user_nucleotide_matrix_path']
+        # Substitution matrix of every pair, by from-base and to-base
+        nuc_matrix = nucleotide_matrices_of(session_data['statistics_store_path'])
         
-        # Convert Excel sheets back to original dictionary format
-        nuc_matrix = {}
-        with pd.ExcelFile(nuc_matrix_path) as excel:
-            df = excel.parse("User_Nucleotide Matrices")  # Read the sheet
-            for _, row in df.iterrows():
-                pair = row["Sequence Pair"]
-                nuc_matrix[pair] = {
-                    "A": row["A"],
-                    "T": row["T"],
-                    "G": row["G"],
-                    "C": row["C"]
-                }
-        
-        # Extract Query-to-ID Mapping from user_alignment_file_path
-        query_header_map = []
-        user_alignment_file_path = session_data['user_alignment_file_path']
-        with open(user_alignment_file_path, 'r') as file:
-            lines = file.readlines()
-            capture = False
-            for line in lines:
-                if line.strip() == "Query-to-ID Mapping:":
-                    capture = True
-                    continue
-                if capture and line.strip().startswith("=" * 70):
-                    break
-                if capture and line.strip():
-                    query_header_map.append(line.strip())
+        # Query-to-ID Mapping from the header table of the alignment store
+        with AlignmentStore(session_data['alignment_store_path']) as store:
+            query_header_map = [f"{qid}: {description}".strip() for qid, description in zip(store.ids, store.descriptions)]
 
         
+        # Approximate mode: k-mer identity of every pair, shown like the ratio matrix one
+        # block of APPROXIMATE_VIEW_BLOCK x APPROXIMATE_VIEW_BLOCK cells at a time
+        approx_matrix = approx_ids = None
+        approx_view = {}
+        if session_data['comparison_mode'] == 'approximate':
+            size = current_app.config.get('APPROXIMATE_VIEW_BLOCK', 50)
+            approx_ids, approx_matrix, row, col = approx_identity_block(
+                session_data['approx_identity_store_path'], request.args.get('approx_row', 0, type=int),
+                request.args.get('approx_col', 0, type=int), size)
+            approx_view = {"row": row, "col": col, "size": size, "total": len(approx_ids)}
+
         # Pass the matrices to the template
-        return render_template('partials/all_results.html', trans_matrix=trans_matrix, nuc_matrix=nuc_matrix, query_header_map=query_header_map)
+        return render_template('partials/all_results.html', trans_matrix=trans_matrix, nuc_matrix=nuc_matrix, query_header_map=query_header_map,
+                               approx_matrix=approx_matrix, approx_ids=approx_ids, approx_view=approx_view,
+                               identity_threshold=session_data['identity_threshold'],
+                               reference_id=session_data['reference_id'] if session_data['comparison_mode'] == 'reference' else None)
 
     except Exception as e:
         logger.error(f"An error occurred: {e}", exc_info=True)
@@ -194,6 +232,9 @@ def alignment_section():
             if not customquery or not customsubject:
                 #print("Query or subject missing")  # Debug statement
                 return jsonify({"error": "Both query and subject should be provided"}), 400
+            # Normalize the input once, so lookups and cached views do not depend on how the ids were typed
+            customquery = customquery.lower().replace(" ", "")
+            customsubject = customsubject.lower().replace(" ", "")
             if customquery == customsubject:
                 #print("Query and subject are the same")  # Debug statement
                 return jsonify({"error": "Query and subject should not be the same"}), 400
@@ -214,42 +255,133 @@ def alignment_section():
                 #print("Session data not found")  # Debug statement
                 return jsonify({"status": "error", "message": "Session data not found"}), 404
 
-            # Read the processed file
-            processed_file_path = session_data['processed_file_path']
-            #print("Processed file path:", processed_file_path)  # Debug statement
-            
-            with open(processed_file_path, 'r') as f:
-                processed_content = f.read()
-            #print("Processed file content read successfully")  # Debug statement
-
-            # Extract the alignment pair
-            alignment_pair = extract_alignment_pair(processed_content, customquery, customsubject)
+            # Compact responses carry the rows and packed column classes for the browser
+            # to colour instead of the colour-coded HTML
+            response_format = data.get("format") or "html"
+            if response_format not in ("html", "compact"):
+                return jsonify({"error": "format should be html or compact"}), 400
+
+            # Windowed view: columns [start, start + columns) of the pair, whole-alignment
+            # stats with the first window only, as the viewer keeps them
+            start, end = 0, None
+            if data.get("columns") is not None:
+                try:
+                    start, columns = int(data.get("start") or 0), int(data["columns"])
+                except (TypeError, ValueError):
+                    return jsonify({"error": "start and columns should be whole numbers"}), 400
+                if start < 0 or columns <= 0:
+                    return jsonify({"error": "start should be at least 0 and columns at least 1"}), 400
+                # Windows start on a wrapped line and span whole lines
+                start -= start % COLOUR_LINE_LENGTH
+                columns = min(-(-columns // COLOUR_LINE_LENGTH) * COLOUR_LINE_LENGTH,
+                              current_app.config["ALIGNMENT_VIEW_MAX_COLUMNS"])
+                end = start + columns
+
+            # Repeat views are served from the session's cache; the store version in the
+            # key retires responses once the alignments change
+            view_cache = current_app.alignment_view_cache
+            cache_key = (store_version(session_data['alignment_store_path']), customquery, customsubject,
+                         response_format, start, end)
+            body = view_cache.get(session_id, cache_key)
+            if body is not None:
+                return current_app.response_class(body, mimetype="application/json"), 200
+
+            # Extract the window of the pair, its column classes and stats from the alignment store
+            view = extract_alignment_view(session_data['alignment_store_path'], customquery, customsubject, start, end)
             #print("Alignment pair extracted:", alignment_pair)  # Debug statement
-            
-            if not alignment_pair:
+
+            if not view:
                 #print("Alignment pair not found")  # Debug statement
+                if session_data['comparison_mode'] == 'approximate':
+                    return jsonify({"error": "This pair is below the identity threshold and was not aligned; align it from the Results tab"}), 404
+                if session_data['comparison_mode'] == 'reference':
+                    return jsonify({"error": f"Only pairs with the reference {session_data['reference_id']} are aligned"}), 404
                 return jsonify({"error": "Alignment pair not found"}), 404
-
-            # Perform colour coding and generate statistics
-            colour_coded_alignment, stats = colour_code_alignment(alignment_pair,customquery,customsubject)
-            #print("Colour-coded alignment generated")  # Debug statement
-            #print("Stats generated:", stats)  # Debug statement
+            window, classes, stats = view
 
             # Prepare the response
             response = {
                 "message": "Data received in the backend",
                 "query": customquery,
-                "subject": customsubject,
-                "colour_coded_alignment": colour_coded_alignment,
-                "stats": stats
+                "subject": customsubject
             }
+            if end is not None or response_format == "compact":
+                response.update(start=start, end=min(end if end is not None else window[2], window[2]), length=window[2])
+            if response_format == "compact":
+                response.update(colour_code_compact(window, classes))
+            else:
+                response["colour_coded_alignment"] = colour_code_window(window, customquery, customsubject, classes)
+            if stats is not None:
+                response["stats"] = stats
             #print("Response prepared:", response)  # Debug statement
-            return jsonify(response), 200
+            response = jsonify(response)
+            view_cache.put(session_id, cache_key, response.get_data())
+            return response, 200
 
         except Exception as e:
             logger.error(f"An error occurred: {e}", exc_info=True)
             return jsonify({"error": str(e)}), 500
 
+@results_bp.route('/alignment/cache_stats', methods=['GET'])
+@validate_session  # Ensures session is valid before running the route
+def alignment_cache_stats():
+    """Counters and hit ratio of this worker's alignment view cache, for monitoring."""
+    return jsonify(current_app.alignment_view_cache.stats()), 200
+
+@results_bp.route('/results/align_pairs', methods=['POST'])
+@validate_session  # Ensures session is valid before running the route
+def align_selected_pairs():
+    """
+    Align user-selected pairs of an approximate-mode session in a background
+    job, followed like the pipeline job. Body: {"pairs": [[query, subject], ...]}.
+    """
+    try:
+        session_id = request.cookies.get('session_id')  #  Read from cookie
+
+        session_data = current_app.session_manager.get_session_individual_details(session_id)
+        if not session_data:
+            return jsonify({"status": "error", "message": "Session data not found"}), 404
+        if session_data['comparison_mode'] != 'approximate':
+            return jsonify({"status": "error", "message": "Every pair of a full comparison is already aligned"}), 400
+
+        latest_job = current_app.job_manager.get_latest_job(session_id)
+        if latest_job and latest_job['status'] in current_app.job_manager.ACTIVE:
+            return jsonify({"status": "error", "message": "The current analysis is still running, please wait for it to finish"}), 409
+
+        data = request.get_json(silent=True) or {}
+        valid_ids = {f"query{i+1:03d}" for i in range(session_data['num_sequences'])}
+        pairs = []
+        for pair in data.get("pairs", []):
+            if len(pair) != 2 or pair[0] == pair[1] or not set(pair) <= valid_ids:
+                return jsonify({"status": "error", "message": f"Invalid pair: {pair}"}), 400
+            # Same orientation as the pipeline: lower query number first
+            pairs.append(tuple(sorted(pair, key=lambda qid: int(qid[len("query"):]))))
+        if not pairs:
+            return jsonify({"status": "error", "message": "Select at least one pair to align"}), 400
+
+        job_id = current_app.job_manager.submit(
+            session_id, _align_pairs_job, session_id, pairs,
+            workers=current_app.config.get('ALIGNMENT_WORKERS', 1),
+            executor=current_app.config.get('ALIGNMENT_EXECUTOR', 'thread'),
+            cache=current_app.alignment_cache)
+
+        return jsonify({
+            "status": "success",
+            "message": f"Aligning {len(pairs)} selected pairs",
+            "job_id": job_id,
+            "redirect_url": url_for('results.align_fasta')
+        }), 200
+
+    except Exception as e:
+        logger.error(f"An error occurred: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+def _align_pairs_job(session_id, pairs, **kwargs):
+    """Background part of align_selected_pairs."""
+    # Results shared with identical submissions are copied before they change
+    session_data = current_app.session_manager.detach_session_results(session_id)
+    return run_selected_pairs(session_data, pairs, **kwargs)
+
 @results_bp.route('/summary_dashboard')
 @validate_session # Ensures session is valid beofre running the route
 def summary_dashboard_section():
@@ -268,13 +400,8 @@ def summary_dashboard_section():
         if not session_data:
             return jsonify({"status": "error", "message": "Session data not found"}), 404
 
-        # read the summary_features_excel
-        summary_features_path = session_data['summary_features_path']
-        summary_features_matrix = pd.read_excel(summary_features_path)
-        
-        #read the summary_alignment_excel
-        summary_alignment_path = session_data['summary_alignment_path']
-        summary_alignment_matrix = pd.read_excel(summary_alignment_path)
+        # Read the summary feature and alignment tables from the statistics store
+        summary_features_matrix, summary_alignment_matrix = summary_tables(session_data['statistics_store_path'])
     
     # Pass the matrices to the template
         return render_template('partials/summary_dashboard.html', features_matrix=summary_features_matrix, alignment_matrix=summary_alignment_matrix)
@@ -313,19 +440,26 @@ def run_details_section():
             "gap_extend": session_data['gap_extend'],
             "matrix": "EDNAFULL",  # Hardcoded 
             "sequence_type": "DNA",  # Hardcoded 
-            "output_format": "FASTA"  # Hardcoded 
+            "output_format": "FASTA",  # Hardcoded 
+            "comparison_mode": session_data['comparison_mode'],
+            "identity_threshold": session_data['identity_threshold'],
+            "reference_id": session_data['reference_id']
         }
+        alignment_params["pairs_aligned"], alignment_params["pairs_all"] = pair_counts(session_data)
         
 
         
         # Prepare file URLs for download
         files = {
             'nucleotide_matrix': url_for('results.download_file',  filename='nucleotide.xlsx'),
+            'nucleotide_long': url_for('results.download_file',  filename='nucleotide_long.xlsx'),
             'transratio_matrix': url_for('results.download_file',  filename='transratio.xlsx'),
             'user_alignment': url_for('results.download_file',  filename='user_alignment.fasta'),
             'summary_features':  url_for('results.download_file',  filename='summary_features.xlsx'),
             'summary_alignment':  url_for('results.download_file',  filename='summary_alignment.xlsx')
         }
+        if session_data['comparison_mode'] == 'approximate':
+            files['approx_identity'] = url_for('results.download_file',  filename='approx_identity.xlsx')
 
         return render_template('partials/run_details.html', files=files, alignment_params=alignment_params)
 
@@ -351,18 +485,29 @@ def download_file(filename):
         return jsonify({"status": "error", "message": "Session data not found"}), 404
 
 
-    # Retrieve the correct file path from session_data
-    file_path_map = {
-        "nucleotide.xlsx": session_data['nucleotide_matrix_path'],
-        "transratio.xlsx": session_data['transratio_matrix_path'],
-        "user_alignment.fasta": session_data['user_alignment_file_path'],
-        "summary_features.xlsx" : session_data['summary_features_path'],
-        "summary_alignment.xlsx" : session_data['summary_alignment_path']
-    }
+    # FASTA downloads are generated from the alignment store as they are sent
+    if filename == "user_alignment.fasta":
+        store_path = session_data['alignment_store_path']
+        if not store_path or not os.path.isdir(store_path):
+            return jsonify({"status": "error", "message": "File not found"}), 404
 
-    file_path = file_path_map.get(filename)
-    if not file_path or not os.path.exists(file_path):
-        return jsonify({"status": "error", "message": "File not found"}), 404
+        def generate():
+            with AlignmentStore(store_path) as store:
+                yield from store.user_alignment_text()
 
-    # Send the file for download
-    return send_file(file_path, as_attachment=True)
+        return Response(stream_with_context(generate()), mimetype="text/plain",
+                        headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+    # Workbooks are exported from the result stores on the first download
+    if filename in RESULT_EXPORT_PATHS:
+        try:
+            file_path = result_export(session_data, filename)
+        except BlockingIOError:
+            return jsonify({"status": "error", "message": "The results are still being computed. Please try again shortly."}), 409
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 500
+        if not file_path:
+            return jsonify({"status": "error", "message": "File not found"}), 404
+        return send_file(file_path, as_attachment=True)
+
+    return jsonify({"status": "error", "message": "File not found"}), 404
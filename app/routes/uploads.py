@@ -25,7 +25,6 @@ from Bio import SeqIO
 import os
 import itertools
 import pandas as pd
-import psa
 import numpy as np
 import re
 from flask import current_app
@@ -38,6 +37,11 @@ from flask import Blueprint
 from app.routes import session_manager  # Import from routes, NOT models
 from app.utils.file_handlers import  contains_executable_code, is_valid_fasta
 from app.utils.validators import validate_session
+from app.utils.alignment_cost import select_program, estimate_run_cost
+from app.utils.pipeline import run_append, submission_fingerprint, SKETCHES_NAME
+from app.utils.kmer_sketch import sketch_sequences, save_sketches, sampled_pairs_above
+from datetime import datetime
+from app.utils.linear_aligner import estimate_band
 
 uploads_bp = Blueprint('uploads', __name__)
 
@@ -58,7 +62,6 @@ def upload_file():
         upload_dir = os.path.join(current_app.config['UPLOADS_FOLDER'], session_id)
         results_dir = os.path.join(current_app.config['RESULTS_FOLDER'], session_id)
         os.makedirs(upload_dir, exist_ok=True)
-        os.makedirs(results_dir, exist_ok=True)
 
         # Check if either file or text input is provided
         has_file = 'file' in request.files and request.files['file'].filename != ''
@@ -109,23 +112,11 @@ def upload_file():
                 validate_uploaded_file(file_path, filename, file_bytes)
 
             # Process the FASTA file
-            with open(file_path, 'r') as fasta_file:
-                records = list(SeqIO.parse(fasta_file, 'fasta'))
-                
-                if not records:
-                    raise ValueError("Input is empty or not a valid nucleotide FASTA format.")
-                
-                # Check for at least two sequences
-                if len(records) < 2:
-                    raise ValueError("At least two sequences are required for comparison.")
-                
-                
-                # Validate sequences
-                allowed_bases = "ATCGNRYKMSWBDHVU"
-                for record in records:
-                    sequence = str(record.seq).upper()
-                    if re.search(f"[^{allowed_bases}]", sequence):
-                        raise ValueError("Invalid characters in FASTA sequence")
+            records = read_validated_records(file_path)
+
+            # Check for at least two sequences
+            if len(records) < 2:
+                raise ValueError("At least two sequences are required for comparison.")
 
             num_sequences = len(records)
             max_sequence_length = max(len(record.seq) for record in records)
@@ -138,30 +129,86 @@ def upload_file():
             if gap_open < 1 or gap_extend < 0:
                 raise ValueError("Gap Open must be >= 1, Gap Extend must be >= 0")
 
-            # Program selection logic
-            needle_length_limit = 3000
-            stretcher_length_limit = 10000
-            
-            if psa_program == 'needle' and max_sequence_length > needle_length_limit:
-                psa_program = 'stretcher'
-                if gap_open < 1 or gap_extend < 1:
-                    gap_open = float(16)
-                    gap_extend = float(4)
-                if gap_open % 1 != 0 or gap_extend % 1 != 0:
-                    raise ValueError("Gap Open and Gap extend must be whole numbers")
+            if psa_program not in ('needle', 'stretcher', 'native', 'linear'):
+                raise ValueError("Unknown PSA program")
+
+            # Approximate mode sketches every sequence now and aligns only the similar pairs;
+            # reference mode aligns every other record against one reference record
+            comparison_mode = request.form.get('comparisonMode', 'full')
+            if comparison_mode not in ('full', 'approximate', 'reference'):
+                raise ValueError("Unknown comparison mode")
+            identity_threshold = None
+            reference_id = None
+            comparison_pairs = None
+            pair_scale = 1.0
+            if comparison_mode == 'reference':
+                reference_record = request.form.get('referenceRecord', '').strip()
+                reference_index = 0
+                if reference_record:
+                    matches = [i for i, record in enumerate(records) if record.id == reference_record]
+                    if not matches:
+                        raise ValueError(f"Reference record '{reference_record}' not found in the input")
+                    reference_index = matches[0]
+                reference_id = f"query{reference_index+1:03d}"
+                comparison_pairs = [(reference_index, i) for i in range(num_sequences) if i != reference_index]
+                logger.info(f"Reference mode: {records[reference_index].id} ({reference_id}) against "
+                            f"{num_sequences - 1} sequences")
+            elif comparison_mode == 'approximate':
+                identity_threshold = float(request.form.get(
+                    'identityThreshold', current_app.config.get('APPROXIMATE_IDENTITY_THRESHOLD', 95)))
+                if not 0 <= identity_threshold <= 100:
+                    raise ValueError("Identity threshold must be between 0 and 100")
+                # The identity matrix itself is computed once, by the pipeline job; the cost
+                # model only needs the pairs estimated from a sample of the sequences
+                sketches = sketch_sequences([record.seq for record in records])
+                comparison_pairs, pair_scale = sampled_pairs_above(sketches, identity_threshold)
+                logger.info(f"Approximate mode: about {len(comparison_pairs) * pair_scale:.0f} of "
+                            f"{num_sequences * (num_sequences - 1) // 2} pairs at or above {identity_threshold}% "
+                            f"k-mer identity")
+
+            # Program selection from the memory/time cost model
+            sequence_lengths = [len(record.seq) for record in records]
+            longest = sorted(records, key=len)[-2:]
+            band_width = None
+            band = estimate_band(str(longest[0].seq), str(longest[-1].seq))
+            if band is not None:
+                band_width = band[1] - band[0] + 1
+            requested_program = psa_program
+            psa_program, peak_bytes, run_seconds = select_program(
+                requested_program, sequence_lengths,
+                current_app.config.get('ALIGNMENT_MEMORY_LIMIT_MB', 75),
+                current_app.config.get('ALIGNMENT_TIME_LIMIT_SECONDS', 1500),
+                band_width=band_width,
+                workers=current_app.config.get('ALIGNMENT_WORKERS', 1),
+                pairs=comparison_pairs, scale=pair_scale)
+            logger.info(f"Selected {psa_program} (requested {requested_program}) for {num_sequences} sequences, "
+                        f"longest {max_sequence_length} bases: ~{peak_bytes / 1024 / 1024:.1f} MB, ~{run_seconds:.0f}s")
 
             if psa_program == 'stretcher':
+                if requested_program != 'stretcher' and (gap_open < 1 or gap_extend < 1):
+                    gap_open = float(16)
+                    gap_extend = float(4)
                 if gap_open < 1 or gap_extend < 1:
                     raise ValueError("Gap Open and Gap extend must be >= 1")
                 if gap_open % 1 != 0 or gap_extend % 1 != 0:
                     raise ValueError("Gap Open and Gap extend must be whole numbers")
 
-            if max_sequence_length > stretcher_length_limit:
-                raise ValueError(
-                    f"The longest sequence ({max_sequence_length} bases) exceeds the maximum allowed limit of {stretcher_length_limit} bases. "
-                    "Please upload a file with shorter sequences.")
+            # Myers-Miller splits gaps at the midpoint, which assumes open >= extend
+            if psa_program == 'linear' and gap_open < gap_extend:
+                raise ValueError("Gap Open must be >= Gap Extend for long sequences")
+
+            # Identical submissions share one results bundle, computed once
+            fingerprint = None
+            if current_app.config.get('SHARE_IDENTICAL_RESULTS', True):
+                fingerprint = submission_fingerprint(file_path, psa_program, gap_open, gap_extend,
+                                                     comparison_mode, identity_threshold, reference_id)
+                results_dir = os.path.join(current_app.config['SHARED_RESULTS_FOLDER'], fingerprint)
 
-            # Define output paths
+            # Define output paths. The pipeline keeps the alignments and their statistics in
+            # binary stores; the FASTA and workbook paths name the forms generated from them
+            # for download
+            alignment_store_path = os.path.join(results_dir, 'alignment_store')
+            statistics_store_path = os.path.join(results_dir, 'statistics_store')
             alignment_file_path = os.path.join(results_dir, 'alignment.fasta')
             user_alignment_file_path = os.path.join(results_dir, 'user_alignment.fasta')
             processed_file_path = os.path.join(results_dir, 'alignment_processed.fasta')
@@ -170,17 +217,35 @@ def upload_file():
             transratio_matrix_path = os.path.join(results_dir, 'transratio.xlsx')
             summary_features_path = os.path.join(results_dir, 'summary_features.xlsx')
             summary_alignment_path = os.path.join(results_dir, 'summary_alignment.xlsx')
+            approx_identity_path = approx_identity_store_path = None
+            if comparison_mode == 'approximate':
+                approx_identity_path = os.path.join(results_dir, 'approx_identity.xlsx')
+                approx_identity_store_path = os.path.join(results_dir, 'approx_identity.npz')
 
-            cleanup_needed = False
-            
-            # Insert session data
+            # Insert session data. This takes the reference to a shared bundle, so it
+            # comes before anything is written into the bundle: a session releasing
+            # the bundle meanwhile can no longer delete it
             session_manager.insert_session_data(
                 session_id, file_path, psa_program, gap_open, gap_extend, num_sequences,
                 alignment_file_path, user_alignment_file_path, processed_file_path,
                 nucleotide_matrix_path, user_nucleotide_matrix_path, transratio_matrix_path, 
-                summary_features_path, summary_alignment_path
+                summary_features_path, summary_alignment_path,
+                comparison_mode=comparison_mode, identity_threshold=identity_threshold,
+                approx_identity_path=approx_identity_path, reference_id=reference_id,
+                fingerprint=fingerprint, alignment_store_path=alignment_store_path,
+                statistics_store_path=statistics_store_path, approx_identity_store_path=approx_identity_store_path
             )
 
+            os.makedirs(results_dir, exist_ok=True)
+            sketches_path = os.path.join(results_dir, SKETCHES_NAME)
+            if comparison_mode == 'approximate' and not os.path.exists(sketches_path):
+                # Written aside and moved in, a session sharing the bundle never reads half a file
+                tmp_path = os.path.join(results_dir, f"{session_id}.{SKETCHES_NAME}")
+                save_sketches(tmp_path, [f"query{i+1:03d}" for i in range(num_sequences)], sketches)
+                os.replace(tmp_path, sketches_path)
+
+            cleanup_needed = False
+
             return jsonify({
                 "status": "success",
                 "message": "Input processed successfully",
@@ -202,6 +267,118 @@ def upload_file():
         logger.error(f"Pre-file handling error: {e}", exc_info=True)
         return jsonify({"status": "error", "message": "Server error occurred"}), 500
 
+@uploads_bp.route('/uploads/append', methods=['POST'])
+@validate_session
+def append_sequences():
+    """
+    Append sequences to the session's analysis. Only the pairs involving the
+    new sequences are aligned; their statistics are merged into the existing
+    results by a background job, followed like any pipeline job.
+    """
+    file_path = None
+    try:
+        session_id = request.cookies.get('session_id')
+        session_manager = current_app.session_manager
+
+        session_data = session_manager.get_session_individual_details(session_id)
+        if not session_data:
+            return jsonify({"status": "error", "message": "Upload sequences before appending to them"}), 404
+
+        latest_job = current_app.job_manager.get_latest_job(session_id)
+        if latest_job and latest_job['status'] in current_app.job_manager.ACTIVE:
+            return jsonify({"status": "error", "message": "The current analysis is still running, please wait for it to finish"}), 409
+
+        if session_data['comparison_mode'] == 'approximate':
+            return jsonify({"status": "error", "message": "Sequences can only be appended to full or reference comparisons"}), 400
+
+        has_file = 'file' in request.files and request.files['file'].filename != ''
+        has_text = 'fasta_text' in request.form and request.form['fasta_text'].strip() != ''
+        if has_file == has_text:
+            return jsonify({"status": "error", "message": "Please provide either a file or pasted sequences to append"}), 400
+
+        upload_dir = os.path.join(current_app.config['UPLOADS_FOLDER'], session_id)
+        file_path = os.path.join(upload_dir, f"append_{datetime.now():%Y%m%d%H%M%S%f}.fasta")
+        if has_file:
+            filename = secure_filename(request.files['file'].filename)
+            request.files['file'].save(file_path)
+        else:
+            filename = "pasted_sequences.fasta"
+            with open(file_path, 'w') as f:
+                f.write(request.form['fasta_text'])
+        with open(file_path, 'rb') as f:
+            file_bytes = f.read(2048)
+        validate_uploaded_file(file_path, filename, file_bytes)
+        new_records = read_validated_records(file_path)
+
+        # Only the new x old and new x new pairs (reference x new) count against the budgets
+        with open(session_data['upload_file_path'], 'r') as fasta_file:
+            old_lengths = [len(record.seq) for record in SeqIO.parse(fasta_file, 'fasta')]
+        all_lengths = old_lengths + [len(record.seq) for record in new_records]
+        psa_program = session_data['psa_program']
+        workers = current_app.config.get('ALIGNMENT_WORKERS', 1)
+        if session_data['comparison_mode'] == 'reference':
+            reference_index = int(session_data['reference_id'][len("query"):]) - 1
+            new_pairs = [(reference_index, i) for i in range(len(old_lengths), len(all_lengths))]
+            peak_bytes, new_seconds = estimate_run_cost(psa_program, all_lengths, workers=workers, pairs=new_pairs)
+            num_new_pairs = len(new_pairs)
+        else:
+            peak_bytes, all_seconds = estimate_run_cost(psa_program, all_lengths, workers=workers)
+            _, old_seconds = estimate_run_cost(psa_program, old_lengths, workers=workers)
+            new_seconds = all_seconds - old_seconds
+            num_new_pairs = len(new_records) * len(old_lengths) + len(new_records) * (len(new_records) - 1) // 2
+        if (peak_bytes > current_app.config.get('ALIGNMENT_MEMORY_LIMIT_MB', 75) * 1024 * 1024
+                or new_seconds > current_app.config.get('ALIGNMENT_TIME_LIMIT_SECONDS', 1500)):
+            raise ValueError(f"The appended sequences are too large for {psa_program}. Please start a new analysis.")
+
+        job_id = current_app.job_manager.submit(
+            session_id, _append_job, session_id, file_path,
+            workers=workers,
+            executor=current_app.config.get('ALIGNMENT_EXECUTOR', 'thread'),
+            cache=current_app.alignment_cache)
+
+        return jsonify({
+            "status": "success",
+            "message": f"Appending {len(new_records)} sequences ({num_new_pairs} new pairs)",
+            "job_id": job_id,
+            "redirect_url": url_for('results.align_fasta')
+        }), 200
+
+    except ValueError as e:
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        logger.error(f"An error occurred: {e}", exc_info=True)
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+def _append_job(session_id, new_fasta_path, progress=None, **kwargs):
+    """Background part of append_sequences."""
+    try:
+        # Results shared with identical submissions are copied before they change
+        session_data = current_app.session_manager.detach_session_results(session_id)
+        num_sequences = run_append(session_data, new_fasta_path, progress=progress, **kwargs)
+        current_app.session_manager.update_num_sequences(session_id, num_sequences)
+    finally:
+        os.remove(new_fasta_path)
+
+def read_validated_records(file_path):
+    """Parse a nucleotide FASTA file and check its characters."""
+    with open(file_path, 'r') as fasta_file:
+        records = list(SeqIO.parse(fasta_file, 'fasta'))
+
+    if not records:
+        raise ValueError("Input is empty or not a valid nucleotide FASTA format.")
+
+    # Validate sequences
+    allowed_bases = "ATCGNRYKMSWBDHVU"
+    for record in records:
+        sequence = str(record.seq).upper()
+        if re.search(f"[^{allowed_bases}]", sequence):
+            raise ValueError("Invalid characters in FASTA sequence")
+    return records
+
 def validate_uploaded_file(file_path, filename, file_bytes=None):
     """Common validation for both uploaded files and text-generated files"""
     # Check file size
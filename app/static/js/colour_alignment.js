@@ -7,6 +7,19 @@
  */
 
 
+// Columns fetched per request of the colour-coded alignment, and how far
+// below the viewport the next window starts loading
+const ALIGNMENT_WINDOW_COLUMNS = 1000;
+const ALIGNMENT_PRELOAD_PIXELS = 600;
+
+// CSS class of each column class of the compact response (COLOUR_CSS in
+// file_handlers.py) and the columns per wrapped line
+const COLOUR_CSS = ["aln-id", "aln-ts", "aln-tv", "aln-gap", "aln-n"];
+const COLOUR_LINE_LENGTH = 50;
+
+// The alignment being shown; a new request replaces it
+let alignmentView = null;
+
 document.addEventListener("DOMContentLoaded", function () {
   //DEBUG //console.log("colour_alignment.js loaded");
   attachEventListeners(); // Attach event listeners initially
@@ -51,10 +64,45 @@ function updateQueryrequest(event) {
     return;
   }
 
-  const customalignmentrequest = {
+  // Drop the alignment shown so far, including windows still loading
+  if (alignmentView && alignmentView.observer) {
+    alignmentView.observer.disconnect();
+  }
+  const sentinel = document.getElementById("colour_coded_alignment_end");
+  if (sentinel) {
+    sentinel.remove();
+  }
+  const container = document.getElementById("colour_coded_alignment");
+  container.innerHTML = "";
+
+  alignmentView = {
+    container: container,
     queryrequest: customqueryrequest,
     subjectrequest: customsubjectrequest,
-    session_id: sessionId
+    session_id: sessionId,
+    csrf_token: csrf_token,
+    next: 0,
+    length: null,
+    loading: false,
+    observer: null
+  };
+  loadAlignmentWindow(alignmentView);
+}
+
+// Fetch the next window of columns of the shown alignment and append it
+function loadAlignmentWindow(view) {
+  if (view.loading || (view.length !== null && view.next >= view.length)) {
+    return;
+  }
+  view.loading = true;
+
+  const customalignmentrequest = {
+    queryrequest: view.queryrequest,
+    subjectrequest: view.subjectrequest,
+    session_id: view.session_id,
+    start: view.next,
+    columns: ALIGNMENT_WINDOW_COLUMNS,
+    format: "compact"
   };
 
   //DEBUG //console.log("Sending request:", customalignmentrequest);
@@ -63,97 +111,231 @@ function updateQueryrequest(event) {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
-      'X-CSRF-TOKEN': csrf_token 
+      'X-CSRF-TOKEN': view.csrf_token
     },
     body: JSON.stringify(customalignmentrequest),
     credentials: 'include'  // Ensures cookies are sent with the request
   })
     .then(response => response.json())
     .then(data => {
-      const resultDiv = document.getElementById("storedquerysubject");
-      resultDiv.style.display = "block"; // Show the result section
-
-      if (data.colour_coded_alignment && data.stats) {
-        
-        document.getElementById("colour_coded_alignment").innerHTML = data.colour_coded_alignment;
-
-        // Populate the stats table
-        const statsTable = document.getElementById("stats_table");
-        statsTable.innerHTML = `
-          <thead>
-            <tr>
-              <th style="border: 1px solid black; padding: 8px;">Category</th>
-              <th style="border: 1px solid black; padding: 8px;">Count</th>
-              <th style="border: 1px solid black; padding: 8px;">Percentage</th>
-            </tr>
-          </thead>
-          <tbody>
-            <tr>
-              <td style="border: 1px solid black; padding: 8px;">Identity</td>
-              <td style="border: 1px solid black; padding: 8px;">${data.stats.identical}</td>
-              <td style="border: 1px solid black; padding: 8px;">${data.stats.identical_percent.toFixed(2)}%</td>
-            </tr>
-            <tr>
-              <td style="border: 1px solid black; padding: 8px;">Transitions</td>
-              <td style="border: 1px solid black; padding: 8px;">${data.stats.transitions}</td>
-              <td style="border: 1px solid black; padding: 8px;">${data.stats.transitions_percent.toFixed(2)}%</td>
-            </tr>
-            <tr>
-              <td style="border: 1px solid black; padding: 8px;">Transversions</td>
-              <td style="border: 1px solid black; padding: 8px;">${data.stats.transversions}</td>
-              <td style="border: 1px solid black; padding: 8px;">${data.stats.transversions_percent.toFixed(2)}%</td>
-            </tr>
-            <tr>
-              <td style="border: 1px solid black; padding: 8px;">Gaps</td>
-              <td style="border: 1px solid black; padding: 8px;">${data.stats.gaps}</td>
-              <td style="border: 1px solid black; padding: 8px;">${data.stats.gaps_percent.toFixed(2)}%</td>
-            </tr>
-            <tr>
-              <td style="border: 1px solid black; padding: 8px;">Ambiguous (N)</td>
-              <td style="border: 1px solid black; padding: 8px;">${data.stats.unknown}</td>
-              <td style="border: 1px solid black; padding: 8px;">${data.stats.unknown_percent.toFixed(2)}%</td>
-            </tr>
-            <tr>
-              <td style="border: 1px solid black; padding: 8px;">Total Length</td>
-              <td style="border: 1px solid black; padding: 8px;">${data.stats.total_length}</td>
-              <td style="border: 1px solid black; padding: 8px;">100%</td>
-            </tr>
-          </tbody>
-        `;
-
-        // Render the pie chart
-        const ctx = document.getElementById('pie_chart').getContext('2d');
-        new Chart(ctx, {
-          type: 'pie',
-          data: {
-            labels: ['Identity', 'Transitions', 'Transversions', 'Gaps','Ambiguous (N)'],
-            datasets: [{
-              data: [
-                data.stats.identical_percent,
-                data.stats.transitions_percent,
-                data.stats.transversions_percent,
-                data.stats.gaps_percent,
-                data.stats.unknown_percent
-              ],
-              backgroundColor: ['#66cc66', 'orange', 'red', 'black', 'grey']
-            }]
-          },
-          options: {
-            responsive: false,
-            plugins: {
-              tooltip: {
-                callbacks: {
-                  label: function (tooltipItem) {
-                    const value = tooltipItem.raw;
-                    return `${tooltipItem.label}: ${value.toFixed(2)}%`;
-                  }
-                }
-              }
+      if (view !== alignmentView || !view.container.isConnected) {
+        return; // Another pair was requested or the tab was left meanwhile
+      }
+      view.loading = false;
+
+      if (data.rows === undefined || data.classes === undefined) {
+        console.error("Missing data properties: Check server response");
+        return;
+      }
+      if (data.stats) {
+        const resultDiv = document.getElementById("storedquerysubject");
+        resultDiv.style.display = "block"; // Show the result section
+        renderAlignmentStats(data.stats);
+      }
+
+      const classes = unpackColourClasses(data.classes, data.class_bits, data.end - data.start);
+      renderColourLines(view.container, view.queryrequest, view.subjectrequest, data.rows, classes);
+      view.next = data.end;
+      view.length = data.length;
+      watchAlignmentEnd(view);
+    })
+    .catch(error => {
+      view.loading = false;
+      console.error("Error:", error);
+    });
+}
+
+// Load the next window once the end of the shown columns comes near the viewport
+function watchAlignmentEnd(view) {
+  if (view.next >= view.length) {
+    if (view.observer) {
+      view.observer.disconnect();
+    }
+    return;
+  }
+  let sentinel = document.getElementById("colour_coded_alignment_end");
+  if (!view.observer) {
+    sentinel = document.createElement("div");
+    sentinel.id = "colour_coded_alignment_end";
+    view.container.insertAdjacentElement("afterend", sentinel);
+    view.observer = new IntersectionObserver(entries => {
+      if (entries.some(entry => entry.isIntersecting)) {
+        loadAlignmentWindow(view);
+      }
+    }, { rootMargin: `${ALIGNMENT_PRELOAD_PIXELS}px` });
+    view.observer.observe(sentinel);
+  }
+  // The observer only reports changes, so a window that did not fill the screen loads the next one here
+  if (sentinel.getBoundingClientRect().top < window.innerHeight + ALIGNMENT_PRELOAD_PIXELS) {
+    loadAlignmentWindow(view);
+  }
+}
+
+// Column classes from the base64 array packing class_bits bits per column, most significant bit first
+function unpackColourClasses(packed, bits, count) {
+  const binary = atob(packed);
+  const bytes = new Uint8Array(binary.length);
+  for (let i = 0; i < binary.length; i++) {
+    bytes[i] = binary.charCodeAt(i);
+  }
+  const classes = new Uint8Array(count);
+  for (let i = 0, bit = 0; i < count; i++) {
+    let value = 0;
+    for (let b = 0; b < bits; b++, bit++) {
+      value = (value << 1) | ((bytes[bit >> 3] >> (7 - (bit & 7))) & 1);
+    }
+    classes[i] = value;
+  }
+  return classes;
+}
+
+// Append the rows wrapped every COLOUR_LINE_LENGTH columns, one span per run of a class
+function renderColourLines(container, query, subject, rows, classes) {
+  const fragment = document.createDocumentFragment();
+  for (let start = 0; start < classes.length; start += COLOUR_LINE_LENGTH) {
+    const end = Math.min(start + COLOUR_LINE_LENGTH, classes.length);
+    appendColourRow(fragment, query, rows[0], classes, start, end);
+    fragment.appendChild(document.createElement("br"));
+    appendColourRow(fragment, subject, rows[1], classes, start, end);
+    fragment.appendChild(document.createElement("br"));
+    fragment.appendChild(document.createElement("br"));
+  }
+  container.appendChild(fragment);
+}
+
+function appendColourRow(parent, label, row, classes, start, end) {
+  parent.appendChild(document.createTextNode(`${label}: `));
+  for (let run = start, i = start + 1; i <= end; i++) {
+    if (i === end || classes[i] !== classes[run]) {
+      const span = document.createElement("span");
+      span.className = COLOUR_CSS[classes[run]];
+      span.textContent = row.slice(run, i);
+      parent.appendChild(span);
+      run = i;
+    }
+  }
+}
+
+// Populate the stats table and pie chart of the whole alignment
+function renderAlignmentStats(stats) {
+  // Populate the stats table
+  const statsTable = document.getElementById("stats_table");
+  statsTable.innerHTML = `
+    <thead>
+      <tr>
+        <th style="border: 1px solid black; padding: 8px;">Category</th>
+        <th style="border: 1px solid black; padding: 8px;">Count</th>
+        <th style="border: 1px solid black; padding: 8px;">Percentage</th>
+      </tr>
+    </thead>
+    <tbody>
+      <tr>
+        <td style="border: 1px solid black; padding: 8px;">Identity</td>
+        <td style="border: 1px solid black; padding: 8px;">${stats.identical}</td>
+        <td style="border: 1px solid black; padding: 8px;">${stats.identical_percent.toFixed(2)}%</td>
+      </tr>
+      <tr>
+        <td style="border: 1px solid black; padding: 8px;">Transitions</td>
+        <td style="border: 1px solid black; padding: 8px;">${stats.transitions}</td>
+        <td style="border: 1px solid black; padding: 8px;">${stats.transitions_percent.toFixed(2)}%</td>
+      </tr>
+      <tr>
+        <td style="border: 1px solid black; padding: 8px;">Transversions</td>
+        <td style="border: 1px solid black; padding: 8px;">${stats.transversions}</td>
+        <td style="border: 1px solid black; padding: 8px;">${stats.transversions_percent.toFixed(2)}%</td>
+      </tr>
+      <tr>
+        <td style="border: 1px solid black; padding: 8px;">Gaps</td>
+        <td style="border: 1px solid black; padding: 8px;">${stats.gaps}</td>
+        <td style="border: 1px solid black; padding: 8px;">${stats.gaps_percent.toFixed(2)}%</td>
+      </tr>
+      <tr>
+        <td style="border: 1px solid black; padding: 8px;">Ambiguous (N)</td>
+        <td style="border: 1px solid black; padding: 8px;">${stats.unknown}</td>
+        <td style="border: 1px solid black; padding: 8px;">${stats.unknown_percent.toFixed(2)}%</td>
+      </tr>
+      <tr>
+        <td style="border: 1px solid black; padding: 8px;">Total Length</td>
+        <td style="border: 1px solid black; padding: 8px;">${stats.total_length}</td>
+        <td style="border: 1px solid black; padding: 8px;">100%</td>
+      </tr>
+    </tbody>
+  `;
+
+  // Render the pie chart
+  const ctx = document.getElementById('pie_chart').getContext('2d');
+  new Chart(ctx, {
+    type: 'pie',
+    data: {
+      labels: ['Identity', 'Transitions', 'Transversions', 'Gaps','Ambiguous (N)'],
+      datasets: [{
+        data: [
+          stats.identical_percent,
+          stats.transitions_percent,
+          stats.transversions_percent,
+          stats.gaps_percent,
+          stats.unknown_percent
+        ],
+        backgroundColor: ['#66cc66', 'orange', 'red', 'black', 'grey']
+      }]
+    },
+    options: {
+      responsive: false,
+      plugins: {
+        tooltip: {
+          callbacks: {
+            label: function (tooltipItem) {
+              const value = tooltipItem.raw;
+              return `${tooltipItem.label}: ${value.toFixed(2)}%`;
             }
           }
-        });
+        }
+      }
+    }
+  });
+}
+
+// Approximate mode: show another block of the identity matrix in place of the results
+function loadApproxBlock(event, url) {
+  event.preventDefault();
+
+  fetch(url, { credentials: 'include' })
+    .then(response => response.text())
+    .then(html => {
+      document.getElementById('content-area').innerHTML = html;
+    })
+    .catch(error => console.error("Error:", error));
+}
+
+// Approximate mode: align a pair below the identity threshold in the background
+function alignSelectedPair(event) {
+  event.preventDefault();
+
+  const csrf_token = document.querySelector('input[name="csrf_token"]').value;
+  const query = document.getElementById('approx-query').value;
+  const subject = document.getElementById('approx-subject').value;
+
+  if (query === subject) {
+    alert("Both QueryId and SubjectId are the same; Select different IDs");
+    return;
+  }
+
+  fetch('/sharmaglab/variantis/results/align_pairs', {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      'X-CSRF-TOKEN': csrf_token
+    },
+    body: JSON.stringify({ pairs: [[query, subject]] }),
+    credentials: 'include'
+  })
+    .then(response => response.json())
+    .then(data => {
+      if (data.status === "success") {
+        // The results page follows the running job and reloads the results
+        window.location.href = data.redirect_url;
       } else {
-        console.error("Missing data properties: Check server response");
+        alert(`Error: ${data.message}`);
       }
     })
     .catch(error => console.error("Error:", error));
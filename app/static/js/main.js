@@ -83,6 +83,9 @@ function showDefaultPopup() {
         formData.append('psaprogram', customparameters_program);
         formData.append('gapOpen', customparameters_gapopen);
         formData.append('gapExtend', customparameters_gapextend);
+        formData.append('comparisonMode', document.getElementById('comparisonmode').value);
+        formData.append('identityThreshold', document.getElementById('identitythreshold').value);
+        formData.append('referenceRecord', document.getElementById('referencerecord').value);
   
         // Send data using fetch
         const response = await fetch('/sharmaglab/variantis/uploads', {
@@ -140,6 +143,9 @@ function showDefaultPopup() {
       formData.append('psaprogram', customparameters_program);
       formData.append('gapOpen', customparameters_gapopen);
       formData.append('gapExtend', customparameters_gapextend);
+      formData.append('comparisonMode', document.getElementById('comparisonmode').value);
+      formData.append('identityThreshold', document.getElementById('identitythreshold').value);
+      formData.append('referenceRecord', document.getElementById('referencerecord').value);
       
       // Send data to server
       try {
@@ -1,6 +1,7 @@
 from app.utils.file_handlers import (
     cleanup_job, contains_executable_code, is_valid_fasta, process_fasta_file,
     perform_alignment, process_alignments_files, calculate_transitions_transversions,
-    count_transitions_transversions, extract_alignment_pair, colour_code_alignment
+    count_transitions_transversions, extract_alignment_pair, colour_code_alignment,
+    extract_alignment_window, extract_alignment_view, colour_code_window
 )
 from app.utils.validators import validate_session, validate_csrf_token
\ No newline at end of file
@@ -0,0 +1,118 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+#utils/alignment_cost.py
+from app.utils.linear_aligner import BLOCK_CELLS
+
+# Rough per-program constants, measured on the production host.
+# Full-matrix programs keep a traceback entry per DP cell.
+BYTES_PER_CELL = {
+    "needle": 8,      # EMBOSS float path matrix + int compass
+    "native": 1,      # uint8 traceback codes
+}
+CELLS_PER_SECOND = {
+    "needle": 1.5e8,
+    "stretcher": 3e7,
+    "native": 8e6,
+}
+STARTUP_SECONDS = {
+    "needle": 0.03,   # bash + EMBOSS start-up per pair
+    "stretcher": 0.03,
+    "native": 0.0,
+    "linear": 0.0,
+}
+BYTES_PER_BASE = 64            # linear-space programs: a few rows of floats
+LINEAR_ROW_SECONDS = 2.5e-4    # Myers-Miller: per-row NumPy overhead over all levels
+LINEAR_CELL_SECONDS = 1e-7     # ... and per banded cell
+
+# Programs tried, in order, when the requested one does not fit the budget
+FALLBACKS = {
+    "needle": ["needle", "stretcher", "linear"],
+    "stretcher": ["stretcher", "linear"],
+    "native": ["native", "linear"],
+    "linear": ["linear"],
+}
+
+
+def estimate_pair_cost(program, qlen, slen, band_width=None):
+    """
+    Estimated (peak_bytes, seconds) of one alignment of a qlen x slen pair.
+    band_width only applies to the linear aligner; None means unbanded.
+    """
+    cells = qlen * slen
+    if program == "linear":
+        width = slen if band_width is None else min(band_width, slen)
+        memory = BYTES_PER_BASE * (qlen + slen) + 5 * BLOCK_CELLS
+        seconds = qlen * (LINEAR_ROW_SECONDS + width * LINEAR_CELL_SECONDS)
+    elif program == "stretcher":
+        memory = BYTES_PER_BASE * (qlen + slen)
+        seconds = cells / CELLS_PER_SECOND[program]
+    else:
+        memory = BYTES_PER_CELL[program] * cells
+        seconds = cells / CELLS_PER_SECOND[program]
+    return memory, seconds + STARTUP_SECONDS[program]
+
+
+def estimate_run_cost(program, lengths, band_width=None, workers=1, pairs=None, scale=1.0):
+    """
+    Estimated (peak_bytes, seconds) of aligning every pair of sequences, or
+    only the given (i, j) index pairs, a sample standing for scale times as
+    many. Memory is the peak of one worker (the largest pair); time is the
+    sum over pairs spread across the workers.
+    """
+    if pairs is not None:
+        costs = [estimate_pair_cost(program, lengths[i], lengths[j], band_width) for i, j in pairs]
+        peak_bytes = max((memory for memory, _ in costs), default=0)
+        seconds = scale * sum(pair_seconds for _, pair_seconds in costs)
+        return peak_bytes, seconds / max(1, min(workers, round(scale * len(costs))))
+
+    n = len(lengths)
+    pairs = n * (n - 1) // 2
+    longest = sorted(lengths)[-2:]
+    peak_bytes, _ = estimate_pair_cost(program, longest[0], longest[-1], band_width)
+
+    # Closed forms for sums over pairs, so thousands of sequences stay cheap
+    total = float(sum(lengths))
+    pair_cells = (total * total - sum(float(x) * x for x in lengths)) / 2
+    pair_rows = (n - 1) * total / 2
+    if program == "linear":
+        width = longest[-1] if band_width is None else band_width
+        seconds = pair_rows * (LINEAR_ROW_SECONDS + width * LINEAR_CELL_SECONDS)
+    else:
+        seconds = pair_cells / CELLS_PER_SECOND[program]
+    seconds += pairs * STARTUP_SECONDS[program]
+
+    workers = max(1, min(workers, pairs))
+    return peak_bytes, seconds / workers
+
+
+def select_program(requested, lengths, memory_limit_mb, time_limit_seconds, band_width=None, workers=1, pairs=None,
+                   scale=1.0):
+    """
+    First program in the fallback chain of `requested` whose estimated run
+    fits both budgets (memory is per alignment worker). Returns (program, peak_bytes, seconds) and raises
+    ValueError when none fits. pairs restricts the run to those index pairs,
+    or to scale times as many when they are a sample.
+    """
+    memory_limit = memory_limit_mb * 1024 * 1024
+    for program in FALLBACKS[requested]:
+        peak_bytes, seconds = estimate_run_cost(program, lengths, band_width, workers, pairs, scale)
+        if peak_bytes <= memory_limit and seconds <= time_limit_seconds:
+            return program, peak_bytes, seconds
+    raise ValueError(
+        f"The submission is too large to align within the server limits "
+        f"(estimated {seconds / 60:.0f} minutes, {peak_bytes / 1024 / 1024:.0f} MB). "
+        "Please upload fewer or shorter sequences.")
@@ -0,0 +1,433 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+#utils/alignment_store.py
+import os
+import re
+import json
+import mmap
+import time
+import numpy as np
+
+# A store is a directory of four files:
+#   rows.bin      aligned query and subject rows of every pair, one byte per column
+#   index.bin     one fixed-width INDEX_DTYPE entry per pair, in alignment order
+#   pairs.bin     N x N int32 table of index positions by (query, subject) number, -1 if unaligned
+#   headers.json  header table: query ids and FASTA descriptions, by query number, and the
+#                 number of pairs; written last, so it says which pairs of the index are complete
+# and, when written with a class table, two more:
+#   classes.bin   class of every column of every pair, one byte per column at half the pair's offset
+#   counts.bin    int64 count of each class per pair, in index order
+ROWS_NAME = "rows.bin"
+INDEX_NAME = "index.bin"
+PAIRS_NAME = "pairs.bin"
+HEADERS_NAME = "headers.json"
+CLASSES_NAME = "classes.bin"
+COUNTS_NAME = "counts.bin"
+
+INDEX_DTYPE = np.dtype([
+    ("query", "<u4"), ("subject", "<u4"),    # positions in the header table
+    ("offset", "<u8"), ("length", "<u4"),    # query row at offset, subject row right after it
+    ("qstart", "<i4"), ("qend", "<i4"), ("sstart", "<i4"), ("send", "<i4"),
+])
+
+_DESCRIPTION = re.compile(r"^(\S+) (-?\d+)-(-?\d+)$")
+
+DELIMITER = "=" * 70
+
+# Reads of a header table that does not match the pair table, while a writer replaces both
+HEADERS_RETRIES = 5
+HEADERS_RETRY_DELAY = 0.05
+
+
+class AlignmentStoreWriter:
+    """
+    Writes aligned pairs to a store, as records [(description, row), ...]
+    from write_alignment_blocks. With append=True the pairs are added after
+    the existing ones and the header table is replaced by ids/descriptions.
+    With a class_table (256 x 256 lookup of a class number by the ASCII
+    codes of a column) the class of every column and the class counts of
+    every pair are written as well.
+    A new store is written to temporary files that replace the old ones on
+    close, so readers that have the old files mapped keep reading them.
+    Appended index entries are held aside until close as well, and the
+    header table is written last: readers see the pairs already there until
+    the new ones are complete.
+    """
+
+    def __init__(self, path, ids, descriptions, append=False, class_table=None):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self._append = append
+        self._rows = self._open(ROWS_NAME)
+        self._index = self._open(INDEX_NAME, aside=True)
+        self._offset = self._rows.seek(0, os.SEEK_END)
+        self._size = len(ids)
+        self._numbers = {qid.lower(): number for number, qid in enumerate(ids)}
+
+        self._class_table = class_table
+        self._classes = self._counts = None
+        self._num_classes = None
+        if class_table is not None:
+            self._num_classes = int(class_table.max()) + 1
+            # Appending to a store without classes of its earlier pairs drops them instead
+            if append and not classes_complete(path, self._offset, self._num_classes):
+                self._class_table = None
+                remove_classes(path)
+            else:
+                self._classes = self._open(CLASSES_NAME)
+                self._counts = self._open(COUNTS_NAME)
+
+        self._headers = {"ids": list(ids), "descriptions": list(descriptions),
+                         "classes": self._num_classes if self._class_table is not None else None}
+        # Where the appended files end before this writer, to cut them back to on discard
+        self._ends = {f: f.tell() for f in self._files() if f is not self._index} if append else {}
+
+    def _open(self, name, aside=False):
+        if self._append and not aside:
+            return open(os.path.join(self.path, name), 'ab')
+        return open(os.path.join(self.path, f"{name}.tmp"), 'wb')
+
+    def add(self, records):
+        if len(records) != 2:
+            raise ValueError(f"Expected an aligned pair, got {len(records)} records")
+        (qdescription, qrow), (sdescription, srow) = records
+        if len(qrow) != len(srow):
+            raise ValueError(f"Aligned rows of different lengths: {qdescription}, {sdescription}")
+        query, qstart, qend = self._parse(qdescription)
+        subject, sstart, send = self._parse(sdescription)
+
+        qcodes, scodes = qrow.encode('ascii'), srow.encode('ascii')
+        self._rows.write(qcodes)
+        self._rows.write(scodes)
+        if self._class_table is not None:
+            classes = self._class_table[np.frombuffer(qcodes, dtype=np.uint8), np.frombuffer(scodes, dtype=np.uint8)]
+            self._classes.write(classes.tobytes())
+            self._counts.write(np.bincount(classes, minlength=self._num_classes).astype("<i8").tobytes())
+        entry = np.array([(query, subject, self._offset, len(qrow), qstart, qend, sstart, send)], dtype=INDEX_DTYPE)
+        self._index.write(entry.tobytes())
+        self._offset += 2 * len(qrow)
+
+    def tee(self, blocks):
+        """Write every block of records and pass it on."""
+        for records in blocks:
+            self.add(records)
+            yield records
+
+    def _parse(self, description):
+        match = _DESCRIPTION.match(description)
+        if not match or match.group(1).lower() not in self._numbers:
+            raise ValueError(f"Unexpected alignment header: {description}")
+        return self._numbers[match.group(1).lower()], int(match.group(2)), int(match.group(3))
+
+    def _files(self):
+        return [f for f in (self._rows, self._index, self._classes, self._counts) if f is not None]
+
+    def close(self):
+        for f in self._files():
+            f.close()
+        if self._append:
+            with open(self._index.name, 'rb') as entries, open(os.path.join(self.path, INDEX_NAME), 'ab') as f:
+                f.write(entries.read())
+            os.remove(self._index.name)
+        else:
+            for name in (ROWS_NAME, CLASSES_NAME, COUNTS_NAME, INDEX_NAME):
+                if os.path.exists(os.path.join(self.path, f"{name}.tmp")):
+                    os.replace(os.path.join(self.path, f"{name}.tmp"), os.path.join(self.path, name))
+        self._headers["pairs"] = self._write_pairs()
+        self._write_headers()
+        if self._classes is None and not self._append:
+            remove_classes(self.path)
+
+    def _write_headers(self):
+        tmp_path = os.path.join(self.path, f"{HEADERS_NAME}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(self._headers, f)
+        os.replace(tmp_path, os.path.join(self.path, HEADERS_NAME))
+
+    def discard(self):
+        """Close without writing the pairs, which keeps the store as it was."""
+        for f in self._files():
+            f.close()
+            if f in self._ends:
+                os.truncate(f.name, self._ends[f])
+            else:
+                os.remove(f.name)
+
+    def _write_pairs(self):
+        """
+        Rebuild the pair table from the whole index, so appended pairs are
+        included. Returns the number of pairs.
+        """
+        index = np.fromfile(os.path.join(self.path, INDEX_NAME), dtype=INDEX_DTYPE)
+        pairs = np.full((self._size, self._size), -1, dtype="<i4")
+        # Written in reverse so the first alignment of a pair wins, as in a scan
+        positions = np.arange(len(index), dtype="<i4")[::-1]
+        queries, subjects = index["query"][::-1], index["subject"][::-1]
+        pairs[subjects, queries] = positions
+        pairs[queries, subjects] = positions
+
+        tmp_path = os.path.join(self.path, f"{PAIRS_NAME}.tmp")
+        pairs.tofile(tmp_path)
+        os.replace(tmp_path, os.path.join(self.path, PAIRS_NAME))
+        return len(index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is not None:
+            self.discard()
+        else:
+            self.close()
+
+
+def classes_complete(path, rows_size, num_classes):
+    """True when the class files of a store cover every pair of its rows_size bytes of rows."""
+    try:
+        with open(os.path.join(path, HEADERS_NAME), 'r') as f:
+            if json.load(f).get("classes") != num_classes:
+                return False
+        pairs = os.path.getsize(os.path.join(path, INDEX_NAME)) // INDEX_DTYPE.itemsize
+        return (os.path.getsize(os.path.join(path, CLASSES_NAME)) * 2 == rows_size
+                and os.path.getsize(os.path.join(path, COUNTS_NAME)) == pairs * num_classes * 8)
+    except (FileNotFoundError, ValueError):
+        return False
+
+
+def store_version(path):
+    """
+    (path, size, mtime_ns) of the store's header table, or None without one:
+    it is replaced whenever pairs are written, so it keys views of the alignments.
+    """
+    try:
+        stat = os.stat(os.path.join(path, HEADERS_NAME))
+    except (FileNotFoundError, TypeError):
+        return None
+    return path, stat.st_size, stat.st_mtime_ns
+
+
+def remove_classes(path):
+    for name in (CLASSES_NAME, COUNTS_NAME):
+        try:
+            os.remove(os.path.join(path, name))
+        except FileNotFoundError:
+            pass
+
+
+class AlignmentStore:
+    """
+    Read-only view of a store. The rows file is memory-mapped and rows are
+    handed out as slices of the map; nothing is read until a pair is used.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        headers, self.pairs = self._read_headers()
+        self.ids = headers["ids"]
+        self.descriptions = headers["descriptions"]
+        self._numbers = {qid.lower(): number for number, qid in enumerate(self.ids)}
+
+        # Only the pairs counted by the header table: entries past them are still being appended
+        index_path = os.path.join(path, INDEX_NAME)
+        count = headers.get("pairs", os.path.getsize(index_path) // INDEX_DTYPE.itemsize)
+        if count:
+            self.index = np.memmap(index_path, dtype=INDEX_DTYPE, mode='r', shape=(count,))
+        else:
+            self.index = np.zeros(0, dtype=INDEX_DTYPE)
+
+        self._file = open(os.path.join(path, ROWS_NAME), 'rb')
+        self._map = None
+        rows_size = os.fstat(self._file.fileno()).st_size
+        if rows_size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # Class files are only used when they cover every pair, and held open
+        # so a store written over this one does not change them under it
+        self.num_classes = headers.get("classes")
+        self._classes = self._counts = None
+        if self.num_classes is not None:
+            try:
+                self._classes = open(os.path.join(path, CLASSES_NAME), 'rb')
+                self._counts = open(os.path.join(path, COUNTS_NAME), 'rb')
+            except FileNotFoundError:
+                self.num_classes = None
+        if self.num_classes is not None:
+            rows_end = int(self.index["offset"][-1]) + 2 * int(self.index["length"][-1]) if len(self.index) else 0
+            if (os.fstat(self._classes.fileno()).st_size * 2 < rows_end
+                    or os.fstat(self._counts.fileno()).st_size < len(self.index) * self.num_classes * 8):
+                self.num_classes = None
+
+    def _read_headers(self):
+        """
+        (headers, pair table) of the same store. The pair table is replaced
+        just before the header table, so one of another size belongs to a
+        store being written and the header table is read again.
+        """
+        for _ in range(HEADERS_RETRIES):
+            with open(os.path.join(self.path, HEADERS_NAME), 'r') as f:
+                headers = json.load(f)
+            size = len(headers["ids"])
+            with open(os.path.join(self.path, PAIRS_NAME), 'rb') as f:
+                if os.fstat(f.fileno()).st_size == size * size * 4:
+                    if not size:
+                        return headers, np.zeros((0, 0), dtype="<i4")
+                    return headers, np.memmap(f, dtype="<i4", mode='r', shape=(size, size))
+            time.sleep(HEADERS_RETRY_DELAY)
+        raise ValueError(f"Alignment store {self.path} does not match its header table")
+
+    def __len__(self):
+        return len(self.index)
+
+    def row_views(self, position):
+        """Zero-copy (query row, subject row) memoryviews of the pair at position."""
+        entry = self.index[position]
+        offset, length = int(entry["offset"]), int(entry["length"])
+        rows = memoryview(self._map)
+        return rows[offset:offset + length], rows[offset + length:offset + 2 * length]
+
+    def row_arrays(self, position):
+        """(query row, subject row) of the pair at position as uint8 arrays over the map."""
+        entry = self.index[position]
+        offset, length = int(entry["offset"]), int(entry["length"])
+        rows = np.frombuffer(self._map, dtype=np.uint8, count=2 * length, offset=offset)
+        return rows[:length], rows[length:]
+
+    def rows(self, position):
+        qrow, srow = self.row_views(position)
+        return bytes(qrow).decode('ascii'), bytes(srow).decode('ascii')
+
+    def find(self, query, subject):
+        """
+        (position, swapped) of the pair of two query ids in either order, or
+        None. One read of the pair table, whatever the number of pairs.
+        """
+        query, subject = self._numbers.get(query.lower()), self._numbers.get(subject.lower())
+        if query is None or subject is None:
+            return None
+        position = int(self.pairs[query, subject])
+        # Past the index: aligned by a writer that has not written the header table yet
+        if position < 0 or position >= len(self.index):
+            return None
+        return position, int(self.index[position]["query"]) != query
+
+    def pair(self, query, subject):
+        """(query row, subject row) of two query ids, oriented as asked, or None."""
+        found = self.find(query, subject)
+        if found is None:
+            return None
+        position, swapped = found
+        qrow, srow = self.rows(position)
+        return (srow, qrow) if swapped else (qrow, srow)
+
+    def window(self, query, subject, start, end):
+        """
+        (query row, subject row, alignment length) of columns start:end of
+        two query ids, oriented as asked, or None. Only those columns are read.
+        """
+        found = self.find(query, subject)
+        if found is None:
+            return None
+        position, swapped = found
+        qrow, srow = self.row_views(position)
+        length = len(qrow)
+        qrow, srow = bytes(qrow[start:end]).decode('ascii'), bytes(srow[start:end]).decode('ascii')
+        return (srow, qrow, length) if swapped else (qrow, srow, length)
+
+    def classes(self, query, subject, start=0, end=None):
+        """
+        Stored classes of columns start:end of two query ids as a uint8
+        array, or None when the pair or the class files are missing. Only
+        those columns are read.
+        """
+        found = self.find(query, subject) if self.num_classes is not None else None
+        if found is None:
+            return None
+        entry = self.index[found[0]]
+        length = int(entry["length"])
+        start, end, _ = slice(start, end).indices(length)
+        return np.frombuffer(os.pread(self._classes.fileno(), max(end - start, 0), int(entry["offset"]) // 2 + start),
+                             dtype=np.uint8)
+
+    def class_counts(self, query, subject):
+        """Stored count of each class over the pair of two query ids, or None."""
+        found = self.find(query, subject) if self.num_classes is not None else None
+        if found is None:
+            return None
+        return np.frombuffer(os.pread(self._counts.fileno(), self.num_classes * 8, found[0] * self.num_classes * 8),
+                             dtype="<i8")
+
+    def batch(self):
+        """
+        Every pair as one batch for pair_statistics_batch: (headers, rows,
+        offsets, lengths) with the lowercase query ids of each pair and the
+        whole rows map as a uint8 array.
+        """
+        rows = np.frombuffer(self._map, dtype=np.uint8) if self._map is not None else np.zeros(0, dtype=np.uint8)
+        ids = [qid.lower() for qid in self.ids]
+        headers = [(ids[query], ids[subject]) for query, subject in
+                   zip(self.index["query"].tolist(), self.index["subject"].tolist())]
+        return headers, rows, self.index["offset"], self.index["length"]
+
+    def descriptions_of(self, position):
+        entry = self.index[position]
+        return (f"{self.ids[entry['query']]} {entry['qstart']}-{entry['qend']}",
+                f"{self.ids[entry['subject']]} {entry['sstart']}-{entry['send']}")
+
+    def blocks(self):
+        """Records of every pair in order, as yielded by write_alignment_blocks."""
+        for position in range(len(self)):
+            qdescription, sdescription = self.descriptions_of(position)
+            qrow, srow = self.rows(position)
+            yield [(qdescription, qrow), (sdescription, srow)]
+
+    def user_alignment_text(self, wrap=70):
+        """
+        The user alignment FASTA, as written by process_fasta_file, generated
+        pair by pair.
+        """
+        yield "Query-to-ID Mapping:\n"
+        yield "".join(f"{qid}: {description}\n" for qid, description in zip(self.ids, self.descriptions))
+        yield "\n" + DELIMITER + "\n\n"
+        for position in range(len(self)):
+            entry = self.index[position]
+            qid, sid = self.ids[entry["query"]], self.ids[entry["subject"]]
+            qdescription, sdescription = self.descriptions_of(position)
+            qrow, srow = self.rows(position)
+            lines = [f"Alignment of \n [{qid}]:{self.descriptions[entry['query']]}  and \n "
+                     f"[{sid}]:{self.descriptions[entry['subject']]} :",
+                     f">{qdescription}",
+                     *(qrow[i:i + wrap] for i in range(0, len(qrow), wrap)),
+                     f">{sdescription}",
+                     *(srow[i:i + wrap] for i in range(0, len(srow), wrap))]
+            yield "\n".join(lines) + "\n" + DELIMITER + "\n"
+
+    def close(self):
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # Arrays over the map are still referenced; it is released with them
+                pass
+        for f in (self._file, self._classes, self._counts):
+            if f is not None:
+                f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -18,13 +18,25 @@ from Bio import SeqIO
 from io import StringIO
 import pandas as pd
 import numpy as np
-import psa
+import xlsxwriter
 import re
+import base64
+import hashlib
 import itertools
+import shutil
+from collections import deque
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from functools import wraps
 from flask import Flask, render_template, redirect, url_for, request, send_file, jsonify, json, make_response,session,current_app
 import logging
 from logging.handlers import RotatingFileHandler
+from app.utils import native_aligner, linear_aligner
+from app.utils.native_aligner import native_align, AlignmentResult, ungapped_score
+from app.utils.linear_aligner import linear_align
+from app.utils.alignment_store import AlignmentStore, AlignmentStoreWriter
+from app.utils.result_store import StatisticsStore, write_statistics, read_identity
+from app.utils.kmer_sketch import identity_matrix_frame
 
 logger = logging.getLogger(__name__)
 
@@ -77,9 +89,22 @@ def is_valid_fasta(file_path):
     return True
 
 
-def process_fasta_file(file_path, output_alignment, user_output_alignment, psa_program, gap_open, gap_extend):
+def process_fasta_file(file_path, output_alignment, user_output_alignment, psa_program, gap_open, gap_extend, workers=1, executor="thread", cache=None, progress=None, pairs=None,
+                       output_single_line_fasta=None, consume=None, alignment_store=None):
     """
     Process the input FASTA file, perform alignments, and write results.
+    pairs limits the alignments to those (query id, subject id) pairs,
+    every pair is aligned by default. With workers > 1 the pairs are aligned in a bounded pool; the output
+    files keep the same pair order as the serial run. Pairs found in the
+    alignment cache are read back instead of realigned. progress(done, total)
+    is called after every written pair.
+
+    The single-line alignment file and the binary alignment store
+    (alignment_store.py) are written in the same pass when a path is given;
+    any of the text outputs may be None. consume(blocks) receives the
+    generator of aligned pair records (see write_alignment_blocks) and must
+    exhaust it, e.g. the statistics stage; by default the records are
+    discarded.
     """
     try:
         
@@ -99,35 +124,319 @@ def process_fasta_file(file_path, output_alignment, user_output_alignment, psa_p
         sequences = {f"query{i+1:03d}": record for i, record in enumerate(records)}
         logger.info(f"Processed {len(sequences)} sequences.")
 
-        with open(user_output_alignment, 'w') as user_file, open(output_alignment, 'w') as calc_file:
-            user_file.write("Query-to-ID Mapping:\n")
-            for qid, record in sequences.items():
-                user_file.write(f"{qid}: {record.description}\n")
-            user_file.write("\n" + "=" * 70 + "\n\n")
+        with ExitStack() as stack:
+            user_file, calc_files, single_line_files = open_alignment_outputs(
+                stack, 'w', output_alignment, user_output_alignment, output_single_line_fasta)
+            if user_file is not None:
+                write_query_mapping(user_file, sequences)
+            if pairs is None:
+                pairs = list(itertools.combinations(sequences.keys(), 2))
+            blocks = write_alignment_blocks(sequences, pairs, user_file, calc_files, psa_program, gap_open, gap_extend,
+                                            workers, executor, cache, progress, single_line_files)
+            if alignment_store:
+                blocks = stack.enter_context(store_writer(alignment_store, sequences)).tee(blocks)
+            (consume or drain)(blocks)
 
-            for qid, sid in itertools.combinations(sequences.keys(), 2):
-                qseq = str(sequences[qid].seq)
-                sseq = str(sequences[sid].seq)
-                qdescription = sequences[qid].description
-                sdescription = sequences[sid].description
+    except Exception as e:
+        logger.error(f"Error processing FASTA file: {e}", exc_info=True)
+        raise ValueError(f"Error processing FASTA file: {e}")
+
+def append_fasta_alignments(file_path, num_existing, output_alignment, user_output_alignment, output_single_line_fasta,
+                            psa_program, gap_open, gap_extend, workers=1, executor="thread", cache=None, progress=None,
+                            reference=None, consume=None, alignment_store=None):
+    """
+    Align only the pairs involving sequences appended to the FASTA file after
+    the first num_existing records (new x old, then new x new, or reference x
+    new when a reference query id is given) and append them to the alignment
+    outputs that are given, as in process_fasta_file. The query mapping of
+    the user file and of the store is rewritten, the existing alignments are
+    kept unchanged. The records of the new pairs are streamed to consume.
+    """
+    try:
+        with open(file_path, 'r') as fasta_file:
+            records = list(SeqIO.parse(fasta_file, 'fasta'))
+
+        if len(records) <= num_existing:
+            raise ValueError("No new sequences to append.")
+
+        sequences = {f"query{i+1:03d}": record for i, record in enumerate(records)}
+        qids = list(sequences.keys())
+        old_ids, new_ids = qids[:num_existing], qids[num_existing:]
+        if reference is not None:
+            pairs = [(reference, new) for new in new_ids]
+        else:
+            pairs = [(old, new) for new in new_ids for old in old_ids]
+            pairs += list(itertools.combinations(new_ids, 2))
+        logger.info(f"Appending {len(new_ids)} sequences: {len(pairs)} new pairs.")
 
-                alignment = perform_alignment(qid, sid, qseq, sseq, psa_program, gap_open, gap_extend)
-                user_file.write(f"Alignment of \n [{qid}]:{qdescription}  and \n [{sid}]:{sdescription} :\n")
-                user_file.write(alignment.fasta())
-                user_file.write("\n" + "=" * 70 + "\n")
+        with ExitStack() as stack:
+            user_file, calc_files, single_line_files = open_alignment_outputs(
+                stack, 'a', output_alignment, None, output_single_line_fasta)
+            if user_output_alignment:
+                tmp_user_alignment = f"{user_output_alignment}.tmp"
+                old_user_file = stack.enter_context(open(user_output_alignment, 'r'))
+                user_file = stack.enter_context(open(tmp_user_alignment, 'w'))
+                write_query_mapping(user_file, sequences)
+                # Skip the old mapping, up to and including its delimiter and blank line
+                for line in old_user_file:
+                    if line.rstrip("\n") == "=" * 70:
+                        old_user_file.readline()
+                        break
+                shutil.copyfileobj(old_user_file, user_file)
 
-                calc_file.write(alignment.fasta())
-                calc_file.write("\n" + "=" * 70 + "\n")
+            blocks = write_alignment_blocks(sequences, pairs, user_file, calc_files, psa_program, gap_open, gap_extend,
+                                            workers, executor, cache, progress, single_line_files)
+            if alignment_store:
+                blocks = stack.enter_context(store_writer(alignment_store, sequences, append=True)).tee(blocks)
+            (consume or drain)(blocks)
+        if user_output_alignment:
+            os.replace(tmp_user_alignment, user_output_alignment)
+        return len(records)
 
     except Exception as e:
-        logger.error(f"Error processing FASTA file: {e}", exc_info=True)
-        raise ValueError(f"Error processing FASTA file: {e}")
+        logger.error(f"Error appending sequences: {e}", exc_info=True)
+        raise ValueError(f"Error appending sequences: {e}")
+
+def append_pair_alignments(file_path, pairs, output_alignment, user_output_alignment, output_single_line_fasta,
+                           psa_program, gap_open, gap_extend, workers=1, executor="thread", cache=None, progress=None,
+                           consume=None, alignment_store=None):
+    """
+    Align the given (query id, subject id) pairs of the uploaded sequences
+    and append them to the given outputs, as for sequences appended with
+    append_fasta_alignments.
+    """
+    try:
+        with open(file_path, 'r') as fasta_file:
+            records = list(SeqIO.parse(fasta_file, 'fasta'))
+
+        sequences = {f"query{i+1:03d}": record for i, record in enumerate(records)}
+        unknown = {qid for pair in pairs for qid in pair} - set(sequences)
+        if unknown:
+            raise ValueError(f"Unknown query ids: {', '.join(sorted(unknown))}")
+        logger.info(f"Aligning {len(pairs)} selected pairs.")
+
+        with ExitStack() as stack:
+            user_file, calc_files, single_line_files = open_alignment_outputs(
+                stack, 'a', output_alignment, user_output_alignment, output_single_line_fasta)
+            blocks = write_alignment_blocks(sequences, pairs, user_file, calc_files, psa_program, gap_open, gap_extend,
+                                            workers, executor, cache, progress, single_line_files)
+            if alignment_store:
+                blocks = stack.enter_context(store_writer(alignment_store, sequences, append=True)).tee(blocks)
+            (consume or drain)(blocks)
+
+    except Exception as e:
+        logger.error(f"Error aligning selected pairs: {e}", exc_info=True)
+        raise ValueError(f"Error aligning selected pairs: {e}")
+
+def open_alignment_outputs(stack, mode, output_alignment, user_output_alignment, output_single_line_fasta):
+    """(user file or None, calc files, single-line files) opened on stack; None paths are skipped."""
+    user_file = stack.enter_context(open(user_output_alignment, mode)) if user_output_alignment else None
+    calc_files = [stack.enter_context(open(path, mode)) for path in [output_alignment] if path]
+    single_line_files = [stack.enter_context(open(path, mode)) for path in [output_single_line_fasta] if path]
+    return user_file, calc_files, single_line_files
+
+def store_writer(alignment_store, sequences, append=False):
+    """
+    Alignment store writer whose header table maps the query ids to their
+    FASTA headers. The colour class of every column and the class counts of
+    every pair are stored with the rows, ready for the alignment view.
+    """
+    return AlignmentStoreWriter(alignment_store, list(sequences),
+                                [record.description for record in sequences.values()], append=append,
+                                class_table=colour_class_table())
+
+def write_query_mapping(user_file, sequences):
+    """Header of the user alignment file mapping query ids to FASTA headers."""
+    user_file.write("Query-to-ID Mapping:\n")
+    for qid, record in sequences.items():
+        user_file.write(f"{qid}: {record.description}\n")
+    user_file.write("\n" + "=" * 70 + "\n\n")
+
+def drain(blocks):
+    """Default consumer of write_alignment_blocks: write the files, keep nothing."""
+    deque(blocks, maxlen=0)
+
+def write_alignment_blocks(sequences, pairs, user_file, calc_files, psa_program, gap_open, gap_extend,
+                           workers=1, executor="thread", cache=None, progress=None, single_line_files=()):
+    """
+    Align the pairs, write one block per pair to the user (unless None), calc
+    and single-line files and yield the [(description, sequence), ...] records of
+    each pair once written. Only the current pair is held in memory.
+    """
+    def align(todo):
+        if cache is not None:
+            return cached_align_pairs(cache, sequences, todo, psa_program, gap_open, gap_extend, workers, executor)
+        return align_pairs(sequences, todo, psa_program, gap_open, gap_extend, workers, executor)
+
+    alignments = shortcut_align_pairs(sequences, pairs, psa_program, gap_open, gap_extend, align)
+
+    if progress:
+        progress(0, len(pairs))
+    for done, ((qid, sid), alignment) in enumerate(zip(pairs, alignments), start=1):
+        qdescription = sequences[qid].description
+        sdescription = sequences[sid].description
+
+        block = alignment.fasta()
+        if user_file is not None:
+            user_file.write(f"Alignment of \n [{qid}]:{qdescription}  and \n [{sid}]:{sdescription} :\n")
+            user_file.write(block)
+            user_file.write("\n" + "=" * 70 + "\n")
+
+        for calc_file in calc_files:
+            calc_file.write(block)
+            calc_file.write("\n" + "=" * 70 + "\n")
+
+        records = fasta_records(block.splitlines())
+        for single_line_file in single_line_files:
+            write_single_line_block(single_line_file, records)
+
+        if progress:
+            progress(done, len(pairs))
+        yield records
+
+def shortcut_align_pairs(sequences, pairs, psa_program, gap_open, gap_extend, align):
+    """
+    Yield the alignment of every pair in order, calling align(pairs) only for
+    the pairs that need a real aligner. Sequences are grouped by content:
+    pairs within a group get the trivial identical alignment, pairs between
+    the same two groups are aligned once and relabelled, and equal-length
+    pairs whose gap-free alignment is provably optimal skip the aligner.
+    Only upper-case sequences are short-circuited, as EMBOSS output would be.
+    """
+    # Each sequence maps to the first query id with the same content
+    first_with_content = {}
+    representative = {qid: first_with_content.setdefault(str(record.seq), qid) for qid, record in sequences.items()}
+    penalize_end_gaps = psa_program in ('stretcher', 'linear')
+
+    plan = []
+    uses = {}
+    ungapped = {}
+    for qid, sid in pairs:
+        key = (representative[qid], representative[sid])
+        qseq = str(sequences[qid].seq)
+        sseq = str(sequences[sid].seq)
+        if qseq.isupper() and sseq.isupper() and key not in ungapped:
+            ungapped[key] = ungapped_score(qseq, sseq, gap_open, gap_extend, penalize_end_gaps)
+        if ungapped.get(key) is None:
+            plan.append(("align", key))
+        else:
+            plan.append(("identical" if key[0] == key[1] else "ungapped", ungapped[key]))
+        if plan[-1][0] == "align":
+            uses[key] = uses.get(key, 0) + 1
+
+    aligned = align(list(uses))
+    logger.info(f"Fast path: {sum(1 for kind, _ in plan if kind == 'identical')} identical, "
+                f"{sum(1 for kind, _ in plan if kind == 'ungapped')} ungapped and "
+                f"{sum(1 for kind, _ in plan if kind == 'align') - len(uses)} duplicate pairs short-circuited; "
+                f"{len(uses)} of {len(pairs)} pairs aligned.")
+
+    kept = {}
+    for (qid, sid), (kind, value) in zip(pairs, plan):
+        qseq = str(sequences[qid].seq)
+        sseq = str(sequences[sid].seq)
+        if kind in ("identical", "ungapped"):
+            yield AlignmentResult(qid, sid, qseq, sseq, qseq, sseq, score=value, program=psa_program,
+                                  gapopen=gap_open, gapextend=gap_extend)
+        else:
+            alignment = kept[value] if value in kept else next(aligned)
+            uses[value] -= 1
+            if uses[value] > 0:
+                kept[value] = alignment
+            else:
+                kept.pop(value, None)
+            if (alignment.qid, alignment.sid) == (qid, sid):
+                yield alignment
+            else:
+                yield AlignmentResult(qid, sid, qseq, sseq, alignment.qaln, alignment.saln, score=alignment.score,
+                                      program=psa_program, gapopen=gap_open, gapextend=gap_extend)
+
+def align_pairs(sequences, pairs, psa_program, gap_open, gap_extend, workers=1, executor="thread"):
+    """
+    Yield the alignment of every (qid, sid) pair in the order given.
+    At most 2 * workers alignments are in flight, so memory stays bounded
+    while the writer consumes the results in pair order.
+    """
+    def _args(qid, sid):
+        return (qid, sid, str(sequences[qid].seq), str(sequences[sid].seq), psa_program, gap_open, gap_extend)
+
+    if workers <= 1 or len(pairs) < 2:
+        for qid, sid in pairs:
+            yield perform_alignment(*_args(qid, sid))
+        return
+
+    pool_class = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+    logger.info(f"Aligning {len(pairs)} pairs with {workers} {executor} workers.")
+    with pool_class(max_workers=workers) as pool:
+        pending = deque()
+        for qid, sid in pairs:
+            pending.append(pool.submit(perform_alignment, *_args(qid, sid)))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+# Modules whose source makes up each in-process aligner
+ALIGNER_MODULES = {'native': (native_aligner,), 'linear': (native_aligner, linear_aligner)}
+_ALIGNER_VERSIONS = {}
+
+def aligner_version(psa_program):
+    """
+    Hash of the source of an in-process aligner, or None for the EMBOSS
+    programs: cached alignments of an aligner are not used once it changes.
+    """
+    if psa_program not in ALIGNER_MODULES:
+        return None
+    if psa_program not in _ALIGNER_VERSIONS:
+        digest = hashlib.sha256()
+        for module in ALIGNER_MODULES[psa_program]:
+            with open(module.__file__, 'rb') as f:
+                digest.update(f.read())
+        _ALIGNER_VERSIONS[psa_program] = digest.hexdigest()
+    return _ALIGNER_VERSIONS[psa_program]
+
+def cached_align_pairs(cache, sequences, pairs, psa_program, gap_open, gap_extend, workers=1, executor="thread", flush_every=100):
+    """
+    align_pairs() behind the alignment cache: all pairs are looked up in one
+    pass, only the misses are aligned, and new alignments are written back
+    in batches. Results are yielded in pair order.
+    """
+    version = aligner_version(psa_program)
+    keys = [cache.make_key(str(sequences[qid].seq), str(sequences[sid].seq), psa_program, gap_open, gap_extend, version)
+            for qid, sid in pairs]
+    cached = cache.get_many(keys)
+    missing = [pair for pair, key in zip(pairs, keys) if key not in cached]
+    logger.info(f"Alignment cache: {len(pairs) - len(missing)} hits, {len(missing)} misses.")
+
+    aligned = align_pairs(sequences, missing, psa_program, gap_open, gap_extend, workers, executor)
+    pending = []
+    remaining = len(missing)
+    for (qid, sid), key in zip(pairs, keys):
+        if key in cached:
+            qaln, saln, score = cached[key]
+            yield AlignmentResult(qid, sid, str(sequences[qid].seq), str(sequences[sid].seq), qaln, saln,
+                                  score=score, program=psa_program, gapopen=gap_open, gapextend=gap_extend)
+            continue
+        alignment = next(aligned)
+        remaining -= 1
+        pending.append((key, alignment.qaln, alignment.saln, alignment.score))
+        # Flush before yielding: the consumer may stop after the last pair
+        if len(pending) >= flush_every or remaining == 0:
+            cache.put_many(pending)
+            pending = []
+        yield alignment
 
 def perform_alignment(qi_d, si_d, qseq, sseq, psa_program, gap_open, gap_extend):
     """
     Performing pairwise alignment using user updated parameters.
     """
-    if psa_program == 'stretcher':
+    # psa checks for EMBOSS on import, so only the EMBOSS programs need it
+    if psa_program not in ('native', 'linear'):
+        import psa
+    if psa_program == 'native':
+        alignment_result = native_align(qi_d, si_d, qseq, sseq, gap_open, gap_extend)
+    elif psa_program == 'linear':
+        alignment_result = linear_align(qi_d, si_d, qseq, sseq, gap_open, gap_extend)
+    elif psa_program == 'stretcher':
         alignment_result = psa.stretcher(moltype='nucl', qid=qi_d, sid=si_d, qseq=qseq, sseq=sseq, matrix="EDNAFULL", gapopen=gap_open, gapextend=gap_extend)
     else:
         alignment_result = psa.needle(moltype='nucl', qid=qi_d, sid=si_d, qseq=qseq, sseq=sseq, matrix="EDNAFULL", gapopen=gap_open, gapextend=gap_extend)
@@ -135,223 +444,348 @@ def perform_alignment(qi_d, si_d, qseq, sseq, psa_program, gap_open, gap_extend)
     return alignment_result
 
 
-def process_alignments_files(output_alignment, output_single_line_fasta):
+def fasta_records(lines):
+    """(description, sequence) of every record in FASTA lines, parsed as SeqIO does."""
+    records = []
+    for line in lines:
+        line = line.rstrip()
+        if line.startswith(">"):
+            records.append((line[1:], []))
+        elif records and line:
+            records[-1][1].append(line.replace(" ", ""))
+    return [(description, "".join(chunks)) for description, chunks in records]
+
+def read_alignment_blocks(alignment_file):
     """
-    Convert multi-line FASTA alignments to single-line format.
+    Yield the records of each delimited block of an alignment file, reading
+    one block at a time.
     """
-    try:
-        delimiter = "=" * 70
-        with open(output_alignment, "r") as infile, open(output_single_line_fasta, "w") as outfile:
-            file_content = infile.read()
-            blocks = file_content.split(delimiter)
-
-            for block in blocks:
-                if not block.strip():
-                    continue
-                block_as_file = StringIO("\n".join(block.strip().splitlines()))
-                
-                # Attempt to parse the block as a FASTA file
-                records = list(SeqIO.parse(block_as_file, "fasta"))
-                
+    delimiter = "=" * 70
+    block = []
+    with open(alignment_file, "r") as infile:
+        for line in itertools.chain(infile, [delimiter]):
+            if line.strip() != delimiter:
+                block.append(line)
+                continue
+            if any(line.strip() for line in block):
+                records = fasta_records(block)
                 # Check if any records were parsed
                 if not records:
                     raise ValueError("Invalid FASTA block in alignment file.")
+                yield records
+            block = []
 
-                for record in records:
-                    outfile.write(f">{record.description}\n")
-                    outfile.write(f"{str(record.seq).replace('\n', '')}\n")
-                outfile.write(delimiter + "\n")
+def write_single_line_block(outfile, records):
+    """One block of the single-line alignment file."""
+    for description, sequence in records:
+        outfile.write(f">{description}\n{sequence}\n")
+    outfile.write("=" * 70 + "\n")
+
+def process_alignments_files(output_alignment, output_single_line_fasta):
+    """
+    Convert multi-line FASTA alignments to single-line format.
+    """
+    try:
+        with open(output_single_line_fasta, "w") as outfile:
+            for records in read_alignment_blocks(output_alignment):
+                write_single_line_block(outfile, records)
 
     except Exception as e:
         logger.error(f"Error processing alignment file: {e}", exc_info=True)
         raise ValueError(f"Error processing alignment file: {e}")
 
-def calculate_transitions_transversions(output_single_line_fasta, nucleotide_excel, user_nucleotide_excel, transratio_excel,summary_features_excel,summary_alignment_excel):
+def gather_pair_statistics(batches):
     """
-    Calculate transitions, transversions, and generate output files.
+    (headers, stats) of batches of aligned pairs, as yielded by pair_batches
+    or AlignmentStore.batch: the (query id, subject id) of every pair and the
+    pair_statistics_batch columns of all of them.
+    """
+    headers, batch_stats = [], []
+    for batch_headers, rows, offsets, lengths in batches:
+        headers.extend(batch_headers)
+        batch_stats.append(pair_statistics_batch(rows, offsets, lengths))
+    if not batch_stats:
+        batch_stats.append(pair_statistics_batch(b"", [], []))
+    return headers, {column: np.concatenate([values[column] for values in batch_stats]) for column in batch_stats[0]}
+
+def ratio_matrix_frame(headers, ratios):
+    """
+    Transition/transversion ratio matrix (labels sorted, NaN where a pair
+    was not aligned): dense by sequence ordinal, each pair written both ways
+    in pair order.
+    """
+    labels = sorted({qid for pair in headers for qid in pair})
+    ordinals = {qid: i for i, qid in enumerate(labels)}
+    pair_ordinals = np.array([(ordinals[seq1_header], ordinals[seq2_header]) for seq1_header, seq2_header in headers],
+                             dtype=np.intp).reshape(-1, 2)
+    matrix = np.full((len(labels), len(labels)), np.nan, dtype=object)
+    matrix[pair_ordinals.ravel(), pair_ordinals[:, ::-1].ravel()] = np.repeat(ratios, 2)
+    return pd.DataFrame(matrix, index=labels, columns=labels)
+
+def summary_frames(pair_names, stats):
+    """The summary feature and alignment tables of the pairs."""
+    summary_features_matrix = pd.DataFrame({
+        'Sequence_Pair': pair_names,
+        'Transition_Count': stats['transitions'],
+        'Transition_Percentage': stats['transition_percent'],
+        'Transversion_Count': stats['transversions'],
+        'Transversion_Percentage': stats['transversion_percent'],
+        'Gap_Count': stats['gap_count'],
+        'Gap_Percentage': stats['gap_percent'],
+        'Identical_Count': stats['identical'],
+        'Identical_Percentage': stats['identical_percent']
+    })
+    summary_alignment_matrix = pd.DataFrame({
+        'Sequence_Pair': pair_names,
+        'Query_1_Length': stats['query_length'],
+        'Query_2_Length': stats['subject_length'],
+        'Aligned_Length': stats['total_length']
+    })
+    return summary_features_matrix, summary_alignment_matrix
+
+def nucleotide_matrix_dicts(pair_names, substitutions):
+    """{pair name: {from base: {to base: count}}} of the (pairs, 4, 4) substitution matrices."""
+    return {pair_name: {base1: dict(zip(NUCLEOTIDES, row)) for base1, row in zip(NUCLEOTIDES, matrix)}
+            for pair_name, matrix in zip(pair_names, substitutions.tolist())}
+
+def collect_pair_statistics(batches):
+    """
+    Per-pair statistics of batches of aligned pairs, as yielded by
+    pair_batches or AlignmentStore.batch: the transition/transversion ratio
+    matrix (labels sorted), the summary feature and alignment tables and the
+    nucleotide substitution matrix of every pair.
+    The pairs are gathered as columns and every table is built once.
     """
     try:
-        delimiter = "=" * 70
-        transition_transversion_matrix = pd.DataFrame()
-        summary_features_matrix = pd.DataFrame(columns=[
-            'Sequence_Pair',
-            'Transition_Count',
-            'Transition_Percentage',
-            'Transversion_Count',
-            'Transversion_Percentage',
-            'Gap_Count',
-            'Gap_Percentage',
-            'Identical_Count',
-            'Identical_Percentage'
-        ])
-        summary_alignment_matrix = pd.DataFrame(columns=[
-            'Sequence_Pair',
-            'Query_1_Length',
-            'Query_2_Length',
-            'Aligned_Length'
-        ])
-        nucleotide_matrices = {}
-
-        with open(output_single_line_fasta, "r") as trans_infile:
-            trans_file_content = trans_infile.read()
-            blocks = trans_file_content.split(delimiter)
-
-            for block in blocks:
-                if not block.strip():
-                    continue
-                block_as_file = StringIO("\n".join(block.strip().splitlines()))
-                
-                # Attempt to parse the block as a FASTA file
-                records = list(SeqIO.parse(block_as_file, "fasta"))
-                
-                # Check if any records were parsed
-                if not records:
-                    raise ValueError("Invalid FASTA block in transitions/transversions file.")
-
-                if len(records) != 2:
-                    logger.warning(f"Skipping block with {len(records)} sequences (expected 2):\n{block}")
-                    continue
-                
-                # Extract "query1" from ">query1 1-35"
-                seq1_header= records[0].description
-                seq2_header = records[1].description
-                seq1_header= seq1_header.strip().lower().split()[0][0:] 
-                seq2_header= seq2_header.strip().lower().split()[0][0:] 
-                
-                pair_name = f"{seq1_header}_vs_{seq2_header}" 
-
-                seq1 =  str(records[0].seq).replace('\n', '')
-                seq2 =  str(records[1].seq).replace('\n', '')
-                
-                # Get pre-aligned lengths from original sequences
-                seq1_prealigned = len(str(records[0].seq).replace('-', ''))
-                seq2_prealigned = len(str(records[1].seq).replace('-', ''))
-                aligned_length = len(seq1)  # Length after alignment
-                
-                # Count transitions and transversions
-                stats, matrix = count_transitions_transversions(seq1, seq2)
-
-                # Update transition/transversion ratio matrix
-                transition_transversion_matrix.loc[seq1_header, seq2_header] = stats['ratio']
-                transition_transversion_matrix.loc[seq2_header, seq1_header] = stats['ratio']
-                
-                # Store nucleotide matrix
-                nucleotide_matrices[pair_name] = matrix
-                
-                # Update summary features matrix
-                summary_features_matrix.loc[len(summary_features_matrix)] = {
-                    'Sequence_Pair': pair_name,
-                    'Transition_Count': stats['transitions'],
-                    'Transition_Percentage': stats['transition_percent'],
-                    'Transversion_Count': stats['transversions'],
-                    'Transversion_Percentage': stats['transversion_percent'],
-                    'Gap_Count': stats['gap_count'],
-                    'Gap_Percentage': stats['gap_percent'],
-                    'Identical_Count': stats['identical'],
-                    'Identical_Percentage': stats['identical_percent']
-                }
-                
-                # Update summary alignment matrix
-                summary_alignment_matrix.loc[len(summary_alignment_matrix)] = {
-                    'Sequence_Pair': pair_name,
-                    'Query_1_Length': seq1_prealigned,
-                    'Query_2_Length': seq2_prealigned,
-                    'Aligned_Length': aligned_length
-                }
-                
-
-
-        # Sort the index and columns of the transition_transversion_matrix
-        transition_transversion_matrix = transition_transversion_matrix.sort_index(axis=0).sort_index(axis=1)
-        
-        transition_transversion_matrix = transition_transversion_matrix.fillna("-")
-        
-        
+        headers, stats = gather_pair_statistics(batches)
+        pair_names = [f"{seq1_header}_vs_{seq2_header}" for seq1_header, seq2_header in headers]
+        summary_features_matrix, summary_alignment_matrix = summary_frames(pair_names, stats)
+        return (ratio_matrix_frame(headers, stats['ratio']), summary_features_matrix, summary_alignment_matrix,
+                nucleotide_matrix_dicts(pair_names, stats['substitutions']))
+
+    except Exception as e:
+        logger.error(f"Error calculating transitions/transversions: {e}", exc_info=True)
+        raise ValueError(f"Error calculating transitions/transversions: {e}")
 
-        #downloadable_nucleotide_excel
-        with pd.ExcelWriter(nucleotide_excel) as writer:
-            for pair, matrix in nucleotide_matrices.items():
-                # Convert the substitution matrix into a DataFrame
-                matrix_df = pd.DataFrame.from_dict(matrix, orient="index", columns=matrix.keys())
-                matrix_df.index.name = "Base"  # Set index name explicitly
-                #print(f"\nSubstitution Matrix for {pair}:")
-                #print(matrix_df)
-                # Write the DataFrame to a new sheet
-                matrix_df.to_excel(writer, sheet_name=pair, index_label="Base")
-                
-        # User_nucleotide_Excel_display_on_web
-        with pd.ExcelWriter(user_nucleotide_excel) as writer:
-            # Create a DataFrame for the nucleotide matrices
-            nuc_df = pd.DataFrame(columns=["Sequence Pair", "A", "T", "G", "C"])
-
-            for pair, matrix in nucleotide_matrices.items():
-                # Convert the substitution matrix into a row for the DataFrame
-                row = {
-                    "Sequence Pair": pair,
-                    "A": matrix['A'],
-                    "T": matrix['T'],
-                    "G": matrix['G'],
-                    "C": matrix['C']
-                }
-                # Append the row to the DataFrame using pd.concat()
-                nuc_df = pd.concat([nuc_df, pd.DataFrame([row])], ignore_index=True)
-
-
-            # Write the DataFrame to Excel
-            nuc_df.to_excel(writer, sheet_name="User_Nucleotide Matrices", index=False)
-        transition_transversion_matrix.to_excel(transratio_excel)
-        summary_features_matrix.to_excel(summary_features_excel, index=False)
-        summary_alignment_matrix.to_excel(summary_alignment_excel, index=False)
+def user_nucleotide_frame(nucleotide_matrices):
+    """Table shown on the web: one row per pair with its substitution matrix rows by base."""
+    return pd.DataFrame({
+        "Sequence Pair": list(nucleotide_matrices),
+        **{base: [matrix[base] for matrix in nucleotide_matrices.values()] for base in ["A", "T", "G", "C"]}
+    })
 
+def calculate_transitions_transversions(output_single_line_fasta, statistics_store, reference=None, blocks=None, batches=None):
+    """
+    Calculate transitions, transversions and the other per-pair statistics
+    into the statistics store; the workbooks are exported from it on request.
+    With a reference query id the ratio matrix is the reference row only.
+    The pairs are read from the single-line file unless their records are
+    streamed in as blocks or given as batches of gather_pair_statistics.
+    """
+    try:
+        if batches is None:
+            batches = pair_batches(read_alignment_blocks(output_single_line_fasta) if blocks is None else blocks)
+        headers, stats = gather_pair_statistics(batches)
+        write_statistics(statistics_store, headers, stats, reference=reference)
 
     except Exception as e:
         logger.error(f"Error calculating transitions/transversions: {e}", exc_info=True)
         raise ValueError(f"Error calculating transitions/transversions: {e}")
 
+def merge_transitions_transversions(new_single_line_fasta, statistics_store, reference=None, blocks=None):
+    """
+    Add the statistics of newly aligned pairs to the statistics store after
+    the existing ones, which are not recomputed. As in
+    calculate_transitions_transversions, the new pairs may be streamed in as
+    blocks instead of read from new_single_line_fasta.
+    """
+    try:
+        if blocks is None:
+            blocks = read_alignment_blocks(new_single_line_fasta)
+        headers, stats = gather_pair_statistics(pair_batches(blocks))
+        write_statistics(statistics_store, headers, stats, reference=reference, append=True)
+
+    except Exception as e:
+        logger.error(f"Error merging transitions/transversions: {e}", exc_info=True)
+        raise ValueError(f"Error merging transitions/transversions: {e}")
+
+def transratio_table(statistics_store):
+    """Ratio matrix of a statistics store as shown and exported: reference row only, '-' where unaligned."""
+    with StatisticsStore(statistics_store) as store:
+        matrix = ratio_matrix_frame(store.headers(), store.column('ratio').tolist())
+        return reference_row(matrix, store.reference).fillna("-")
+
+def summary_tables(statistics_store):
+    """The summary feature and alignment tables of a statistics store."""
+    with StatisticsStore(statistics_store) as store:
+        return summary_frames(store.pair_names(), {name: store.column(name) for name in store.names})
+
+def nucleotide_matrices_of(statistics_store):
+    """The substitution matrix of every pair of a statistics store, as collect_pair_statistics returns them."""
+    with StatisticsStore(statistics_store) as store:
+        return nucleotide_matrix_dicts(store.pair_names(), store.column('substitutions'))
+
+def write_nucleotide_workbook(statistics_store, path):
+    """One sheet per pair with its substitution matrix."""
+    with pd.ExcelWriter(path) as writer:
+        for pair, matrix in nucleotide_matrices_of(statistics_store).items():
+            # Convert the substitution matrix into a DataFrame
+            matrix_df = pd.DataFrame.from_dict(matrix, orient="index", columns=matrix.keys())
+            matrix_df.index.name = "Base"  # Set index name explicitly
+            # Write the DataFrame to a new sheet
+            matrix_df.to_excel(writer, sheet_name=pair, index_label="Base")
+
+# Rows of an Excel worksheet, the header row included
+EXCEL_MAX_ROWS = 1048576
+NUCLEOTIDE_LONG_HEADER = ["Sequence_Pair", "From_Base", "To_Base", "Count"]
+
+def write_nucleotide_long_workbook(statistics_store, path):
+    """
+    The substitution counts of every pair as one long table (pair, from
+    base, to base, count), streamed row by row in xlsxwriter's
+    constant_memory mode so memory stays flat however many pairs there are.
+    Rows past the end of a sheet continue on a numbered sheet.
+    """
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+    try:
+        bold = workbook.add_format({"bold": True})
+        sheet, row, sheets = None, EXCEL_MAX_ROWS, 0
+        with StatisticsStore(statistics_store) as store:
+            for pair_name, matrix in zip(store.pair_names(), store.column('substitutions')):
+                for base1, counts in zip(NUCLEOTIDES, matrix.tolist()):
+                    for base2, count in zip(NUCLEOTIDES, counts):
+                        if row == EXCEL_MAX_ROWS:
+                            sheets += 1
+                            sheet = workbook.add_worksheet("Nucleotide Substitutions" + (f" {sheets}" if sheets > 1 else ""))
+                            sheet.write_row(0, 0, NUCLEOTIDE_LONG_HEADER, bold)
+                            row = 1
+                        sheet.write_row(row, 0, (pair_name, base1, base2, count))
+                        row += 1
+        if sheet is None:
+            workbook.add_worksheet("Nucleotide Substitutions").write_row(0, 0, NUCLEOTIDE_LONG_HEADER, bold)
+    finally:
+        workbook.close()
+
+def approx_identity_table(identity_store):
+    """Approximate identity matrix of an identity archive as exported."""
+    ids, identity = read_identity(identity_store)
+    return identity_matrix_frame(identity, ids)
+
+def approx_identity_block(identity_store, row_start, col_start, size):
+    """
+    (query ids, block, row start, column start) of the approximate identity
+    matrix as shown: the size x size block holding cell (row_start,
+    col_start), clamped to the matrix. Only the block is read from the archive.
+    """
+    ids, identity = read_identity(identity_store, mmap=True)
+    last = max(len(ids) - 1, 0)
+    row_start, col_start = (min(max(start, 0), last) // size * size for start in (row_start, col_start))
+    rows, cols = slice(row_start, row_start + size), slice(col_start, col_start + size)
+    return ids, identity_matrix_frame(np.array(identity[rows, cols]), ids[rows], ids[cols]), row_start, col_start
+
+# Downloads exported from the result stores: file name -> writer(store, path)
+RESULT_EXPORTS = {
+    "nucleotide.xlsx": write_nucleotide_workbook,
+    "nucleotide_long.xlsx": write_nucleotide_long_workbook,
+    "transratio.xlsx": lambda statistics_store, path: transratio_table(statistics_store).to_excel(path),
+    "summary_features.xlsx":
+        lambda statistics_store, path: summary_tables(statistics_store)[0].to_excel(path, index=False),
+    "summary_alignment.xlsx":
+        lambda statistics_store, path: summary_tables(statistics_store)[1].to_excel(path, index=False),
+    "approx_identity.xlsx": lambda identity_store, path: approx_identity_table(identity_store).to_excel(path),
+}
+
+def export_result(store, filename, path):
+    """
+    Write the workbook filename of RESULT_EXPORTS from its store to path,
+    through a temporary file so no half-written export is ever served.
+    """
+    # Named with the workbook's extension, which selects the Excel writer
+    tmp_path = os.path.join(os.path.dirname(path), f".tmp.{os.path.basename(path)}")
+    try:
+        RESULT_EXPORTS[filename](store, tmp_path)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        logger.error(f"Error exporting {filename}: {e}", exc_info=True)
+        raise ValueError(f"Error exporting {filename}: {e}")
+
+def reference_row(transition_transversion_matrix, reference):
+    """Reference-vs-all layout: the reference row against every other query."""
+    if reference is None or reference not in transition_transversion_matrix.index:
+        return transition_transversion_matrix
+    others = [qid for qid in transition_transversion_matrix.columns if qid != reference]
+    return transition_transversion_matrix.loc[[reference], others]
+
+# Column classes of count_transitions_transversions: 0-15 are the base pairs
+# 4 * i + j over NUCLEOTIDES, the others are counted or rejected as a whole.
+# Gaps are split by side so the ungapped row lengths come from the same counts.
+NUCLEOTIDES = 'ACGT'
+QUERY_GAP_CLASS, SUBJECT_GAP_CLASS, DOUBLE_GAP_CLASS = 16, 17, 18
+AMBIGUOUS_CLASS, INVALID_CLASS = 19, 20
+GAP_CLASSES = [QUERY_GAP_CLASS, SUBJECT_GAP_CLASS, DOUBLE_GAP_CLASS]
+TRANSITION_PAIRS = [(0, 2), (2, 0), (1, 3), (3, 1)]  # A<->G, C<->T
+
+_CLASS_TABLE = None
+
+
+def column_class_table():
+    """
+    256x256 class lookup of an alignment column, indexed by the ASCII codes
+    of its two bases. A gap on either side wins over an ambiguous symbol,
+    which wins over an invalid one.
+    """
+    global _CLASS_TABLE
+    if _CLASS_TABLE is None:
+        kind = np.full(256, 6, dtype=np.intp)  # invalid
+        for symbol in 'NRYKMSWBDHVU':
+            kind[ord(symbol)] = 4
+        kind[ord('-')] = 5
+        for i, base in enumerate(NUCLEOTIDES):
+            kind[ord(base)] = i
+        kind1, kind2 = kind[:, None], kind[None, :]
+        _CLASS_TABLE = np.select(
+            [(kind1 == 5) & (kind2 == 5), kind1 == 5, kind2 == 5,
+             (kind1 == 4) | (kind2 == 4), (kind1 == 6) | (kind2 == 6)],
+            [DOUBLE_GAP_CLASS, QUERY_GAP_CLASS, SUBJECT_GAP_CLASS, AMBIGUOUS_CLASS, INVALID_CLASS],
+            default=4 * kind1 + kind2).astype(np.uint8)
+    return _CLASS_TABLE
+
+def _column_codes(row):
+    """uint8 codes of an aligned row; str rows are encoded, bytes-like rows are used in place."""
+    if isinstance(row, str):
+        # Non-ASCII symbols become '?', which is invalid like the symbol itself
+        row = row.encode('ascii', errors='replace')
+    return np.frombuffer(row, dtype=np.uint8)
+
 def count_transitions_transversions(seq1, seq2):
     """
     Counting the transitions and Transversionss and their Ratio.
+    Every column is classified through column_class_table() and all counts,
+    including the substitution matrix, come from one bincount.
     """
-    purines = {'A', 'G'}
-    pyrimidines = {'C', 'T'}
-    # Define a set of ambiguous nucleotide symbols
-    ambiguous_symbols = {'-', 'N', 'R', 'Y', 'K', 'M', 'S', 'W', 'B', 'D', 'H', 'V', 'U'}
-    transitions, transversions, identical, gap_count = 0, 0 , 0, 0
     total_length = len(seq1)
+    codes1, codes2 = _column_codes(seq1), _column_codes(seq2)
+    width = min(len(codes1), len(codes2))
+    classes = column_class_table()[codes1[:width], codes2[:width]]
+    counts = np.bincount(classes, minlength=INVALID_CLASS + 1)
 
-    # Initialize nucleotide substitution matrix
-    nucleotide_set = 'ACGT'
-    matrix = {base1: {base2: 0 for base2 in nucleotide_set} for base1 in nucleotide_set}
+    if counts[INVALID_CLASS]:
+        column = int(np.argmax(classes == INVALID_CLASS))
+        b1, b2 = (row[column] if isinstance(row, str) else chr(row[column]) for row in (seq1, seq2))
+        raise ValueError(f"Invalid base pair: b1={b1}, b2={b2}")
 
-    for b1, b2 in zip(seq1, seq2):
-        if b1 == '-' or b2 == '-':  # Count all gaps
-            gap_count += 1
-            continue
-        if b1 in ambiguous_symbols or b2 in ambiguous_symbols:
-            continue
-        if b1 not in nucleotide_set or b2 not in nucleotide_set:
-            raise ValueError(f"Invalid base pair: b1={b1}, b2={b2}")
-        if b1 not in nucleotide_set or b2 not in nucleotide_set:
-            #print(f"Skipping invalid bases: b1={b1}, b2={b2}")
-            continue
-        if b1 == b2:
-            identical += 1
-            continue # i wnat to calucute the no of identical nucleotides also.
+    pairs = counts[:16].reshape(4, 4)
+    identical = int(np.trace(pairs))
+    transitions = int(sum(pairs[i, j] for i, j in TRANSITION_PAIRS))
+    transversions = int(pairs.sum()) - identical - transitions
+    gap_count = int(counts[GAP_CLASSES].sum())
 
-        matrix[b1][b2] += 1
+    # Nucleotide substitution matrix, identical bases excluded
+    matrix = {base1: {base2: int(pairs[i, j]) if i != j else 0 for j, base2 in enumerate(NUCLEOTIDES)}
+              for i, base1 in enumerate(NUCLEOTIDES)}
 
-        # Determine transition or transversion
-        if (b1 in purines and b2 in purines) or (b1 in pyrimidines and b2 in pyrimidines):
-            transitions += 1
-        else:
-            transversions += 1
-    
-    # Print the substitution matrix for debugging
-    #print("\nNucleotide Substitution Matrix:")
-    #for base1, row in matrix.items():
-        #print(f"{base1}: {row}")
-    #print(transitions,transversions)
-    
     # Calculate percentages
     transition_percent = (transitions / total_length) * 100 if total_length > 0 else 0
     transversion_percent = (transversions / total_length) * 100 if total_length > 0 else 0
@@ -374,108 +808,285 @@ def count_transitions_transversions(seq1, seq2):
     }, matrix
 
 
-def extract_alignment_pair(processed_content, query, subject):
+# Columns classified together by pair_statistics_batch, bounding its temporary arrays
+BATCH_COLUMNS = 1 << 20
+
+def pair_batches(blocks, columns=BATCH_COLUMNS):
+    """
+    Group aligned pair records, as yielded by read_alignment_blocks or
+    write_alignment_blocks, into batches for pair_statistics_batch:
+    (headers, rows, offsets, lengths) with the lowercase (query id, subject
+    id) of each pair and its rows laid out as in the alignment store.
+    """
+    headers, parts, offsets, lengths, size = [], [], [], [], 0
+    for records in blocks:
+        if len(records) != 2:
+            logger.warning(f"Skipping block with {len(records)} sequences (expected 2): "
+                           f"{[description for description, _ in records]}")
+            continue
+        (qdescription, qrow), (sdescription, srow) = records
+        if len(qrow) != len(srow):
+            raise ValueError(f"Aligned rows of different lengths: {qdescription}, {sdescription}")
+        headers.append((qdescription.strip().lower().split()[0], sdescription.strip().lower().split()[0]))
+        # Non-ASCII symbols become '?', which is invalid like the symbol itself
+        parts.append((qrow + srow).encode('ascii', errors='replace'))
+        offsets.append(size)
+        lengths.append(len(qrow))
+        size += 2 * len(qrow)
+        if size >= 2 * columns:
+            yield headers, b"".join(parts), offsets, lengths
+            headers, parts, offsets, lengths, size = [], [], [], [], 0
+    if headers:
+        yield headers, b"".join(parts), offsets, lengths
+
+def _percentages(counts, totals):
+    """Percentages of counts in totals, rounded to 2 places exactly as round() does."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percent = np.where(totals > 0, (counts / totals) * 100, 0.0)
+    scaled = percent * 100
+    rounded = np.rint(scaled) / 100
+    # rint of the scaled value can only round differently from round() next to a half
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    rounded[near_half] = [round(value, 2) for value in percent[near_half].tolist()]
+    return rounded
+
+def pair_statistics_batch(rows, offsets, lengths):
     """
-    Extract the alignment pair for the given query and subject.
-    Normalize the input and match only the relevant part of the header.
+    Statistics of many aligned pairs at once, as columns. rows is one uint8
+    buffer holding the query row of pair k at offsets[k] and its subject row
+    right after it, both lengths[k] long, as in the alignment store. The
+    columns of up to BATCH_COLUMNS pairs' worth are classified through
+    column_class_table() together and counted with one bincount.
+    Returns a dict of arrays by pair, with the values of
+    count_transitions_transversions plus the ungapped query_length and
+    subject_length and the (pairs, 4, 4) substitutions matrices.
+    """
+    rows = np.frombuffer(rows, dtype=np.uint8)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    num_pairs, num_classes = len(lengths), INVALID_CLASS + 1
+    table = column_class_table().ravel()
+
+    counts = np.zeros((num_pairs, num_classes), dtype=np.int64)
+    ends = np.cumsum(lengths)
+    start = 0
+    while start < num_pairs:
+        # At most BATCH_COLUMNS columns per step, or a single longer pair
+        stop = max(start + 1, int(np.searchsorted(ends, ends[start] - lengths[start] + BATCH_COLUMNS, side='right')))
+        spans = list(zip(offsets[start:stop].tolist(), lengths[start:stop].tolist()))
+        query = np.concatenate([rows[offset:offset + length] for offset, length in spans])
+        subject = np.concatenate([rows[offset + length:offset + 2 * length] for offset, length in spans])
+        classes = np.take(table, (query.astype(np.uint16) << 8) | subject)
+        keys = np.repeat(np.arange(0, (stop - start) * num_classes, num_classes, dtype=np.int32), lengths[start:stop])
+        keys += classes
+        counts[start:stop] = np.bincount(keys, minlength=(stop - start) * num_classes).reshape(-1, num_classes)
+
+        if counts[start:stop, INVALID_CLASS].any():
+            column = int(np.argmax(classes == INVALID_CLASS))
+            raise ValueError(f"Invalid base pair: b1={chr(query[column])}, b2={chr(subject[column])}")
+        start = stop
+
+    substitutions = counts[:, :16].reshape(-1, 4, 4).copy()
+    identical = np.einsum('kii->k', substitutions)
+    transitions = sum(substitutions[:, i, j] for i, j in TRANSITION_PAIRS)
+    transversions = substitutions.sum(axis=(1, 2)) - identical - transitions
+    substitutions[:, np.arange(4), np.arange(4)] = 0
+    gap_count = counts[:, GAP_CLASSES].sum(axis=1)
+
+    return {
+        'transitions': transitions,
+        'transversions': transversions,
+        'identical': identical,
+        'gap_count': gap_count,
+        'transition_percent': _percentages(transitions, lengths),
+        'transversion_percent': _percentages(transversions, lengths),
+        'identical_percent': _percentages(identical, lengths),
+        'gap_percent': _percentages(gap_count, lengths),
+        'total_length': lengths,
+        'ratio': np.array([f"{t / v:.3f}" if v != 0 else "Undefined"
+                           for t, v in zip(transitions.tolist(), transversions.tolist())], dtype=object),
+        'query_length': lengths - counts[:, QUERY_GAP_CLASS] - counts[:, DOUBLE_GAP_CLASS],
+        'subject_length': lengths - counts[:, SUBJECT_GAP_CLASS] - counts[:, DOUBLE_GAP_CLASS],
+        'substitutions': substitutions,
+    }
+
+
+def extract_alignment_pair(alignment_store, query, subject):
+    """
+    Extract the alignment pair for the given query and subject from the
+    session's alignment store, in the order asked for.
     """
     # Normalize the input
     query = query.lower().replace(" ", "")
     subject = subject.lower().replace(" ", "")
 
-    blocks = processed_content.split("=" * 70)
-    for block in blocks:
-        if not block.strip():
-            continue
-        lines = block.strip().splitlines()
-        header1 = lines[0].strip().lower().split()[0][1:]  # Extract "query1" from ">query1 1-35"
-        seq1 = lines[1].strip()
-        header2 = lines[2].strip().lower().split()[0][1:]  # Extract "query2" from ">query2 1-35"
-        seq2 = lines[3].strip()
-
-        if query == header1 and subject == header2:
-            return (seq1, seq2)
-        elif query == header2 and subject == header1:
-            return (seq2, seq1)
-    return None
+    with AlignmentStore(alignment_store) as store:
+        return store.pair(query, subject)
 
-def colour_code_alignment(alignment_pair,query, subject):
+def extract_alignment_window(alignment_store, query, subject, start, end):
     """
-    Compare the sequences and apply colour coding.
-    Calculate percentages for the pie chart.
+    Columns start to end of the alignment pair for the given query and
+    subject, in the order asked for: (query row, subject row, alignment
+    length), or None. Only those columns are read from the store.
     """
-    # Define color mapping
-    color_map = {
-        "identical": "green",
-        "transition": "orange",
-        "transversion": "red",
-        "gap": "black",
-        "unknown": "grey"  # Add a color for N (unknown)
-        
-    }
+    query = query.lower().replace(" ", "")
+    subject = subject.lower().replace(" ", "")
 
-    seq1, seq2 = alignment_pair
-    stats = {
-        "identical": 0,
-        "transitions": 0,
-        "transversions": 0,
-        "gaps": 0,
-        "unknown": 0,  # Add a counter for N
-        "total_length": len(seq1)
-    }
+    with AlignmentStore(alignment_store) as store:
+        return store.window(query, subject, start, end)
 
-    purines = {'A', 'G'}
-    pyrimidines = {'C', 'T'}
-    ambiguous_symbols = {'N', 'R', 'Y', 'K', 'M', 'S', 'W', 'B', 'D', 'H', 'V','U'}  # Excludes '-'
+def extract_alignment_view(alignment_store, query, subject, start=0, end=None):
+    """
+    (window, classes, stats) of columns start:end of a pair (to the end
+    when end is None), or None if the pair was not aligned. window is as
+    extract_alignment_window returns it, classes the COLOUR_CLASSES index
+    of its columns and stats the colour_stats of the whole pair when the
+    window starts at column 0, else None. Classes and counts stored by the
+    pipeline are used when present, otherwise they are computed here.
+    """
+    with AlignmentStore(alignment_store) as store:
+        window = store.window(query, subject, start, end)
+        if window is None:
+            return None
+        classes = store.classes(query, subject, start, end)
+        if classes is None:
+            classes = colour_classes(*window[:2])
+        stats = None
+        if start == 0:
+            counts = store.class_counts(query, subject)
+            if counts is not None:
+                stats = colour_count_stats(counts, window[2])
+            elif len(classes) == window[2]:
+                stats = colour_stats(classes, window[2])
+            else:
+                stats = colour_stats(colour_classes(*store.pair(query, subject)), window[2])
+    return window, classes, stats
 
-    # Function to wrap sequences into lines of 50 characters
-    def wrap_sequence(sequence, length=50):
-        return [sequence[i:i+length] for i in range(0, len(sequence), length)]
+# Column classes of colour_code_alignment and the CSS class of each in main.css
+COLOUR_CLASSES = ["identical", "transition", "transversion", "gap", "unknown"]
+COLOUR_CSS = ["aln-id", "aln-ts", "aln-tv", "aln-gap", "aln-n"]
+COLOUR_LINE_LENGTH = 50
+# Bits per column of the packed class array of the compact alignment view
+COLOUR_CLASS_BITS = 3
 
-    # Wrap the sequences before applying HTML tags
-    wrapped_seq1 = wrap_sequence(seq1)
-    wrapped_seq2 = wrap_sequence(seq2)
+_COLOUR_TABLE = None
 
-    colour_coded_alignment = []
 
-    for line1, line2 in zip(wrapped_seq1, wrapped_seq2):
-        colour_coded_line1 = []
-        colour_coded_line2 = []
-
-        for char1, char2 in zip(line1, line2):
-            if char1 == char2:
-                color = color_map["identical"]
-                stats["identical"] += 1
-            elif char1 == '-' or char2 == '-':
-                color = color_map["gap"]
-                stats["gaps"] += 1
-            elif char1 in ambiguous_symbols or char2 in ambiguous_symbols:  
-                color = color_map["unknown"]
-                stats["unknown"] += 1
-            elif (char1 in purines and char2 in purines) or (char1 in pyrimidines and char2 in pyrimidines):
-                color = color_map["transition"]
-                stats["transitions"] += 1
-            else:
-                color = color_map["transversion"]
-                stats["transversions"] += 1
+def colour_class_table():
+    """
+    256x256 lookup of the COLOUR_CLASSES index of an alignment column,
+    indexed by the ASCII codes of its two bases. Identical symbols come
+    first, then gaps, ambiguous symbols (N and IUPAC codes) and transitions;
+    anything else is a transversion.
+    """
+    global _COLOUR_TABLE
+    if _COLOUR_TABLE is None:
+        codes = np.arange(256)
+        base1, base2 = codes[:, None], codes[None, :]
+        ambiguous, purine, pyrimidine = (np.isin(codes, [ord(symbol) for symbol in symbols])
+                                         for symbols in ('NRYKMSWBDHVU', 'AG', 'CT'))
+        _COLOUR_TABLE = np.select(
+            [base1 == base2, (base1 == ord('-')) | (base2 == ord('-')), ambiguous[base1] | ambiguous[base2],
+             (purine[base1] & purine[base2]) | (pyrimidine[base1] & pyrimidine[base2])],
+            [0, 3, 4, 1], default=2).astype(np.uint8)
+    return _COLOUR_TABLE
 
-            # Apply color to both sequences
-            colour_coded_line1.append(f'<span style="color: {color}">{char1}</span>')
-            colour_coded_line2.append(f'<span style="color: {color}">{char2}</span>')
+def colour_classes(seq1, seq2):
+    """COLOUR_CLASSES index of every column of two aligned rows."""
+    width = min(len(seq1), len(seq2))
+    codes1 = np.frombuffer(seq1.encode('ascii'), dtype=np.uint8)[:width]
+    codes2 = np.frombuffer(seq2.encode('ascii'), dtype=np.uint8)[:width]
+    return colour_class_table()[codes1, codes2]
 
-        # Combine the lines with line breaks
-        colour_coded_alignment.append(f"{query}: {''.join(colour_coded_line1)}<br>{subject}: {''.join(colour_coded_line2)}<br><br>")
+def colour_stats(classes, total_length):
+    """Counts and percentages of the column classes, for the stats table and pie chart."""
+    return colour_count_stats(np.bincount(classes, minlength=len(COLOUR_CLASSES)), total_length)
+
+def colour_count_stats(counts, total_length):
+    """colour_stats from the count of each column class."""
+    counts = [int(count) for count in counts]
+    stats = {
+        "identical": counts[0],
+        "transitions": counts[1],
+        "transversions": counts[2],
+        "gaps": counts[3],
+        "unknown": counts[4],  # Add a counter for N
+        "total_length": total_length
+    }
 
     # Calculate percentages
-    total_length = stats["total_length"]
     stats["identical_percent"] = (stats["identical"] / total_length) * 100
     stats["transitions_percent"] = (stats["transitions"] / total_length) * 100
     stats["transversions_percent"] = (stats["transversions"] / total_length) * 100
     stats["gaps_percent"] = (stats["gaps"] / total_length) * 100
     stats["unknown_percent"] = (stats["unknown"] / total_length) * 100
+    return stats
+
+def colour_spans(seq1, seq2, classes, query, subject):
+    """
+    Colour-coded HTML of two aligned rows wrapped every COLOUR_LINE_LENGTH
+    columns: every run of one class within a line is a single span.
+    """
+    width = len(classes)
+    # Runs start where the class changes and at the start of every wrapped line
+    starts = np.union1d(np.flatnonzero(classes[1:] != classes[:-1]) + 1, np.arange(0, width, COLOUR_LINE_LENGTH))
+    ends = np.append(starts[1:], width)
 
+    colour_coded_alignment = []
+    line1, line2 = [], []
+    for start, end, colour in zip(starts.tolist(), ends.tolist(), classes[starts].tolist()):
+        if start % COLOUR_LINE_LENGTH == 0 and line1:
+            colour_coded_alignment.append(f"{query}: {''.join(line1)}<br>{subject}: {''.join(line2)}<br><br>")
+            line1, line2 = [], []
+        line1.append(f'<span class="{COLOUR_CSS[colour]}">{seq1[start:end]}</span>')
+        line2.append(f'<span class="{COLOUR_CSS[colour]}">{seq2[start:end]}</span>')
+    if line1:
+        colour_coded_alignment.append(f"{query}: {''.join(line1)}<br>{subject}: {''.join(line2)}<br><br>")
 
     # Combine the wrapped and color-coded alignment into a single string
-    wrapped_alignment = "".join(colour_coded_alignment)
+    return "".join(colour_coded_alignment)
+
+def colour_code_alignment(alignment_pair,query, subject):
+    """
+    Compare the sequences and apply colour coding.
+    Calculate percentages for the pie chart.
+    Columns are classified through colour_class_table() in one pass, which
+    also gives the counts; every run of one class within a wrapped line
+    becomes a single span with the CSS class of COLOUR_CSS.
+    """
+    seq1, seq2 = alignment_pair
+    classes = colour_classes(seq1, seq2)
+    return colour_spans(seq1, seq2, classes, query, subject), colour_stats(classes, len(seq1))
+
+def pack_colour_classes(classes):
+    """
+    Column classes packed COLOUR_CLASS_BITS bits per column, most significant
+    bit first, as base64: the class array of the compact alignment view.
+    """
+    bits = np.unpackbits(np.asarray(classes, dtype=np.uint8)[:, None], axis=1)[:, -COLOUR_CLASS_BITS:]
+    return base64.b64encode(np.packbits(bits.ravel()).tobytes()).decode('ascii')
+
+def colour_code_compact(alignment_pair, classes=None):
+    """
+    Compact alignment view of two aligned rows (or a window of them): the
+    rows and their packed column classes, coloured by the browser.
+    """
+    seq1, seq2 = alignment_pair[:2]
+    if classes is None:
+        classes = colour_classes(seq1, seq2)
+    return {
+        "rows": [seq1, seq2],
+        "classes": pack_colour_classes(classes),
+        "class_bits": COLOUR_CLASS_BITS
+    }
 
-    return wrapped_alignment, stats
+def colour_code_window(alignment_window, query, subject, classes=None):
+    """
+    Colour-coded HTML of one window of a pair, as returned by
+    extract_alignment_window. Only the window's columns are classified,
+    unless their classes are given.
+    """
+    seq1, seq2 = alignment_window[:2]
+    if classes is None:
+        classes = colour_classes(seq1, seq2)
+    return colour_spans(seq1, seq2, classes, query, subject)
@@ -0,0 +1,161 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+#utils/kmer_sketch.py
+import numpy as np
+import pandas as pd
+from app.utils.linear_aligner import kmer_codes
+
+KMER_SIZE = 14
+NUM_HASHES = 256
+SEED = 0x5EED
+
+# Value of a sketch bin no k-mer hashed into
+EMPTY = np.iinfo(np.uint64).max
+
+# Sequences compared against all to estimate the aligned pairs of an upload
+SAMPLE_ROWS = 64
+
+# Largest boolean block (rows x sequences x bins) compared at once
+# and number of k-mers hashed at once
+COMPARE_CELLS = 1 << 25
+HASH_CHUNK = 1 << 20
+
+
+def _mix64(values):
+    """splitmix64 finaliser, wrapping uint64 arithmetic."""
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def sketch_sequences(sequences, k=KMER_SIZE, num_hashes=NUM_HASHES):
+    """
+    One-permutation MinHash sketches of the distinct ACGT k-mers of each
+    sequence, as an (N, num_hashes) uint64 array. Every k-mer is hashed once;
+    the top bits pick one of num_hashes bins (a power of two) and each bin
+    keeps its smallest hash. Empty bins, and all bins of a sequence without
+    a complete k-mer, hold EMPTY.
+    """
+    if num_hashes & (num_hashes - 1):
+        raise ValueError("The number of sketch bins must be a power of two.")
+    shift = np.uint64(64 - (num_hashes.bit_length() - 1))
+    sketches = np.full((len(sequences), num_hashes), EMPTY, dtype=np.uint64)
+
+    rows, kmers, pending = [], [], 0
+    for row, sequence in enumerate(sequences):
+        codes = kmer_codes(str(sequence).upper(), k)
+        codes = np.unique(codes[codes >= 0]).astype(np.uint64)
+        rows.append(np.full(len(codes), row, dtype=np.uint64))
+        kmers.append(codes)
+        pending += len(codes)
+        if pending >= HASH_CHUNK or row == len(sequences) - 1:
+            _fill_bins(sketches, np.concatenate(rows), np.concatenate(kmers), shift, num_hashes)
+            rows, kmers, pending = [], [], 0
+    return sketches
+
+
+def _fill_bins(sketches, rows, kmers, shift, num_hashes):
+    hashes = _mix64(kmers ^ np.uint64(SEED))
+    slots = rows * np.uint64(num_hashes) + (hashes >> shift)
+    order = np.lexsort((hashes, slots))
+    slots, hashes = slots[order], hashes[order]
+    first = np.ones(len(slots), dtype=bool)
+    first[1:] = slots[1:] != slots[:-1]
+    sketches.reshape(-1)[slots[first].astype(np.int64)] = hashes[first]
+
+
+def approximate_identity(sketches, k=KMER_SIZE):
+    """
+    N x N approximate percent identity from MinHash sketches.
+
+    The Jaccard index J of two k-mer sets is estimated as the fraction of
+    equal bins among the bins filled in either sketch, and converted with
+    the Mash distance D = -ln(2J / (1 + J)) / k, identity = 100 * (1 - D).
+    Pairs without shared k-mers are 0; rows of sequences without k-mers
+    are NaN.
+    """
+    return identity_rows(sketches, np.arange(len(sketches)), k)
+
+
+def identity_rows(sketches, rows, k=KMER_SIZE):
+    """Rows (sequence indices) of the approximate_identity matrix, against every sequence."""
+    n, num_hashes = sketches.shape
+    rows = np.asarray(rows, dtype=np.int64)
+    jaccard = np.empty((len(rows), n), dtype=np.float64)
+    block = max(1, COMPARE_CELLS // max(1, n * num_hashes))
+    for start in range(0, len(rows), block):
+        block_rows = sketches[rows[start:start + block], None, :]
+        matches = ((block_rows == sketches[None, :, :]) & (block_rows != EMPTY)).sum(axis=2)
+        filled = ((block_rows != EMPTY) | (sketches[None, :, :] != EMPTY)).sum(axis=2)
+        jaccard[start:start + block] = matches / np.maximum(filled, 1)
+
+    with np.errstate(divide="ignore"):
+        distance = -np.log(2 * jaccard / (1 + jaccard)) / k
+    identity = np.clip(100.0 * (1.0 - distance), 0.0, 100.0)
+
+    empty = (sketches == EMPTY).all(axis=1)
+    identity[empty[rows], :] = np.nan
+    identity[:, empty] = np.nan
+    identity[np.arange(len(rows)), rows] = 100.0
+    return identity
+
+
+def sampled_pairs_above(sketches, threshold, sample_rows=SAMPLE_ROWS, k=KMER_SIZE):
+    """
+    (pairs, scale): index pairs at or above threshold among up to sample_rows
+    evenly spaced sequences against all, standing for scale times as many
+    pairs of the whole matrix. Estimates the pairs approximate mode aligns
+    without computing all N x N identities; exact (scale 1) up to sample_rows.
+    """
+    n = len(sketches)
+    if n <= sample_rows:
+        return pairs_above(approximate_identity(sketches, k), threshold), 1.0
+    rows = np.linspace(0, n - 1, sample_rows).astype(np.int64)
+    identity = np.nan_to_num(identity_rows(sketches, rows, k), nan=-1.0)
+    identity[np.arange(len(rows)), rows] = -1.0
+    sampled, columns = np.nonzero(identity >= threshold)
+    # Every pair of the matrix is seen from either of its rows
+    return list(zip(rows[sampled].tolist(), columns.tolist())), n / (2 * len(rows))
+
+
+def pairs_above(identity, threshold):
+    """Index pairs (i, j), i < j, whose approximate identity is >= threshold."""
+    rows, cols = np.nonzero(np.triu(np.nan_to_num(identity, nan=-1.0) >= threshold, k=1))
+    return list(zip(rows.tolist(), cols.tolist()))
+
+
+def identity_matrix_frame(identity, ids, columns=None):
+    """
+    Approximate identity as the string matrix written like the ratio matrix.
+    columns are the ids of the columns when identity is a block of the matrix.
+    """
+    columns = ids if columns is None else columns
+    cells = np.where(np.isnan(identity), "-", np.char.mod("%.1f", np.nan_to_num(identity)))
+    cells[np.array(ids, dtype=object)[:, None] == np.array(columns, dtype=object)[None, :]] = "-"
+    return pd.DataFrame(cells, index=ids, columns=columns)
+
+
+def save_sketches(path, ids, sketches, k=KMER_SIZE):
+    np.savez(path, ids=np.array(ids), sketches=sketches, kmer_size=k)
+
+
+def load_sketches(path):
+    """(ids, sketches, k) as written by save_sketches."""
+    with np.load(path) as data:
+        return data["ids"].tolist(), data["sketches"], int(data["kmer_size"])
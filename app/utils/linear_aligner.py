@@ -0,0 +1,324 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+#utils/linear_aligner.py
+import numpy as np
+from app.utils.native_aligner import AlignmentResult, ednafull_table
+
+INF = 1e18
+
+# Sub-problems up to this many DP cells are solved with a full traceback
+# matrix (5 bytes per cell), which bounds memory independently of length.
+BLOCK_CELLS = 1 << 20
+
+KMER_SIZE = 12
+BAND_PADDING = 256
+
+
+def _encode(sequence):
+    return np.frombuffer(sequence.encode("ascii"), dtype=np.uint8)
+
+
+def kmer_codes(sequence, k):
+    """2-bit packed k-mers of sequence; k-mers with non-ACGT bases are -1."""
+    lookup = np.full(256, 4, dtype=np.int64)
+    for code, base in enumerate("ACGT"):
+        lookup[ord(base)] = lookup[ord(base.lower())] = code
+    values = lookup[_encode(sequence)]
+    if len(values) < k:
+        return np.empty(0, dtype=np.int64)
+    windows = np.lib.stride_tricks.sliding_window_view(values, k)
+    kmers = windows @ (4 ** np.arange(k - 1, -1, -1, dtype=np.int64))
+    kmers[(windows == 4).any(axis=1)] = -1
+    return kmers
+
+
+def _unique_kmers(kmers):
+    """Positions of k-mers that occur exactly once."""
+    values, first, counts = np.unique(kmers, return_index=True, return_counts=True)
+    keep = (counts == 1) & (values >= 0)
+    return values[keep], first[keep]
+
+
+def estimate_band(qseq, sseq, k=KMER_SIZE, padding=BAND_PADDING, min_anchors=8):
+    """
+    Estimate the range of diagonals (j - i) an alignment of qseq and sseq
+    stays in, from k-mers that occur once in both sequences.
+
+    Returns (lo, hi) or None when there are too few shared k-mers to trust.
+    The band always contains both DP corners (diagonals 0 and N - M).
+    """
+    q_values, q_pos = _unique_kmers(kmer_codes(qseq, k))
+    s_values, s_pos = _unique_kmers(kmer_codes(sseq, k))
+    _, q_idx, s_idx = np.intersect1d(q_values, s_values, assume_unique=True, return_indices=True)
+    if len(q_idx) < min_anchors:
+        return None
+
+    diagonals = s_pos[s_idx] - q_pos[q_idx]
+    low, high = np.percentile(diagonals, [0.5, 99.5])
+    corner = len(sseq) - len(qseq)
+    lo = int(min(low, 0, corner)) - padding
+    hi = int(max(high, 0, corner)) + padding
+    return max(lo, -len(qseq)), min(hi, len(sseq))
+
+
+class _Aligner:
+    """
+    Myers-Miller divide and conquer for affine gaps in linear space.
+
+    Costs are minimised: a substitution costs -score and a gap of length k
+    costs g + h * k with g = gap_open - gap_extend and h = gap_extend, which
+    is EMBOSS' gap_open + (k - 1) * gap_extend. End gaps are penalised, as in
+    stretcher. The optional band restricts cells to lo <= j - i <= hi in
+    whole-alignment coordinates.
+    """
+
+    def __init__(self, qseq, sseq, gap_open, gap_extend, band=None):
+        self.qseq = qseq
+        self.sseq = sseq
+        self.a = _encode(qseq)
+        self.b = _encode(sseq)
+        self.cost = -ednafull_table()
+        self.g = float(gap_open) - float(gap_extend)
+        self.h = float(gap_extend)
+        self.band = band
+        self.q_parts = []
+        self.s_parts = []
+
+    def align(self):
+        self._diff(0, len(self.a), 0, len(self.b), self.g, self.g)
+        return "".join(self.q_parts), "".join(self.s_parts)
+
+    def _emit(self, qpart, spart):
+        self.q_parts.append(qpart)
+        self.s_parts.append(spart)
+
+    def _delete(self, i0, i1):
+        self._emit(self.qseq[i0:i1], "-" * (i1 - i0))
+
+    def _insert(self, j0, j1):
+        self._emit("-" * (j1 - j0), self.sseq[j0:j1])
+
+    def _local_band(self, i0, j0):
+        if self.band is None:
+            return None
+        offset = j0 - i0
+        return self.band[0] - offset, self.band[1] - offset
+
+    def _diff(self, i0, i1, j0, j1, tb, te):
+        m, n = i1 - i0, j1 - j0
+        if n == 0:
+            if m > 0:
+                self._delete(i0, i1)
+            return
+        if m == 0:
+            self._insert(j0, j1)
+            return
+        if m <= 1 or m * n <= BLOCK_CELLS:
+            self._block(i0, i1, j0, j1, tb, te)
+            return
+
+        imid = m // 2
+        band = self._local_band(i0, j0)
+        reverse_band = None if band is None else (n - m - band[1], n - m - band[0])
+
+        cc, dd = self._last_row(self.a[i0:i0 + imid], self.b[j0:j1], tb, band)
+        rr, ss = self._last_row(self.a[i0 + imid:i1][::-1], self.b[j0:j1][::-1], te, reverse_band)
+
+        through_cell = cc + rr[::-1]
+        through_gap = dd + ss[::-1] - self.g
+        j = int(np.argmin(np.minimum(through_cell, through_gap)))
+
+        if through_cell[j] <= through_gap[j]:
+            self._diff(i0, i0 + imid, j0, j0 + j, tb, self.g)
+            self._diff(i0 + imid, i1, j0 + j, j1, self.g, te)
+        else:
+            # The optimal path crosses the middle row inside a vertical gap
+            self._diff(i0, i0 + imid - 1, j0, j0 + j, tb, 0.0)
+            self._delete(i0 + imid - 1, i0 + imid + 1)
+            self._diff(i0 + imid + 1, i1, j0 + j, j1, 0.0, te)
+
+    def _last_row(self, a, b, tb, band):
+        """
+        Costs of aligning all of a with each prefix of b: CC (any ending)
+        and DD (ending in a gap in b). Rows are vectorised; horizontal gaps
+        come from a running minimum along the row.
+        """
+        g, h = self.g, self.h
+        m, n = len(a), len(b)
+        lo, hi = (-m, n) if band is None else band
+        steps = h * np.arange(n + 1)
+
+        cc = np.full(n + 1, INF)
+        dd = np.full(n + 1, INF)
+        right = min(n, hi)
+        cc[:right + 1] = g + steps[:right + 1]
+        cc[0] = 0.0
+        dd[:right + 1] = cc[:right + 1] + g
+
+        left = 0
+        for i in range(1, m + 1):
+            left = max(0, i + lo)
+            right = min(n, i + hi)
+            if left > right:
+                continue
+            first = max(left, 1)
+            cols = slice(first, right + 1)
+
+            vertical = np.minimum(dd[cols], cc[cols] + g) + h
+            diagonal = cc[first - 1:right] + self.cost[a[i - 1], b[first - 1:right]]
+            best = np.minimum(vertical, diagonal)
+            if left == 0:
+                best = np.concatenate(([tb + h * i], best))
+
+            # E[j] = g + h*j + min over k < j of (best[k] - h*k)
+            horizontal = np.full(len(best), INF)
+            if len(best) > 1:
+                running = np.minimum.accumulate(best[:-1] - steps[left:right])
+                horizontal[1:] = g + steps[left + 1:right + 1] + running
+            cc[left:right + 1] = np.minimum(best, horizontal)
+            dd[cols] = vertical
+
+        cc[:left] = INF
+        dd[:left] = INF
+        dd[0] = cc[0]
+        return cc, dd
+
+    def _block(self, i0, i1, j0, j1, tb, te):
+        """Full-matrix affine DP with traceback for a small sub-problem."""
+        g, h = self.g, self.h
+        a = self.a[i0:i1]
+        b = self.b[j0:j1]
+        m, n = len(a), len(b)
+        steps = h * np.arange(n + 1)
+        columns = np.arange(n + 1)
+
+        # moves: bits 0-1 = 0 diagonal, 1 vertical, 2 horizontal;
+        # bit 2 = vertical gap extended; bit 3 = non-horizontal best is vertical
+        moves = np.zeros((m + 1, n + 1), dtype=np.uint8)
+        opened_at = np.zeros((m + 1, n + 1), dtype=np.int32)
+
+        cc = g + steps
+        cc[0] = 0.0
+        dd = cc + g
+        for i in range(1, m + 1):
+            start = tb + h * i
+            candidate = cc + g
+            vertical = np.minimum(dd, candidate) + h
+            diagonal = cc[:-1] + self.cost[a[i - 1], b]
+
+            best = np.empty(n + 1)
+            best[0] = start
+            best[1:] = np.minimum(vertical[1:], diagonal)
+
+            shifted = best - steps
+            running = np.minimum.accumulate(shifted)
+            last_min = np.maximum.accumulate(np.where(shifted == running, columns, 0))
+            horizontal = np.full(n + 1, INF)
+            horizontal[1:] = g + steps[1:] + running[:-1]
+
+            row = moves[i]
+            row[1:] = (vertical[1:] < diagonal).view(np.uint8) << 3
+            row |= (dd < candidate).view(np.uint8) << 2
+            row[1:] |= np.where(horizontal[1:] < best[1:], 2, row[1:] >> 3).astype(np.uint8)
+            row[0] = 1 | 4
+            opened_at[i, 1:] = last_min[:-1]
+
+            cc = np.minimum(best, horizontal)
+            dd = vertical
+            dd[0] = start
+
+        # A final vertical gap may continue into the gap below (te)
+        state = "vertical" if dd[n] - g + te < cc[n] else None
+        i, j = m, n
+        q_parts, s_parts = [], []
+        while i > 0 and j > 0:
+            code = moves[i, j]
+            if state == "vertical":
+                move = 1
+            elif state == "no_horizontal":
+                move = 1 if code & 8 else 0
+            else:
+                move = code & 3
+
+            if move == 0:
+                i -= 1
+                j -= 1
+                q_parts.append(self.qseq[i0 + i])
+                s_parts.append(self.sseq[j0 + j])
+                state = None
+            elif move == 1:
+                i -= 1
+                q_parts.append(self.qseq[i0 + i])
+                s_parts.append("-")
+                state = "vertical" if code & 4 else None
+            else:
+                k = int(opened_at[i, j])
+                q_parts.append("-" * (j - k))
+                s_parts.append(self.sseq[j0 + k:j0 + j][::-1])
+                j = k
+                state = "no_horizontal"
+        if i > 0:
+            q_parts.append(self.qseq[i0:i0 + i][::-1])
+            s_parts.append("-" * i)
+        if j > 0:
+            q_parts.append("-" * j)
+            s_parts.append(self.sseq[j0:j0 + j][::-1])
+        self._emit("".join(q_parts)[::-1], "".join(s_parts)[::-1])
+
+
+def linear_global_align(qseq, sseq, gap_open, gap_extend, band="auto"):
+    """
+    Global alignment in O(len(qseq) + len(sseq)) memory.
+
+    band="auto" derives a diagonal band from shared k-mers (falling back to
+    the full matrix when the sequences share too few), None disables it and
+    a (lo, hi) tuple is used as given.
+
+    Returns (qaln, saln).
+    """
+    if gap_open < gap_extend:
+        raise ValueError("Gap Open must be >= Gap Extend for the linear-memory aligner")
+    if band == "auto":
+        band = estimate_band(qseq, sseq)
+    return _Aligner(qseq, sseq, gap_open, gap_extend, band).align()
+
+
+def alignment_score(qaln, saln, gap_open, gap_extend):
+    """EDNAFULL score of an alignment with every gap penalised."""
+    table = ednafull_table()
+    q = _encode(qaln)
+    s = _encode(saln)
+    gap = ord("-")
+    aligned = (q != gap) & (s != gap)
+    score = table[q[aligned], s[aligned]].sum()
+    for row in (q, s):
+        is_gap = (row == gap).astype(np.int8)
+        opens = np.count_nonzero(np.diff(is_gap, prepend=0) == 1)
+        score -= opens * gap_open + (is_gap.sum() - opens) * gap_extend
+    return float(score)
+
+
+def linear_align(qid, sid, qseq, sseq, gap_open, gap_extend):
+    """
+    Linear-memory replacement for psa.stretcher: same scoring, same fasta() contract.
+    Sequences are aligned upper-cased, as the statistics only count upper-case bases.
+    """
+    qseq, sseq = qseq.upper(), sseq.upper()
+    qaln, saln = linear_global_align(qseq, sseq, gap_open, gap_extend)
+    return AlignmentResult(qid, sid, qseq, sseq, qaln, saln,
+                           score=alignment_score(qaln, saln, gap_open, gap_extend),
+                           program="linear", gapopen=gap_open, gapextend=gap_extend)
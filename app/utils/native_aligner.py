@@ -0,0 +1,316 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+#utils/native_aligner.py
+import numpy as np
+from Bio.Align import substitution_matrices
+
+NEG_INF = -1e18
+
+# Traceback codes stored per cell: bits 0-1 give the source of H
+# (0 = diagonal, 1 = E, 2 = F), bits 2/3 flag an extended E/F gap and
+# bits 4/5 mark the best non-E/non-F predecessor as an F/E gap.
+FROM_DIAG, FROM_E, FROM_F = 0, 1, 2
+E_EXTENDED, F_EXTENDED = 4, 8
+NO_E_FROM_F, NO_F_FROM_E = 16, 32
+AFTER_E, AFTER_F = 3, 5
+
+_SCORE_TABLE = None
+
+
+def ednafull_table():
+    """
+    256x256 score lookup for EDNAFULL, indexed by the ASCII codes of two bases.
+    Lowercase is scored like uppercase, U like T and unknown symbols like N.
+    """
+    global _SCORE_TABLE
+    if _SCORE_TABLE is None:
+        matrix = substitution_matrices.load("NUC.4.4")
+        alphabet = matrix.alphabet
+        index = np.full(256, alphabet.index("N"), dtype=np.intp)
+        for i, base in enumerate(alphabet):
+            index[ord(base)] = i
+            index[ord(base.lower())] = i
+        index[ord("U")] = index[ord("u")] = alphabet.index("T")
+        scores = np.asarray(matrix, dtype=np.float64)
+        _SCORE_TABLE = scores[np.ix_(index, index)]
+    return _SCORE_TABLE
+
+
+def _encode(sequence):
+    return np.frombuffer(sequence.encode("ascii"), dtype=np.uint8)
+
+
+class AlignmentResult:
+    """
+    Pairwise alignment with the attributes of psa.PairwiseAlignment that the
+    pipeline relies on, including the same fasta() output.
+    """
+
+    def __init__(self, qid, sid, qseq, sseq, qaln, saln, score=None, program="native",
+                 gapopen=None, gapextend=None, matrix="EDNAFULL"):
+        self.qid = qid
+        self.sid = sid
+        self.qseq = qseq
+        self.sseq = sseq
+        self.qaln = qaln
+        self.saln = saln
+        self.qlen = len(qseq)
+        self.slen = len(sseq)
+        self.qstart = 1 if self.qlen else 0
+        self.qend = self.qlen
+        self.sstart = 1 if self.slen else 0
+        self.send = self.slen
+        self.length = len(qaln)
+        self.score = score
+        self.program = program
+        self.gapopen = gapopen
+        self.gapextend = gapextend
+        self.matrix = matrix
+
+    def fasta(self, wrap=70):
+        """Returns pairwise alignment in FASTA/Pearson format."""
+        lst = [
+            f'>{self.qid} {self.qstart}-{self.qend}',
+            *(self.qaln[i:i + wrap] for i in range(0, self.length, wrap)),
+            f'>{self.sid} {self.sstart}-{self.send}',
+            *(self.saln[i:i + wrap] for i in range(0, self.length, wrap)),
+        ]
+        return "\n".join(lst)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return iter(zip(self.qaln, self.saln))
+
+
+def global_align(qseq, sseq, gap_open, gap_extend, penalize_end_gaps=False):
+    """
+    Affine-gap global alignment (Gotoh) with the EDNAFULL matrix.
+
+    A gap of length k costs gap_open + (k - 1) * gap_extend, as in EMBOSS.
+    End gaps are free unless penalize_end_gaps is set, matching needle's
+    default (-endweight N). The DP is filled one anti-diagonal at a time so
+    every cell of a diagonal is computed by the same NumPy operations.
+
+    Returns (qaln, saln, score).
+    """
+    n, m = len(qseq), len(sseq)
+    if n == 0 or m == 0:
+        end_cost = 0.0 if not penalize_end_gaps or n + m == 0 else gap_open + (n + m - 1) * gap_extend
+        return qseq + "-" * m, "-" * n + sseq, -end_cost
+
+    table = ednafull_table()
+    a = _encode(qseq)
+    b_rev = _encode(sseq)[::-1].copy()
+    gap_open = float(gap_open)
+    gap_extend = float(gap_extend)
+
+    def boundary(k):
+        if k == 0 or not penalize_end_gaps:
+            return 0.0
+        return -(gap_open + (k - 1) * gap_extend)
+
+    # Rotating anti-diagonal buffers indexed by the query position i.
+    # A gap may only open from a cell that does not already end in a gap of
+    # the same direction (hx excludes E, hy excludes F), otherwise two
+    # abutting gaps would be scored as separate openings.
+    h_prev2 = np.full(n + 1, NEG_INF)
+    h_prev = np.full(n + 1, NEG_INF)
+    h_cur = np.full(n + 1, NEG_INF)
+    hx_prev = np.full(n + 1, NEG_INF)
+    hx_cur = np.full(n + 1, NEG_INF)
+    hy_prev = np.full(n + 1, NEG_INF)
+    hy_cur = np.full(n + 1, NEG_INF)
+    e_prev = np.full(n + 1, NEG_INF)
+    e_cur = np.full(n + 1, NEG_INF)
+    f_prev = np.full(n + 1, NEG_INF)
+    f_cur = np.full(n + 1, NEG_INF)
+
+    # Gap costs of the free end rows/columns
+    end_open = gap_open if penalize_end_gaps else 0.0
+    end_extend = gap_extend if penalize_end_gaps else 0.0
+
+    traceback = np.zeros((n + 1) * (m + 1), dtype=np.uint8)
+
+    # Diagonals 0 and 1 only hold boundary cells
+    h_prev2[0] = 0.0
+    h_prev[0] = e_prev[0] = hy_prev[0] = boundary(1)
+    h_prev[1] = f_prev[1] = hx_prev[1] = boundary(1)
+    f_prev[0] = hx_prev[0] = NEG_INF
+    e_prev[1] = hy_prev[1] = NEG_INF
+
+    for d in range(2, n + m + 1):
+        lo = max(1, d - m)
+        hi = min(n, d - 1)
+        if lo <= hi:
+            rows = slice(lo, hi + 1)
+            above = slice(lo - 1, hi)
+
+            diag = h_prev2[above] + table[a[lo - 1:hi], b_rev[m - d + lo:m - d + hi + 1]]
+
+            # E: gap in the query (horizontal move); the last row is an end gap
+            e_open = hx_prev[rows] - gap_open
+            e_ext = e_prev[rows] - gap_extend
+            if hi == n:
+                e_open[-1] = hx_prev[n] - end_open
+                e_ext[-1] = e_prev[n] - end_extend
+            e = np.maximum(e_open, e_ext)
+
+            # F: gap in the subject (vertical move); the last column is an end gap
+            f_open = hy_prev[above] - gap_open
+            f_ext = f_prev[above] - gap_extend
+            if lo == d - m:
+                f_open[0] = hy_prev[lo - 1] - end_open
+                f_ext[0] = f_prev[lo - 1] - end_extend
+            f = np.maximum(f_open, f_ext)
+
+            hx = np.maximum(diag, f)
+            hy = np.maximum(diag, e)
+            h = np.maximum(hx, e)
+
+            # Boolean arrays viewed as uint8 give the flag bits without copies
+            f_beats_diag = f > diag
+            e_beats_diag = e > diag
+            via_f = f_beats_diag & (f > e)
+            code = (e_beats_diag | f_beats_diag).view(np.uint8) + via_f.view(np.uint8)
+            code |= (e_ext > e_open).view(np.uint8) << 2
+            code |= (f_ext > f_open).view(np.uint8) << 3
+            code |= f_beats_diag.view(np.uint8) << 4
+            code |= e_beats_diag.view(np.uint8) << 5
+            # Cell (i, d - i) lives at flat index i * (m + 1) + d - i = d + i * m
+            traceback[d + lo * m:d + hi * m + 1:m] = code
+
+            h_cur[rows] = h
+            hx_cur[rows] = hx
+            hy_cur[rows] = hy
+            e_cur[rows] = e
+            f_cur[rows] = f
+
+        # Boundary cells on this diagonal
+        if d <= m:
+            h_cur[0] = e_cur[0] = hy_cur[0] = boundary(d)
+            f_cur[0] = hx_cur[0] = NEG_INF
+        if d <= n:
+            h_cur[d] = f_cur[d] = hx_cur[d] = boundary(d)
+            e_cur[d] = hy_cur[d] = NEG_INF
+
+        h_prev2, h_prev, h_cur = h_prev, h_cur, h_prev2
+        hx_prev, hx_cur = hx_cur, hx_prev
+        hy_prev, hy_cur = hy_cur, hy_prev
+        e_prev, e_cur = e_cur, e_prev
+        f_prev, f_cur = f_cur, f_prev
+
+    score = float(h_prev[n])
+    qaln, saln = _traceback(traceback.reshape(n + 1, m + 1), qseq, sseq)
+    return qaln, saln, score
+
+
+def ungapped_score(qseq, sseq, gap_open, gap_extend, penalize_end_gaps=False):
+    """
+    Score of the gap-free alignment of two equal-length sequences when it is
+    provably the unique optimal global alignment, else None.
+
+    An alignment with g >= 1 gap columns in each sequence aligns g fewer
+    pairs, each scoring at most the best matrix entry, so it cannot beat the
+    gap-free one once the gap-free deficit (best score minus pair score,
+    summed) is below best + the cheapest possible gap cost. With free end
+    gaps the alignments that only use end gaps are checked exactly.
+    """
+    n = len(qseq)
+    if n == 0 or n != len(sseq):
+        return None
+    table = ednafull_table()
+    a = _encode(qseq)
+    b = _encode(sseq)
+    scores = table[a, b]
+    best = table.max()
+    total = scores.sum()
+    deficit = (best - scores).sum()
+    min_gap_cost = 2 * gap_open if penalize_end_gaps else gap_open
+    if deficit >= best + min_gap_cost:
+        return None
+
+    if not penalize_end_gaps:
+        # Dropping a prefix or suffix of the diagonal into free end gaps
+        prefix = np.cumsum(scores)
+        suffix = total - np.concatenate(([0.0], prefix[:-1]))
+        if prefix.min() <= 0 or suffix.min() <= 0:
+            return None
+        # A run on a shifted diagonal scores at most best * (n - shift)
+        for shift in range(1, int(deficit // best) + 1):
+            for run in (table[a[shift:], b[:n - shift]], table[a[:n - shift], b[shift:]]):
+                sums = np.concatenate(([0.0], np.cumsum(run)))
+                if (sums - np.minimum.accumulate(sums)).max() >= total:
+                    return None
+    return float(total)
+
+
+def _traceback(traceback, qseq, sseq):
+    """Walk the traceback codes back from the bottom-right cell."""
+    i, j = len(qseq), len(sseq)
+    qaln, saln = [], []
+    # The state says how the current cell was entered: any way (H), or not
+    # through a gap of the direction that was just closed (AFTER_E/AFTER_F).
+    state = None
+    while i > 0 and j > 0:
+        code = traceback[i, j]
+        if state is None:
+            move = code & 3
+        elif state == AFTER_E:
+            move = FROM_F if code & NO_E_FROM_F else FROM_DIAG
+        elif state == AFTER_F:
+            move = FROM_E if code & NO_F_FROM_E else FROM_DIAG
+        else:
+            move = state
+
+        if move == FROM_DIAG:
+            i -= 1
+            j -= 1
+            qaln.append(qseq[i])
+            saln.append(sseq[j])
+            state = None
+        elif move == FROM_E:
+            j -= 1
+            qaln.append("-")
+            saln.append(sseq[j])
+            state = FROM_E if code & E_EXTENDED else AFTER_E
+        else:
+            i -= 1
+            qaln.append(qseq[i])
+            saln.append("-")
+            state = FROM_F if code & F_EXTENDED else AFTER_F
+    while i > 0:
+        i -= 1
+        qaln.append(qseq[i])
+        saln.append("-")
+    while j > 0:
+        j -= 1
+        qaln.append("-")
+        saln.append(sseq[j])
+    return "".join(reversed(qaln)), "".join(reversed(saln))
+
+
+def native_align(qid, sid, qseq, sseq, gap_open, gap_extend):
+    """
+    In-process replacement for psa.needle: same scoring, same fasta() contract.
+    Sequences are aligned upper-cased, as the statistics only count upper-case bases.
+    """
+    qseq, sseq = qseq.upper(), sseq.upper()
+    qaln, saln, score = global_align(qseq, sseq, gap_open, gap_extend)
+    return AlignmentResult(qid, sid, qseq, sseq, qaln, saln, score=score,
+                           gapopen=gap_open, gapextend=gap_extend)
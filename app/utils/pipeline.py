@@ -0,0 +1,512 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+#utils/pipeline.py
+import os
+import json
+import fcntl
+import shutil
+import hashlib
+import logging
+from contextlib import contextmanager
+from app.utils import file_handlers, native_aligner, linear_aligner, kmer_sketch, alignment_store, result_store
+from app.utils.file_handlers import (process_fasta_file, append_fasta_alignments, append_pair_alignments,
+                                     calculate_transitions_transversions, merge_transitions_transversions,
+                                     export_result)
+from app.utils.alignment_store import AlignmentStore
+from app.utils.result_store import COLUMNS_NAME, write_identity, read_identity
+from app.utils.kmer_sketch import load_sketches, approximate_identity, pairs_above
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+SKETCHES_NAME = "sketches.npz"
+SELECTED_PAIRS_NAME = "selected_pairs.json"
+LOCK_NAME = ".lock"
+
+# session_data columns written by each stage, in pipeline order
+STAGE_OUTPUTS = {
+    "approximate": ['approx_identity_store_path'],
+    "alignment": ['alignment_store_path'],
+    "statistics": ['statistics_store_path'],
+}
+
+# Workbooks exported from the result stores on first download: file name ->
+# (session_data column of its path or None to keep it next to the results
+# under its file name, column of the store it is exported from)
+RESULT_EXPORT_PATHS = {
+    "nucleotide.xlsx": ('nucleotide_matrix_path', 'statistics_store_path'),
+    "nucleotide_long.xlsx": (None, 'statistics_store_path'),
+    "transratio.xlsx": ('transratio_matrix_path', 'statistics_store_path'),
+    "summary_features.xlsx": ('summary_features_path', 'statistics_store_path'),
+    "summary_alignment.xlsx": ('summary_alignment_path', 'statistics_store_path'),
+    "approx_identity.xlsx": ('approx_identity_path', 'approx_identity_store_path'),
+}
+
+_CODE_VERSION = None
+
+
+def code_version():
+    """Hash of the modules that produce the pipeline outputs."""
+    global _CODE_VERSION
+    if _CODE_VERSION is None:
+        digest = hashlib.sha256()
+        for module in (file_handlers, native_aligner, linear_aligner, kmer_sketch, alignment_store, result_store):
+            with open(module.__file__, 'rb') as f:
+                digest.update(f.read())
+        with open(__file__, 'rb') as f:
+            digest.update(f.read())
+        _CODE_VERSION = digest.hexdigest()
+    return _CODE_VERSION
+
+
+def fasta_digest(path):
+    """
+    sha256 of a FASTA file up to formatting: line endings, trailing spaces
+    and sequence line wrapping do not change it, so equal records hash equal.
+    """
+    digest = hashlib.sha256()
+    sequence = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.rstrip()
+            if line.startswith(">"):
+                digest.update("".join(sequence).encode() + b"\n" + line.encode() + b"\n")
+                sequence = []
+            else:
+                sequence.append("".join(line.split()))
+    digest.update("".join(sequence).encode())
+    return digest.hexdigest()
+
+
+def submission_fingerprint(upload_path, psa_program, gap_open, gap_extend, comparison_mode="full",
+                           identity_threshold=None, reference_id=None):
+    """
+    Identity of a submission: sessions with the same fingerprint produce the
+    same outputs and share one results bundle.
+    """
+    submission = {
+        "upload": fasta_digest(upload_path),
+        "psa_program": psa_program,
+        "gap_open": float(gap_open),
+        "gap_extend": float(gap_extend),
+        "comparison_mode": comparison_mode,
+        "identity_threshold": identity_threshold,
+        "reference_id": reference_id,
+        "code_version": code_version(),
+    }
+    return hashlib.sha256(json.dumps(submission, sort_keys=True).encode()).hexdigest()
+
+
+def pipeline_inputs(session_data):
+    """Everything the outputs of a session depend on."""
+    inputs = {
+        "upload_sha256": fasta_digest(session_data['upload_file_path']),
+        "psa_program": session_data['psa_program'],
+        "gap_open": session_data['gap_open'],
+        "gap_extend": session_data['gap_extend'],
+        "code_version": code_version(),
+    }
+    if is_approximate(session_data):
+        inputs["identity_threshold"] = session_data['identity_threshold']
+        inputs["selected_pairs"] = load_selected_pairs(session_data)
+    if reference_of(session_data):
+        inputs["reference_id"] = reference_of(session_data)
+    return inputs
+
+
+def is_approximate(session_data):
+    return session_data.get('comparison_mode') == 'approximate'
+
+
+def reference_of(session_data):
+    """Reference query id of a reference-vs-all session, else None."""
+    if session_data.get('comparison_mode') == 'reference':
+        return session_data['reference_id']
+    return None
+
+
+def reference_pairs(session_data):
+    """(reference, query) pairs of a reference-vs-all session, in upload order."""
+    reference = reference_of(session_data)
+    # Counted from the upload, which may have grown since num_sequences was stored
+    with open(session_data['upload_file_path'], 'r') as upload_file:
+        num_sequences = sum(1 for line in upload_file if line.startswith(">"))
+    ids = [f"query{i+1:03d}" for i in range(num_sequences)]
+    return [(reference, qid) for qid in ids if qid != reference]
+
+
+def pair_counts(session_data):
+    """(pairs aligned, pairs of an all-against-all run) of a session."""
+    num_sequences = session_data['num_sequences']
+    all_pairs = num_sequences * (num_sequences - 1) // 2
+    if reference_of(session_data):
+        return num_sequences - 1, all_pairs
+    return load_manifest(manifest_file(session_data)).get("pairs", all_pairs), all_pairs
+
+
+def session_stages(session_data):
+    """Stages of the session's comparison mode, in pipeline order."""
+    return [stage for stage in STAGE_OUTPUTS if stage != "approximate" or is_approximate(session_data)]
+
+
+def results_file(session_data, name):
+    return os.path.join(os.path.dirname(session_data['alignment_file_path']), name)
+
+
+def load_selected_pairs(session_data):
+    """Pairs the user asked to align in approximate mode, as [query, subject] lists."""
+    try:
+        with open(results_file(session_data, SELECTED_PAIRS_NAME), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return []
+
+
+def write_approximate_identity(session_data):
+    """Compute the N x N approximate identity of the session's sketches into its identity store."""
+    ids, sketches, k = load_sketches(results_file(session_data, SKETCHES_NAME))
+    write_identity(session_data['approx_identity_store_path'], ids, approximate_identity(sketches, k))
+
+
+def approximate_pairs(session_data):
+    """
+    Approximate mode plan of a session: (query ids, N x N approximate identity,
+    pairs to align). The pairs are those at or above the identity threshold
+    followed by the ones the user selected. The identity is read from the
+    identity store, written once by the approximate stage.
+    """
+    if not os.path.exists(session_data['approx_identity_store_path']):
+        write_approximate_identity(session_data)
+    ids, identity = read_identity(session_data['approx_identity_store_path'])
+    pairs = [(ids[i], ids[j]) for i, j in pairs_above(identity, session_data['identity_threshold'])]
+    planned = set(pairs)
+    pairs += [tuple(pair) for pair in load_selected_pairs(session_data) if tuple(pair) not in planned]
+    return ids, identity, pairs
+
+
+def output_signature(session_data, stage):
+    """
+    [path, size, mtime_ns] of each output of a stage, or None if one is
+    missing. Directory outputs contribute every file they contain. Paths are
+    relative to the results directory, so results copied out of a shared
+    bundle (with their sizes and mtimes) keep their signatures.
+    """
+    results_dir = results_file(session_data, "")
+    signature = []
+    for path in stage_outputs(session_data, stage):
+        files = [path]
+        if path and os.path.isdir(path):
+            files = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+        for file in files:
+            try:
+                stat = os.stat(file)
+            except (FileNotFoundError, TypeError):
+                return None
+            signature.append([os.path.relpath(file, results_dir), stat.st_size, stat.st_mtime_ns])
+    return signature
+
+
+def manifest_file(session_data):
+    return results_file(session_data, MANIFEST_NAME)
+
+
+def stage_outputs(session_data, stage):
+    return [session_data[column] for column in STAGE_OUTPUTS[stage]]
+
+
+def outputs_fresh(session_data):
+    """True when every stage's outputs are recorded for the current inputs."""
+    manifest = load_manifest(manifest_file(session_data))
+    if manifest.get("inputs") != pipeline_inputs(session_data):
+        return False
+    return all(manifest["stages"].get(stage) is not None
+               and manifest["stages"][stage] == output_signature(session_data, stage)
+               for stage in session_stages(session_data))
+
+
+def load_manifest(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_manifest(path, manifest):
+    """Write JSON through a temporary file so a crash never leaves half a manifest."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def results_lock(session_data, blocking=True):
+    """
+    Exclusive lock on the session's results directory, held while a job
+    writes to it. Sessions sharing a bundle wait for each other, so the
+    second one finds the outputs fresh instead of rewriting them. With
+    blocking=False, BlockingIOError is raised when the lock is held.
+    """
+    results_dir = os.path.dirname(session_data['alignment_file_path'])
+    os.makedirs(results_dir, exist_ok=True)
+    with open(os.path.join(results_dir, LOCK_NAME), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def run_pipeline(session_data, workers=1, executor="thread", cache=None, progress=None):
+    """Run _run_pipeline under the results lock."""
+    with results_lock(session_data):
+        _run_pipeline(session_data, workers=workers, executor=executor, cache=cache, progress=progress)
+
+
+def _run_pipeline(session_data, workers=1, executor="thread", cache=None, progress=None):
+    """
+    Align every pair of the uploaded sequences into the alignment store and
+    write the statistics workbooks of one session.
+    progress(done, total) is called as pairs are aligned. In approximate
+    mode the k-mer identity matrix is written first and only the pairs of
+    approximate_pairs are aligned.
+
+    A manifest of the inputs and of each stage's outputs is kept next to the
+    results; a stage is skipped while its outputs are unchanged since it
+    last ran with the same inputs, and every stage after a rerun runs too.
+    The alignments are kept in the session's binary alignment store. When
+    the alignment stage runs, the aligned pairs stream straight into the
+    statistics in the same pass; that stage then only records its outputs.
+    """
+    def align():
+        pairs = None
+        if is_approximate(session_data):
+            _, _, pairs = approximate_pairs(session_data)
+        elif reference_of(session_data):
+            pairs = reference_pairs(session_data)
+        process_fasta_file(session_data['upload_file_path'], None, None, session_data['psa_program'],
+                           session_data['gap_open'], session_data['gap_extend'],
+                           workers=workers, executor=executor, cache=cache, progress=progress, pairs=pairs,
+                           alignment_store=session_data['alignment_store_path'], consume=statistics)
+        if pairs is not None:
+            manifest["pairs"] = len(pairs)
+        return ["statistics"]
+
+    def statistics(blocks=None):
+        if blocks is None:
+            with AlignmentStore(session_data['alignment_store_path']) as store:
+                return calculate_statistics(batches=[store.batch()])
+        calculate_statistics(blocks=blocks)
+
+    def calculate_statistics(**pairs):
+        calculate_transitions_transversions(None, session_data['statistics_store_path'],
+                                            reference=reference_of(session_data), **pairs)
+
+    stages = {
+        "approximate": lambda: write_approximate_identity(session_data),
+        "alignment": align,
+        "statistics": statistics,
+    }
+
+    manifest_path = manifest_file(session_data)
+    inputs = pipeline_inputs(session_data)
+    manifest = load_manifest(manifest_path)
+    if manifest.get("inputs") != inputs:
+        manifest = {"inputs": inputs, "stages": {}}
+
+    rerun = False
+    streamed = set()
+    for name in session_stages(session_data):
+        if name in streamed:
+            manifest["stages"][name] = output_signature(session_data, name)
+            save_manifest(manifest_path, manifest)
+            continue
+        recorded = manifest["stages"].get(name)
+        if not rerun and recorded is not None and recorded == output_signature(session_data, name):
+            logger.info(f"Skipping fresh stage '{name}' for session {session_data['session_id']}")
+            if name == "alignment" and progress:
+                pairs, _ = pair_counts(session_data)
+                progress(pairs, pairs)
+            continue
+
+        manifest["stages"].pop(name, None)
+        save_manifest(manifest_path, manifest)
+        streamed.update(stages[name]() or [])
+        rerun = True
+        manifest["stages"][name] = output_signature(session_data, name)
+        save_manifest(manifest_path, manifest)
+
+    logger.info(f"Pipeline finished for session {session_data['session_id']}")
+
+
+def run_append(session_data, new_fasta_path, **kwargs):
+    """Run _run_append under the results lock."""
+    with results_lock(session_data):
+        return _run_append(session_data, new_fasta_path, **kwargs)
+
+
+def _run_append(session_data, new_fasta_path, workers=1, executor="thread", cache=None, progress=None):
+    """
+    Append the sequences of new_fasta_path to the session's upload and bring
+    the outputs up to date. When the existing outputs are fresh only the
+    new x old and new x new pairs (reference x new in reference mode) are
+    aligned and their statistics merged into the existing files; otherwise
+    the whole pipeline runs again.
+    Returns the new number of sequences.
+    """
+    fresh = outputs_fresh(session_data)
+    num_existing = session_data['num_sequences']
+
+    # The combined upload is written aside and only moved in once the outputs are up
+    # to date, so a failed append leaves the upload as it was. Appending changes the
+    # upload hash, so an update interrupted before the move is rebuilt in full later
+    upload_path = session_data['upload_file_path']
+    combined_path = f"{upload_path}.append"
+    shutil.copyfile(upload_path, combined_path)
+    with open(new_fasta_path, 'r') as new_file, open(combined_path, 'r+') as combined_file:
+        combined_file.seek(0, os.SEEK_END)
+        if combined_file.tell() > 0:
+            combined_file.seek(combined_file.tell() - 1)
+            if combined_file.read(1) != "\n":
+                combined_file.write("\n")
+        shutil.copyfileobj(new_file, combined_file)
+    combined = dict(session_data, upload_file_path=combined_path)
+
+    try:
+        if not fresh:
+            logger.info(f"Outputs of session {session_data['session_id']} are not fresh, running the full pipeline")
+            _run_pipeline(combined, workers=workers, executor=executor, cache=cache, progress=progress)
+            with open(combined_path, 'r') as combined_file:
+                num_sequences = sum(1 for line in combined_file if line.startswith(">"))
+        else:
+            num_sequences = merge_new_alignments(
+                combined,
+                lambda consume: append_fasta_alignments(combined_path, num_existing, None, None, None,
+                                                        session_data['psa_program'], session_data['gap_open'],
+                                                        session_data['gap_extend'], workers=workers, executor=executor,
+                                                        cache=cache, progress=progress,
+                                                        reference=reference_of(session_data), consume=consume,
+                                                        alignment_store=session_data['alignment_store_path']))
+    except BaseException:
+        os.remove(combined_path)
+        raise
+    os.replace(combined_path, upload_path)
+    logger.info(f"Appended {num_sequences - num_existing} sequences to session {session_data['session_id']}")
+    return num_sequences
+
+
+def run_selected_pairs(session_data, pairs, **kwargs):
+    """Run _run_selected_pairs under the results lock."""
+    with results_lock(session_data):
+        return _run_selected_pairs(session_data, pairs, **kwargs)
+
+
+def _run_selected_pairs(session_data, pairs, workers=1, executor="thread", cache=None, progress=None):
+    """
+    Align user-selected (query id, subject id) pairs of an approximate-mode
+    session. The pairs are recorded with the session, so later reruns keep
+    them; pairs already aligned are skipped. Fresh outputs are extended in
+    place as in run_append, otherwise the whole pipeline runs again.
+    Returns the number of newly aligned pairs.
+    """
+    fresh = outputs_fresh(session_data)
+    _, _, planned = approximate_pairs(session_data)
+    planned = set(planned)
+    new_pairs = []
+    for pair in pairs:
+        if pair not in planned:
+            planned.add(pair)
+            new_pairs.append(pair)
+    if not new_pairs:
+        if progress:
+            progress(0, 0)
+        return 0
+
+    save_manifest(results_file(session_data, SELECTED_PAIRS_NAME),
+                  load_selected_pairs(session_data) + [list(pair) for pair in new_pairs])
+
+    if not fresh:
+        logger.info(f"Outputs of session {session_data['session_id']} are not fresh, running the full pipeline")
+        _run_pipeline(session_data, workers=workers, executor=executor, cache=cache, progress=progress)
+        return len(new_pairs)
+
+    merge_new_alignments(
+        session_data,
+        lambda consume: append_pair_alignments(session_data['upload_file_path'], new_pairs, None, None, None,
+                                               session_data['psa_program'], session_data['gap_open'],
+                                               session_data['gap_extend'], workers=workers, executor=executor,
+                                               cache=cache, progress=progress, consume=consume,
+                                               alignment_store=session_data['alignment_store_path']),
+        pairs=len(planned))
+    logger.info(f"Aligned {len(new_pairs)} selected pairs for session {session_data['session_id']}")
+    return len(new_pairs)
+
+
+def merge_new_alignments(session_data, align, pairs=None):
+    """
+    Run align(consume), which appends new pairs to the alignment store and
+    streams their records to consume, merging their statistics
+    into the existing outputs, then record the outputs as fresh. pairs is
+    the new aligned pair count of approximate sessions.
+    Returns what align returned.
+    """
+    result = align(lambda blocks: merge_transitions_transversions(None, session_data['statistics_store_path'],
+                                                                  reference=reference_of(session_data),
+                                                                  blocks=blocks))
+
+    manifest = {
+        "inputs": pipeline_inputs(session_data),
+        "stages": {stage: output_signature(session_data, stage) for stage in session_stages(session_data)},
+    }
+    if pairs is not None:
+        manifest["pairs"] = pairs
+    save_manifest(manifest_file(session_data), manifest)
+    return result
+
+
+def result_export(session_data, filename):
+    """
+    Path of a workbook of RESULT_EXPORT_PATHS, exported from its store on
+    the first download and kept next to the results. The export is written
+    again once the store is newer, after appends. Returns None when the
+    session has no such results (yet); raises BlockingIOError while a job
+    holds the results, rather than waiting for it in the request.
+    """
+    path_column, store_column = RESULT_EXPORT_PATHS[filename]
+    path = session_data[path_column] if path_column else results_file(session_data, filename)
+    store = session_data[store_column]
+    if not path or not store:
+        return None
+    # A store directory is as new as its columns archive, which is written last
+    source_path = os.path.join(store, COLUMNS_NAME) if os.path.isdir(store) else store
+
+    def fresh():
+        try:
+            return os.stat(path).st_mtime_ns >= os.stat(source_path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+
+    if not fresh():
+        # Under the results lock, so the store is not being rewritten and one export is written at a time
+        with results_lock(session_data, blocking=False):
+            if not os.path.exists(source_path):
+                return None
+            if not fresh():
+                export_result(store, filename, path)
+                logger.info(f"Exported {filename} for session {session_data['session_id']}")
+    return path
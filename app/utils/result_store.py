@@ -0,0 +1,149 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+#utils/result_store.py
+import os
+import json
+import struct
+import zipfile
+import numpy as np
+
+# A statistics store is a directory of two files:
+#   columns.npz  one array per statistic, one entry per aligned pair in alignment order;
+#                query and subject are positions in the id table
+#   header.json  id table (lowercase query ids) and the reference query id of reference-vs-all runs
+COLUMNS_NAME = "columns.npz"
+HEADER_NAME = "header.json"
+
+
+def write_statistics(path, headers, stats, reference=None, append=False):
+    """
+    Write the per-pair statistics columns of pair_statistics_batch for the
+    (query id, subject id) headers. With append=True the pairs are added
+    after the ones already stored.
+    """
+    os.makedirs(path, exist_ok=True)
+    ids, columns = [], {}
+    if append:
+        with StatisticsStore(path) as store:
+            ids = list(store.ids)
+            columns = {name: store.column(name) for name in store.names}
+
+    numbers = {qid: number for number, qid in enumerate(ids)}
+    for pair in headers:
+        for qid in pair:
+            if qid not in numbers:
+                numbers[qid] = len(ids)
+                ids.append(qid)
+    new_columns = {
+        "query": np.array([numbers[query] for query, _ in headers], dtype="<i4"),
+        "subject": np.array([numbers[subject] for _, subject in headers], dtype="<i4"),
+        **{name: np.asarray(values, dtype=str if name == "ratio" else None) for name, values in stats.items()},
+    }
+    if columns:
+        new_columns = {name: np.concatenate([columns[name], values]) for name, values in new_columns.items()}
+
+    # The header first: ids are only ever added, so it still fits the old columns
+    tmp_path = os.path.join(path, f"{HEADER_NAME}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump({"ids": ids, "reference": reference}, f)
+    os.replace(tmp_path, os.path.join(path, HEADER_NAME))
+
+    tmp_path = os.path.join(path, f"{COLUMNS_NAME}.tmp")
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **new_columns)
+    os.replace(tmp_path, os.path.join(path, COLUMNS_NAME))
+
+
+# Approximate mode keeps the N x N k-mer identity of every pair as one archive
+# of the query ids and the identity matrix, NaN where a sequence has no k-mers
+def write_identity(path, ids, identity):
+    """Write the approximate identity matrix of the query ids."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, ids=np.array(ids, dtype=str), identity=identity)
+    os.replace(tmp_path, path)
+
+
+def read_identity(path, mmap=False):
+    """
+    (ids, identity) as written by write_identity. With mmap=True the matrix
+    is memory-mapped from the archive, whose members np.savez stores
+    uncompressed, so only the cells used are read.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        ids = data["ids"].tolist()
+        if not mmap:
+            return ids, data["identity"]
+
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        info = archive.getinfo("identity.npy")
+        if info.compress_type != zipfile.ZIP_STORED:
+            return ids, np.load(archive.open(info), allow_pickle=False)
+        # The member's data follows its local header: 30 bytes, the name and the extra field
+        f.seek(info.header_offset + 26)
+        name_length, extra_length = struct.unpack("<HH", f.read(4))
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(f)
+        shape, fortran_order, dtype = (np.lib.format.read_array_header_1_0(f) if version == (1, 0)
+                                       else np.lib.format.read_array_header_2_0(f))
+        offset = f.tell()
+    if not shape[0]:
+        return ids, np.zeros(shape, dtype=dtype)
+    return ids, np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape,
+                          order='F' if fortran_order else 'C')
+
+
+class StatisticsStore:
+    """
+    Read-only view of a statistics store. Columns are read from the archive
+    when first asked for.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, HEADER_NAME), 'r') as f:
+            header = json.load(f)
+        self.ids = header["ids"]
+        self.reference = header["reference"]
+        self._archive = np.load(os.path.join(path, COLUMNS_NAME), allow_pickle=False)
+        self.names = list(self._archive.files)
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.column("query"))
+
+    def column(self, name):
+        if name not in self._columns:
+            self._columns[name] = self._archive[name]
+        return self._columns[name]
+
+    def headers(self):
+        """(query id, subject id) of every pair."""
+        return [(self.ids[query], self.ids[subject])
+                for query, subject in zip(self.column("query").tolist(), self.column("subject").tolist())]
+
+    def pair_names(self):
+        return [f"{query}_vs_{subject}" for query, subject in self.headers()]
+
+    def close(self):
+        self._archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
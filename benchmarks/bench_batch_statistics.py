@@ -0,0 +1,87 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Per-pair kernel calls versus one batched statistics call over all pairs.
+
+    python benchmarks/bench_batch_statistics.py [length]
+
+For growing numbers of aligned pairs the statistics are computed with one
+count_transitions_transversions call per pair and with pair_statistics_batch
+over the pairs laid out as in the alignment store (the layout is built
+beforehand, as the store already holds it). Reports total milliseconds and
+whether both agree on every count and matrix.
+"""
+import sys
+import random
+
+import numpy as np
+
+from common import make_sequences, timer
+from app.utils.file_handlers import count_transitions_transversions, pair_statistics_batch, NUCLEOTIDES
+
+PAIR_COUNTS = [1000, 5000, 20000]
+
+
+def aligned_pairs(count, length, seed=7):
+    """Equal-length (query row, subject row) pairs with gaps and N runs."""
+    rng = random.Random(seed)
+    rows = [sequence[:length].ljust(length, "-") for sequence in make_sequences(64, length, divergence=0.05, seed=seed)]
+    pairs = []
+    for _ in range(count):
+        query, subject = rng.sample(rows, 2)
+        start = rng.randrange(length - 10)
+        pairs.append((query[:start] + "-" * 5 + query[start + 5:], subject[:start] + "N" * 10 + subject[start + 10:]))
+    return pairs
+
+
+def per_pair(pairs):
+    return [count_transitions_transversions(query, subject) for query, subject in pairs]
+
+
+def store_layout(pairs):
+    """(rows, offsets, lengths) of the pairs as the alignment store holds them."""
+    rows = np.frombuffer("".join(query + subject for query, subject in pairs).encode("ascii"), dtype=np.uint8)
+    lengths = np.array([len(query) for query, _ in pairs], dtype=np.int64)
+    return rows, 2 * (np.cumsum(lengths) - lengths), lengths
+
+
+def same(results, columns):
+    for k, (stats, matrix) in enumerate(results):
+        if any(stats[name] != columns[name][k] for name in stats):
+            return False
+        if [[matrix[b1][b2] for b2 in NUCLEOTIDES] for b1 in NUCLEOTIDES] != columns["substitutions"][k].tolist():
+            return False
+    return True
+
+
+def main(length):
+    print(f"{'pairs':>7} {'columns':>9} {'per-pair ms':>12} {'batched ms':>11} {'speed-up':>9} {'parity':>7}")
+    for count in PAIR_COUNTS:
+        pairs = aligned_pairs(count, length, seed=count)
+        layout = store_layout(pairs)
+        timings = {}
+        with timer(timings, "per-pair"):
+            results = per_pair(pairs)
+        with timer(timings, "batched"):
+            columns = pair_statistics_batch(*layout)
+        parity = same(results, columns)
+        print(f"{count:>7} {count * length:>9} {timings['per-pair'] * 1000:>12.1f} {timings['batched'] * 1000:>11.1f} "
+              f"{timings['per-pair'] / timings['batched']:>8.1f}x {'ok' if parity else 'FAIL':>7}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
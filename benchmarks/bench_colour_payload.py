@@ -0,0 +1,123 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Colour-view payload: one span per base, one span per run, packed classes.
+
+    python benchmarks/bench_colour_payload.py [fasta] [program]
+
+Every pair of the FASTA file (the bundled sample data by default) is
+aligned into an alignment store, then coloured by the former per-base
+colour_code_alignment, by the current one and by the compact response of
+rows and packed column classes. Reports the JSON payload of POST /alignment
+and the server time of the colouring per pair, and whether the per-base and
+run colourings return the same statistics.
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+
+from common import timer
+from app.utils.alignment_store import AlignmentStore
+from app.utils.file_handlers import (process_fasta_file, colour_code_alignment, colour_code_compact, colour_classes,
+                                     colour_stats)
+
+SAMPLE_FASTA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            "app", "static", "files", "sample_2_mega.fasta")
+
+
+def per_base_colours(alignment_pair, query, subject):
+    """The former colour_code_alignment: one inline-styled span per base."""
+    color_map = {"identical": "green", "transition": "orange", "transversion": "red", "gap": "black", "unknown": "grey"}
+    seq1, seq2 = alignment_pair
+    stats = {"identical": 0, "transitions": 0, "transversions": 0, "gaps": 0, "unknown": 0, "total_length": len(seq1)}
+    purines, pyrimidines = {'A', 'G'}, {'C', 'T'}
+    ambiguous_symbols = {'N', 'R', 'Y', 'K', 'M', 'S', 'W', 'B', 'D', 'H', 'V', 'U'}
+    lines = []
+    for start in range(0, len(seq1), 50):
+        line1, line2 = [], []
+        for char1, char2 in zip(seq1[start:start + 50], seq2[start:start + 50]):
+            if char1 == char2:
+                kind = "identical"
+            elif char1 == '-' or char2 == '-':
+                kind = "gap"
+            elif char1 in ambiguous_symbols or char2 in ambiguous_symbols:
+                kind = "unknown"
+            elif (char1 in purines and char2 in purines) or (char1 in pyrimidines and char2 in pyrimidines):
+                kind = "transition"
+            else:
+                kind = "transversion"
+            stats[{"identical": "identical", "gap": "gaps", "unknown": "unknown",
+                   "transition": "transitions", "transversion": "transversions"}[kind]] += 1
+            line1.append(f'<span style="color: {color_map[kind]}">{char1}</span>')
+            line2.append(f'<span style="color: {color_map[kind]}">{char2}</span>')
+        lines.append(f"{query}: {''.join(line1)}<br>{subject}: {''.join(line2)}<br><br>")
+    for name, key in [("identical", "identical"), ("transitions", "transitions"), ("transversions", "transversions"),
+                      ("gaps", "gaps"), ("unknown", "unknown")]:
+        stats[f"{key}_percent"] = (stats[name] / len(seq1)) * 100
+    return "".join(lines), stats
+
+
+def payload(colour, pair, query, subject):
+    """(JSON bytes of the POST /alignment response, seconds, stats)."""
+    timings = {}
+    with timer(timings, "colour"):
+        html, stats = colour(pair, query, subject)
+    response = {"message": "Data received in the backend", "query": query, "subject": subject,
+                "colour_coded_alignment": html, "stats": stats}
+    return len(json.dumps(response)), timings["colour"], stats
+
+
+def compact_payload(pair, query, subject):
+    """(JSON bytes of the compact POST /alignment response, seconds)."""
+    timings = {}
+    with timer(timings, "colour"):
+        classes = colour_classes(*pair)
+        response = {"message": "Data received in the backend", "query": query, "subject": subject,
+                    "start": 0, "end": len(pair[0]), "length": len(pair[0]),
+                    "stats": colour_stats(classes, len(pair[0])), **colour_code_compact(pair, classes)}
+    return len(json.dumps(response)), timings["colour"]
+
+
+def main(fasta_path, program):
+    with tempfile.TemporaryDirectory() as tmp:
+        store_path = os.path.join(tmp, "alignment_store")
+        process_fasta_file(fasta_path, None, None, program, 10, 0.5, alignment_store=store_path)
+        with AlignmentStore(store_path) as store:
+            pairs = [(store.ids[entry["query"]], store.ids[entry["subject"]], store.rows(position))
+                     for position, entry in enumerate(store.index)]
+
+    print(f"{'pair':>22} {'columns':>8} {'per-base KB':>12} {'per-base ms':>12} {'runs KB':>8} {'runs ms':>8} "
+          f"{'compact KB':>11} {'compact ms':>11} {'stats':>6}")
+    totals = [0] * 6
+    for query, subject, pair in pairs:
+        before_size, before_time, before_stats = payload(per_base_colours, pair, query, subject)
+        after_size, after_time, after_stats = payload(colour_code_alignment, pair, query, subject)
+        compact_size, compact_time = compact_payload(pair, query, subject)
+        for i, value in enumerate([before_size, before_time, after_size, after_time, compact_size, compact_time]):
+            totals[i] += value
+        print(f"{query + ' vs ' + subject:>22} {len(pair[0]):>8} {before_size / 1024:>12.1f} {before_time * 1000:>12.2f} "
+              f"{after_size / 1024:>8.1f} {after_time * 1000:>8.2f} {compact_size / 1024:>11.1f} "
+              f"{compact_time * 1000:>11.2f} {'ok' if before_stats == after_stats else 'FAIL':>6}")
+    print(f"{'total':>22} {'':>8} {totals[0] / 1024:>12.1f} {totals[1] * 1000:>12.2f} "
+          f"{totals[2] / 1024:>8.1f} {totals[3] * 1000:>8.2f} {totals[4] / 1024:>11.1f} {totals[5] * 1000:>11.2f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else SAMPLE_FASTA,
+         sys.argv[2] if len(sys.argv) > 2 else "native")
@@ -0,0 +1,101 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Per-character loop versus lookup-table kernel of count_transitions_transversions.
+
+    python benchmarks/bench_count_kernel.py [length] [pairs]
+
+Aligned rows with substitutions, gaps and N runs are counted by the former
+per-character loop and by the kernel. Reports milliseconds per pair and
+whether both returned the same statistics and substitution matrix.
+"""
+import sys
+import random
+
+from common import make_sequences, timer
+from app.utils.file_handlers import count_transitions_transversions
+
+
+def count_loop(seq1, seq2):
+    """The per-character implementation the kernel replaced."""
+    purines, pyrimidines = {'A', 'G'}, {'C', 'T'}
+    ambiguous_symbols = {'-', 'N', 'R', 'Y', 'K', 'M', 'S', 'W', 'B', 'D', 'H', 'V', 'U'}
+    transitions, transversions, identical, gap_count = 0, 0, 0, 0
+    total_length = len(seq1)
+    nucleotide_set = 'ACGT'
+    matrix = {base1: {base2: 0 for base2 in nucleotide_set} for base1 in nucleotide_set}
+    for b1, b2 in zip(seq1, seq2):
+        if b1 == '-' or b2 == '-':
+            gap_count += 1
+            continue
+        if b1 in ambiguous_symbols or b2 in ambiguous_symbols:
+            continue
+        if b1 not in nucleotide_set or b2 not in nucleotide_set:
+            raise ValueError(f"Invalid base pair: b1={b1}, b2={b2}")
+        if b1 == b2:
+            identical += 1
+            continue
+        matrix[b1][b2] += 1
+        if (b1 in purines and b2 in purines) or (b1 in pyrimidines and b2 in pyrimidines):
+            transitions += 1
+        else:
+            transversions += 1
+    percent = lambda count: round((count / total_length) * 100 if total_length > 0 else 0, 2)
+    return {
+        'transitions': transitions,
+        'transversions': transversions,
+        'identical': identical,
+        'gap_count': gap_count,
+        'transition_percent': percent(transitions),
+        'transversion_percent': percent(transversions),
+        'identical_percent': percent(identical),
+        'gap_percent': percent(gap_count),
+        'total_length': total_length,
+        'ratio': f"{transitions / transversions:.3f}" if transversions != 0 else "Undefined"
+    }, matrix
+
+
+def aligned_rows(length, count, seed=7):
+    """Equal-length rows with about 2% gaps and a few N runs."""
+    rng = random.Random(seed)
+    rows = []
+    for sequence in make_sequences(count, length, divergence=0.05, seed=seed):
+        row = list(sequence[:length].ljust(length, "-"))
+        for _ in range(length // 50):
+            row[rng.randrange(length)] = "-"
+        start = rng.randrange(length - 20)
+        row[start:start + 20] = "N" * 20
+        rows.append("".join(row))
+    return rows
+
+
+def main(length, pairs):
+    rows = aligned_rows(length, pairs + 1)
+    results, timings = {}, {}
+    for name, count in [("loop", count_loop), ("kernel", count_transitions_transversions)]:
+        with timer(timings, name):
+            results[name] = [count(rows[i], rows[i + 1]) for i in range(pairs)]
+    parity = results["loop"] == results["kernel"]
+
+    print(f"{'length':>8} {'pairs':>6} {'loop ms':>9} {'kernel ms':>10} {'speed-up':>9} {'parity':>7}")
+    loop, kernel = timings["loop"] / pairs * 1000, timings["kernel"] / pairs * 1000
+    print(f"{length:>8} {pairs:>6} {loop:>9.3f} {kernel:>10.3f} {loop / kernel:>8.0f}x {'ok' if parity else 'FAIL':>7}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 200)
@@ -0,0 +1,79 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Accuracy and speed of the approximate (k-mer MinHash) comparison mode.
+
+    python benchmarks/bench_kmer_sketch.py [length]
+
+Accuracy: the approximate identity of pairs at known divergences is
+compared with the identity of their native global alignment (identical
+columns over aligned length, as in the summary features). Speed: sketching
+and the N x N identity matrix for growing panels, against the estimated
+time of aligning every pair with needle.
+"""
+import sys
+import random
+
+import numpy as np
+
+from common import make_sequences, mutate, timer
+from app.utils.native_aligner import global_align
+from app.utils.kmer_sketch import sketch_sequences, approximate_identity, pairs_above
+from app.utils.alignment_cost import estimate_run_cost
+
+DIVERGENCES = [0.0, 0.01, 0.02, 0.05, 0.1, 0.2, 0.3]
+PANEL_SIZES = [100, 500, 1000, 2000]
+
+
+def aligned_identity(qseq, sseq):
+    qaln, saln, _ = global_align(qseq, sseq, 10, 0.5)
+    same = sum(1 for a, b in zip(qaln, saln) if a == b and a != "-")
+    return 100.0 * same / len(qaln)
+
+
+def check_accuracy(length, pairs_per_divergence=5):
+    rng = random.Random(3)
+    print(f"{'divergence':>10} {'aligned %':>10} {'approx %':>10} {'error':>8}")
+    for divergence in DIVERGENCES:
+        exact, approx = [], []
+        for _ in range(pairs_per_divergence):
+            ancestor = "".join(rng.choice("ACGT") for _ in range(length))
+            qseq, sseq = ancestor, mutate(ancestor, divergence, rng)
+            exact.append(aligned_identity(qseq, sseq))
+            approx.append(approximate_identity(sketch_sequences([qseq, sseq]))[0, 1])
+        error = np.mean(np.abs(np.array(approx) - np.array(exact)))
+        print(f"{divergence:>10.2f} {np.mean(exact):>10.1f} {np.mean(approx):>10.1f} {error:>8.1f}")
+
+
+def bench_panels(length):
+    print(f"\n{'sequences':>10} {'sketch s':>9} {'matrix s':>9} {'pairs >=95%':>12} {'needle all pairs s':>19}")
+    for size in PANEL_SIZES:
+        sequences = make_sequences(size, length, divergence=0.05, seed=size)
+        results = {}
+        with timer(results, "sketch"):
+            sketches = sketch_sequences(sequences)
+        with timer(results, "matrix"):
+            identity = approximate_identity(sketches)
+        _, needle_seconds = estimate_run_cost("needle", [len(s) for s in sequences])
+        print(f"{size:>10} {results['sketch']:>9.2f} {results['matrix']:>9.2f} "
+              f"{len(pairs_above(identity, 95)):>12} {needle_seconds:>19.0f}")
+
+
+if __name__ == "__main__":
+    length = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    check_accuracy(length)
+    bench_panels(length)
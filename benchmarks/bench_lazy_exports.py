@@ -0,0 +1,89 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Statistics stage writing every workbook versus the statistics store.
+
+    python benchmarks/bench_lazy_exports.py [length]
+
+For every pair of growing synthetic panels the statistics stage runs as
+before, writing the five workbooks, and as now, writing the statistics
+store only. The workbooks are then exported from the store, as the first
+download of each does. Reports seconds of each stage, of the exports and
+whether the exports hold the same cells as the former workbooks.
+"""
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+from common import timer
+from bench_result_assembly import panel_batch
+from app.utils.file_handlers import (collect_pair_statistics, user_nucleotide_frame, reference_row,
+                                     calculate_transitions_transversions, export_result)
+
+PANEL_SIZES = [10, 25, 50]
+WORKBOOKS = ["nucleotide.xlsx", "transratio.xlsx", "summary_features.xlsx", "summary_alignment.xlsx"]
+
+
+def workbook_stage(batch, out_dir):
+    """The former statistics stage: every table written as a workbook."""
+    ratio_matrix, features, alignment, nucleotide_matrices = collect_pair_statistics([batch])
+    with pd.ExcelWriter(os.path.join(out_dir, "nucleotide.xlsx")) as writer:
+        for pair, matrix in nucleotide_matrices.items():
+            matrix_df = pd.DataFrame.from_dict(matrix, orient="index", columns=matrix.keys())
+            matrix_df.index.name = "Base"
+            matrix_df.to_excel(writer, sheet_name=pair, index_label="Base")
+    with pd.ExcelWriter(os.path.join(out_dir, "user_nucleotide.xlsx")) as writer:
+        user_nucleotide_frame(nucleotide_matrices).to_excel(writer, sheet_name="User_Nucleotide Matrices", index=False)
+    reference_row(ratio_matrix, None).fillna("-").to_excel(os.path.join(out_dir, "transratio.xlsx"))
+    features.to_excel(os.path.join(out_dir, "summary_features.xlsx"), index=False)
+    alignment.to_excel(os.path.join(out_dir, "summary_alignment.xlsx"), index=False)
+
+
+def same_cells(before, after):
+    before, after = pd.read_excel(before, sheet_name=None), pd.read_excel(after, sheet_name=None)
+    return list(before) == list(after) and all(before[sheet].equals(after[sheet]) for sheet in before)
+
+
+def main(length):
+    print(f"{'sequences':>10} {'pairs':>6} {'workbooks s':>12} {'store s':>8} {'exports s':>10} {'same':>5}")
+    for size in PANEL_SIZES:
+        batch = panel_batch(size, length)
+        with tempfile.TemporaryDirectory() as tmp:
+            before, after = os.path.join(tmp, "before"), os.path.join(tmp, "after")
+            os.makedirs(before)
+            os.makedirs(after)
+            store = os.path.join(after, "statistics_store")
+
+            timings = {}
+            with timer(timings, "workbooks"):
+                workbook_stage(batch, before)
+            with timer(timings, "store"):
+                calculate_transitions_transversions(None, store, batches=[batch])
+            with timer(timings, "exports"):
+                for filename in WORKBOOKS:
+                    export_result(store, filename, os.path.join(after, filename))
+            same = all(same_cells(os.path.join(before, filename), os.path.join(after, filename))
+                       for filename in WORKBOOKS)
+
+        print(f"{size:>10} {len(batch[0]):>6} {timings['workbooks']:>12.2f} {timings['store']:>8.3f} "
+              f"{timings['exports']:>10.2f} {'ok' if same else 'FAIL':>5}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
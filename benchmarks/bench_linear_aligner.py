@@ -0,0 +1,87 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Peak memory and runtime of the linear-memory aligner versus sequence length.
+
+    python benchmarks/bench_linear_aligner.py [max_length]
+
+Each alignment runs in a forked child so its peak RSS is measured on its own.
+The full-matrix native aligner is run alongside at the lengths where it fits,
+and both must reach the same score (end gaps penalized, as in stretcher).
+The cost model's estimate is printed next to the measurement.
+"""
+import sys
+import time
+import resource
+import multiprocessing
+
+from common import make_sequences
+from app.utils.native_aligner import global_align
+from app.utils.linear_aligner import linear_global_align, estimate_band, alignment_score
+from app.utils.alignment_cost import estimate_pair_cost
+
+GAP_OPEN, GAP_EXTEND = 16, 4
+LENGTHS = [1000, 3000, 10000, 30000, 100000, 300000]
+NATIVE_MAX_LENGTH = 10000
+
+
+def _measure(queue, engine, qseq, sseq):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if engine == "native":
+        _, _, score = global_align(qseq, sseq, GAP_OPEN, GAP_EXTEND, penalize_end_gaps=True)
+    else:
+        qaln, saln = linear_global_align(qseq, sseq, GAP_OPEN, GAP_EXTEND)
+        score = alignment_score(qaln, saln, GAP_OPEN, GAP_EXTEND)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((score, elapsed, (peak - baseline) / 1024))
+
+
+def measure(engine, qseq, sseq):
+    """(score, seconds, extra peak RSS in MB) of one alignment in a child."""
+    queue = multiprocessing.Queue()
+    child = multiprocessing.Process(target=_measure, args=(queue, engine, qseq, sseq))
+    child.start()
+    child.join()
+    if child.exitcode != 0:
+        raise SystemExit(f"{engine} alignment failed (exit code {child.exitcode})")
+    return queue.get()
+
+
+def main():
+    max_length = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print(f"{'length':>8} {'engine':>7} {'seconds':>9} {'peak MB':>9} {'est. s':>8} {'est. MB':>8}  score")
+    for length in (length for length in LENGTHS if length <= max_length):
+        qseq, sseq = make_sequences(2, length, divergence=0.02, seed=length)
+        band = estimate_band(qseq, sseq)
+        band_width = None if band is None else band[1] - band[0] + 1
+
+        engines = ["native", "linear"] if length <= NATIVE_MAX_LENGTH else ["linear"]
+        scores = {}
+        for engine in engines:
+            score, seconds, peak_mb = measure(engine, qseq, sseq)
+            scores[engine] = score
+            est_bytes, est_seconds = estimate_pair_cost(engine, len(qseq), len(sseq), band_width)
+            print(f"{length:>8} {engine:>7} {seconds:>9.2f} {peak_mb:>9.1f} "
+                  f"{est_seconds:>8.2f} {est_bytes / 1024 / 1024:>8.1f}  {score:.1f}")
+        if len(set(scores.values())) > 1:
+            raise SystemExit(f"score mismatch at length {length}: {scores}")
+
+
+if __name__ == "__main__":
+    main()
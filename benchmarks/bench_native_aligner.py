@@ -0,0 +1,58 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Throughput of the native aligner against EMBOSS needle.
+
+    python benchmarks/bench_native_aligner.py [pairs_per_length]
+
+The parity of its alignments with needle and Biopython is checked by
+tests/test_native_aligner.py.
+"""
+import sys
+import time
+import shutil
+
+from common import make_sequences
+from app.utils.native_aligner import global_align
+
+HAS_NEEDLE = shutil.which("needle") is not None
+if HAS_NEEDLE:
+    import psa
+
+
+def throughput(pairs_per_length):
+    print(f"{'length':>7} {'native pairs/s':>15} {'needle pairs/s':>15}")
+    for length in (150, 300, 600, 1500, 3000):
+        sequences = make_sequences(pairs_per_length + 1, length)
+        pairs = list(zip(sequences, sequences[1:]))
+
+        start = time.perf_counter()
+        for qseq, sseq in pairs:
+            global_align(qseq, sseq, 10, 0.5)
+        native_rate = len(pairs) / (time.perf_counter() - start)
+
+        needle_rate = "-"
+        if HAS_NEEDLE:
+            start = time.perf_counter()
+            for qseq, sseq in pairs:
+                psa.needle(moltype="nucl", qseq=qseq, sseq=sseq, matrix="EDNAFULL", gapopen=10, gapextend=0.5)
+            needle_rate = f"{len(pairs) / (time.perf_counter() - start):.1f}"
+        print(f"{length:>7} {native_rate:>15.1f} {needle_rate:>15}")
+
+
+if __name__ == "__main__":
+    throughput(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -0,0 +1,78 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Nucleotide workbook: one sheet per pair versus one streamed long table.
+
+    python benchmarks/bench_nucleotide_export.py [length]
+
+For every pair of growing synthetic panels the substitution matrices are
+written to a statistics store and exported as nucleotide.xlsx, one sheet
+per pair, and as nucleotide_long.xlsx, one table streamed in
+constant_memory mode. Reports seconds and peak traced MB of each export
+and whether the long table holds the counts of the store.
+"""
+import os
+import sys
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from common import timer
+from bench_result_assembly import panel_batch
+from app.utils.file_handlers import calculate_transitions_transversions, export_result
+from app.utils.result_store import StatisticsStore
+
+PANEL_SIZES = [25, 50, 100]
+
+
+def traced_export(store, filename, path, timings):
+    """Time an export, then export again under tracemalloc for its peak MB."""
+    with timer(timings, filename):
+        export_result(store, filename, path)
+    tracemalloc.start()
+    export_result(store, filename, path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1e6
+
+
+def main(length):
+    print(f"{'sequences':>10} {'pairs':>6} {'per pair s':>11} {'peak MB':>8} {'long s':>7} {'peak MB':>8} {'same':>5}")
+    for size in PANEL_SIZES:
+        batch = panel_batch(size, length)
+        with tempfile.TemporaryDirectory() as tmp:
+            store = os.path.join(tmp, "statistics_store")
+            calculate_transitions_transversions(None, store, batches=[batch])
+
+            timings, peaks = {}, {}
+            for filename in ["nucleotide.xlsx", "nucleotide_long.xlsx"]:
+                peaks[filename] = traced_export(store, filename, os.path.join(tmp, filename), timings)
+
+            long_table = pd.read_excel(os.path.join(tmp, "nucleotide_long.xlsx"), sheet_name=None)
+            counts = pd.concat(long_table.values())["Count"].to_numpy()
+            with StatisticsStore(store) as statistics:
+                same = np.array_equal(counts, statistics.column('substitutions').reshape(-1))
+
+        print(f"{size:>10} {len(batch[0]):>6} {timings['nucleotide.xlsx']:>11.2f} {peaks['nucleotide.xlsx']:>8.1f} "
+              f"{timings['nucleotide_long.xlsx']:>7.2f} {peaks['nucleotide_long.xlsx']:>8.1f} "
+              f"{'ok' if same else 'FAIL':>5}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
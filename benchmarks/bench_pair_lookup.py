@@ -0,0 +1,105 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Per-request latency of the colour-view pair lookup.
+
+    python benchmarks/bench_pair_lookup.py [length] [requests]
+
+For growing panels every pair is written once to an alignment store and
+once to a single-line alignment file. Each request is timed the way
+POST /alignment serves it: the text lookup reads and splits the whole
+file, the store lookup opens the store and reads one entry of the pair
+table. Reports the median milliseconds per request.
+"""
+import os
+import sys
+import random
+import statistics
+import tempfile
+import time
+from itertools import combinations
+
+from common import make_sequences
+from app.utils.alignment_store import AlignmentStore, AlignmentStoreWriter
+from app.utils.file_handlers import extract_alignment_pair, write_single_line_block
+
+PANEL_SIZES = [25, 50, 100, 200]
+
+
+def text_lookup(processed_path, query, subject):
+    """The lookup POST /alignment did before the store: read, split, scan."""
+    with open(processed_path, "r") as f:
+        processed_content = f.read()
+    for block in processed_content.split("=" * 70):
+        if not block.strip():
+            continue
+        lines = block.strip().splitlines()
+        header1, header2 = lines[0].lower().split()[0][1:], lines[2].lower().split()[0][1:]
+        if (header1, header2) == (query, subject):
+            return lines[1], lines[3]
+        if (header1, header2) == (subject, query):
+            return lines[3], lines[1]
+    return None
+
+
+def build(out_dir, size, length):
+    """Write every pair of a synthetic panel to a store and a single-line file."""
+    sequences = make_sequences(size, length, seed=size)
+    ids = [f"query{i + 1:03d}" for i in range(size)]
+    store_path, processed_path = os.path.join(out_dir, "alignment_store"), os.path.join(out_dir, "processed.fasta")
+    with AlignmentStoreWriter(store_path, ids, [f"seq{i + 1} synthetic" for i in range(size)]) as writer, \
+            open(processed_path, "w") as processed:
+        for i, j in combinations(range(size), 2):
+            # Stand-in rows: the lookups only care about their size
+            width = min(len(sequences[i]), len(sequences[j]))
+            records = [(f"{ids[i]} 1-{width}", sequences[i][:width]), (f"{ids[j]} 1-{width}", sequences[j][:width])]
+            writer.add(records)
+            write_single_line_block(processed, records)
+    return ids, store_path, processed_path
+
+
+def median_ms(lookup, pairs):
+    timings = []
+    for query, subject in pairs:
+        start = time.perf_counter()
+        lookup(query, subject)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main(length, requests):
+    print(f"{'sequences':>10} {'pairs':>7} {'file MB':>8} {'text ms':>9} {'store ms':>9} {'speed-up':>9}")
+    for size in PANEL_SIZES:
+        with tempfile.TemporaryDirectory() as tmp:
+            ids, store_path, processed_path = build(tmp, size, length)
+            rng = random.Random(size)
+            pairs = [tuple(rng.sample(ids, 2)) for _ in range(requests)]
+            for query, subject in pairs:
+                if text_lookup(processed_path, query, subject) != extract_alignment_pair(store_path, query, subject):
+                    raise SystemExit(f"Lookups differ for {query}, {subject}")
+
+            text = median_ms(lambda q, s: text_lookup(processed_path, q, s), pairs)
+            store = median_ms(lambda q, s: extract_alignment_pair(store_path, q, s), pairs)
+            with AlignmentStore(store_path) as opened:
+                count = len(opened)
+            print(f"{size:>10} {count:>7} {os.path.getsize(processed_path) / 2**20:>8.1f} "
+                  f"{text:>9.2f} {store:>9.3f} {text / store:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 20)
@@ -0,0 +1,61 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Wall-clock time of process_fasta_file against the number of alignment workers.
+
+    python benchmarks/bench_parallel_alignment.py [num_sequences] [length] [program]
+
+Every run must produce byte-identical alignment files, whatever the worker count.
+"""
+import os
+import sys
+import filecmp
+import tempfile
+
+from common import make_sequences, write_fasta, timer
+from app.utils.file_handlers import process_fasta_file
+
+
+def main():
+    num_sequences = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    length = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    program = sys.argv[3] if len(sys.argv) > 3 else "needle"
+    worker_counts = [1, 2, 4, os.cpu_count() or 1]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fasta = write_fasta(os.path.join(tmp, "input.fasta"), make_sequences(num_sequences, length))
+        timings = {}
+        outputs = {}
+        for workers in sorted(set(worker_counts)):
+            calc = os.path.join(tmp, f"alignment_{workers}.fasta")
+            user = os.path.join(tmp, f"user_alignment_{workers}.fasta")
+            with timer(timings, workers):
+                process_fasta_file(fasta, calc, user, program, 10, 0.5, workers=workers)
+            outputs[workers] = (calc, user)
+
+        pairs = num_sequences * (num_sequences - 1) // 2
+        serial = timings[1]
+        print(f"{num_sequences} sequences x {length} bases, {pairs} pairs, program={program}")
+        print(f"{'workers':>8} {'seconds':>10} {'pairs/s':>10} {'speedup':>8}")
+        for workers, seconds in timings.items():
+            identical = all(filecmp.cmp(a, b, shallow=False) for a, b in zip(outputs[1], outputs[workers]))
+            print(f"{workers:>8} {seconds:>10.2f} {pairs / seconds:>10.1f} {serial / seconds:>7.2f}x"
+                  f"{'' if identical else '  OUTPUT MISMATCH'}")
+
+
+if __name__ == "__main__":
+    main()
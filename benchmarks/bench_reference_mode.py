@@ -0,0 +1,70 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+All-pairs versus reference-vs-all (star) comparison.
+
+    python benchmarks/bench_reference_mode.py [length] [program]
+
+For growing panels the pipeline runs once over every pair and once over
+the N - 1 reference pairs. The reference-mode summary rows must equal the
+matching rows of the all-pairs run.
+"""
+import os
+import sys
+import tempfile
+
+from common import make_sequences, write_fasta, timer
+from app.utils.file_handlers import (process_fasta_file, process_alignments_files,
+                                     calculate_transitions_transversions, summary_tables)
+
+PANEL_SIZES = [10, 20, 40]
+
+
+def run(fasta_path, out_dir, program, pairs=None, reference=None):
+    paths = {name: os.path.join(out_dir, name) for name in (
+        "alignment.fasta", "user_alignment.fasta", "processed.fasta", "statistics_store")}
+    process_fasta_file(fasta_path, paths["alignment.fasta"], paths["user_alignment.fasta"],
+                       program, 10, 0.5, pairs=pairs)
+    process_alignments_files(paths["alignment.fasta"], paths["processed.fasta"])
+    calculate_transitions_transversions(paths["processed.fasta"], paths["statistics_store"], reference=reference)
+    return summary_tables(paths["statistics_store"])[0].set_index("Sequence_Pair")
+
+
+def main(length, program):
+    print(f"{'sequences':>10} {'all pairs':>10} {'all s':>8} {'ref pairs':>10} {'ref s':>8} {'speed-up':>9} {'parity':>7}")
+    for size in PANEL_SIZES:
+        with tempfile.TemporaryDirectory() as tmp:
+            fasta_path = write_fasta(os.path.join(tmp, "input.fasta"), make_sequences(size, length, seed=size))
+            ids = [f"query{i+1:03d}" for i in range(size)]
+            reference_pairs = [(ids[0], qid) for qid in ids[1:]]
+            os.makedirs(os.path.join(tmp, "all"))
+            os.makedirs(os.path.join(tmp, "ref"))
+
+            results = {}
+            with timer(results, "all"):
+                full = run(fasta_path, os.path.join(tmp, "all"), program)
+            with timer(results, "ref"):
+                star = run(fasta_path, os.path.join(tmp, "ref"), program, reference_pairs, ids[0])
+
+            parity = star.equals(full.loc[star.index])
+            print(f"{size:>10} {len(full):>10} {results['all']:>8.2f} {len(star):>10} {results['ref']:>8.2f} "
+                  f"{results['all'] / results['ref']:>8.1f}x {'ok' if parity else 'FAIL':>7}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+         sys.argv[2] if len(sys.argv) > 2 else "native")
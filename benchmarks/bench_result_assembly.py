@@ -0,0 +1,111 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Row-by-row versus columnar assembly of the statistics tables.
+
+    python benchmarks/bench_result_assembly.py [length] [max legacy sequences]
+
+For every pair of growing panels (up to 200 sequences, 19,900 pairs) the
+per-pair statistics are assembled into the ratio matrix, the summary
+tables and the user nucleotide table: once by growing the DataFrames a
+row or cell at a time as before, once by collect_pair_statistics and
+user_nucleotide_frame. Reports seconds and microseconds per pair; the
+columnar time per pair stays flat as the panel grows. The row-by-row run
+is skipped above the given number of sequences (default 200).
+"""
+import sys
+import time
+import warnings
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from common import make_sequences
+from app.utils.file_handlers import (collect_pair_statistics, pair_statistics_batch, user_nucleotide_frame,
+                                     NUCLEOTIDES)
+
+PANEL_SIZES = [25, 50, 100, 200]
+
+
+def panel_batch(size, length):
+    """One batch of every pair of a synthetic panel, as AlignmentStore.batch returns it."""
+    rows = [sequence[:length].ljust(length, "-") for sequence in make_sequences(size, length, seed=size)]
+    ids = [f"query{i + 1:03d}" for i in range(size)]
+    pairs = list(combinations(range(size), 2))
+    buffer = np.frombuffer("".join(rows[i] + rows[j] for i, j in pairs).encode("ascii"), dtype=np.uint8)
+    lengths = np.full(len(pairs), length, dtype=np.int64)
+    return [(ids[i], ids[j]) for i, j in pairs], buffer, 2 * length * np.arange(len(pairs)), lengths
+
+
+def legacy_assembly(headers, stats):
+    """The tables grown a row or cell at a time, as before the columnar builders."""
+    warnings.simplefilter("ignore", pd.errors.PerformanceWarning)
+    ratio_matrix = pd.DataFrame()
+    features = pd.DataFrame(columns=['Sequence_Pair', 'Transition_Count', 'Transition_Percentage',
+                                     'Transversion_Count', 'Transversion_Percentage', 'Gap_Count',
+                                     'Gap_Percentage', 'Identical_Count', 'Identical_Percentage'])
+    alignment = pd.DataFrame(columns=['Sequence_Pair', 'Query_1_Length', 'Query_2_Length', 'Aligned_Length'])
+    nuc_df = pd.DataFrame(columns=["Sequence Pair", "A", "T", "G", "C"])
+    for k, (query, subject) in enumerate(headers):
+        pair_name = f"{query}_vs_{subject}"
+        ratio_matrix.loc[query, subject] = stats['ratio'][k]
+        ratio_matrix.loc[subject, query] = stats['ratio'][k]
+        features.loc[len(features)] = [pair_name, stats['transitions'][k], stats['transition_percent'][k],
+                                       stats['transversions'][k], stats['transversion_percent'][k],
+                                       stats['gap_count'][k], stats['gap_percent'][k],
+                                       stats['identical'][k], stats['identical_percent'][k]]
+        alignment.loc[len(alignment)] = [pair_name, stats['query_length'][k], stats['subject_length'][k],
+                                         stats['total_length'][k]]
+        matrix = {base1: dict(zip(NUCLEOTIDES, row)) for base1, row in zip(NUCLEOTIDES, stats['substitutions'][k])}
+        row = {"Sequence Pair": pair_name, **{base: matrix[base] for base in ["A", "T", "G", "C"]}}
+        nuc_df = pd.concat([nuc_df, pd.DataFrame([row])], ignore_index=True)
+    return ratio_matrix, features, alignment, nuc_df
+
+
+def columnar_assembly(batch):
+    ratio_matrix, features, alignment, nucleotide_matrices = collect_pair_statistics([batch])
+    return ratio_matrix, features, alignment, user_nucleotide_frame(nucleotide_matrices)
+
+
+def main(length, legacy_max):
+    print(f"{'sequences':>10} {'pairs':>7} {'legacy s':>9} {'legacy us/pair':>15} "
+          f"{'columnar s':>11} {'columnar us/pair':>17}")
+    for size in PANEL_SIZES:
+        batch = panel_batch(size, length)
+        pairs = len(batch[0])
+
+        start = time.perf_counter()
+        columnar_assembly(batch)
+        columnar = time.perf_counter() - start
+
+        legacy = "-"
+        if size <= legacy_max:
+            # Statistics computed outside the timing: only the table growth is compared
+            stats = {column: values.tolist() for column, values in pair_statistics_batch(*batch[1:]).items()}
+            start = time.perf_counter()
+            legacy_assembly(batch[0], stats)
+            legacy = time.perf_counter() - start
+
+        legacy_columns = (f"{legacy:>9.2f} {legacy / pairs * 1e6:>15.0f}" if legacy != "-"
+                          else f"{legacy:>9} {legacy:>15}")
+        print(f"{size:>10} {pairs:>7} {legacy_columns} {columnar:>11.3f} {columnar / pairs * 1e6:>17.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 200)
@@ -0,0 +1,95 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Staged versus streamed alignment -> single-line -> statistics pipeline.
+
+    python benchmarks/bench_streaming_pipeline.py [length] [program]
+
+Staged: the alignment file is written, read back into the single-line
+file, which is read back again by the statistics stage. Streamed: the
+aligned pairs go from the aligner to the single-line writer and the
+statistics in one pass. Each run is a fresh process; reports wall-clock
+time, its peak resident memory and whether both runs wrote the same files
+and statistics.
+"""
+import os
+import sys
+import time
+import filecmp
+import resource
+import tempfile
+import multiprocessing
+
+import numpy as np
+
+from common import make_sequences, write_fasta
+from app.utils.file_handlers import (process_fasta_file, process_alignments_files,
+                                     calculate_transitions_transversions)
+from app.utils.result_store import StatisticsStore
+
+PANEL_SIZES = [10, 20, 40]
+
+
+def run(fasta_path, out_dir, program, streamed):
+    paths = {name: os.path.join(out_dir, name) for name in
+             ["alignment.fasta", "user_alignment.fasta", "processed.fasta", "statistics_store"]}
+    if streamed:
+        process_fasta_file(fasta_path, paths["alignment.fasta"], paths["user_alignment.fasta"], program, 10, 0.5,
+                           output_single_line_fasta=paths["processed.fasta"],
+                           consume=lambda blocks: calculate_transitions_transversions(None, paths["statistics_store"],
+                                                                                      blocks=blocks))
+    else:
+        process_fasta_file(fasta_path, paths["alignment.fasta"], paths["user_alignment.fasta"], program, 10, 0.5)
+        process_alignments_files(paths["alignment.fasta"], paths["processed.fasta"])
+        calculate_transitions_transversions(paths["processed.fasta"], paths["statistics_store"])
+
+
+def measure(fasta_path, out_dir, program, streamed):
+    """(seconds, peak RSS in MB) of one run in the calling process."""
+    os.makedirs(out_dir)
+    start = time.perf_counter()
+    run(fasta_path, out_dir, program, streamed)
+    return time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def same_outputs(staged_dir, streamed_dir):
+    for name in ["alignment.fasta", "user_alignment.fasta", "processed.fasta"]:
+        if not filecmp.cmp(os.path.join(staged_dir, name), os.path.join(streamed_dir, name), shallow=False):
+            return False
+    with StatisticsStore(os.path.join(staged_dir, "statistics_store")) as staged, \
+            StatisticsStore(os.path.join(streamed_dir, "statistics_store")) as streamed:
+        return (staged.headers() == streamed.headers() and staged.names == streamed.names
+                and all(np.array_equal(staged.column(name), streamed.column(name)) for name in staged.names))
+
+
+def main(length, program):
+    print(f"{'sequences':>10} {'staged s':>9} {'staged MB':>10} {'streamed s':>11} {'streamed MB':>12} {'parity':>7}")
+    for size in PANEL_SIZES:
+        with tempfile.TemporaryDirectory() as tmp:
+            fasta_path = write_fasta(os.path.join(tmp, "input.fasta"), make_sequences(size, length, seed=size))
+            results = {}
+            for streamed, name in [(False, "staged"), (True, "streamed")]:
+                with multiprocessing.get_context("spawn").Pool(1) as pool:
+                    results[name] = pool.apply(measure, (fasta_path, os.path.join(tmp, name), program, streamed))
+            parity = same_outputs(os.path.join(tmp, "staged"), os.path.join(tmp, "streamed"))
+            print(f"{size:>10} {results['staged'][0]:>9.2f} {results['staged'][1]:>10.1f} "
+                  f"{results['streamed'][0]:>11.2f} {results['streamed'][1]:>12.1f} {'ok' if parity else 'FAIL':>7}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+         sys.argv[2] if len(sys.argv) > 2 else "native")
@@ -0,0 +1,92 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Alignment view: classified per request, read from stored classes, cached.
+
+    python benchmarks/bench_view_cache.py [length] [views]
+
+Synthetic sequences are aligned into an alignment store, which now holds
+the colour class of every column and the class counts of every pair. A
+user then flips between the pairs: every view is the whole colour-coded
+pair and its stats as JSON. Reports milliseconds per view when the pair
+is classified on each request as before, when the stored classes and
+counts are read, and when the view comes from AlignmentViewCache, with
+the cache's hit ratio.
+"""
+import os
+import sys
+import json
+import random
+import tempfile
+
+from common import make_sequences, write_fasta, timer
+from app.models.view_cache import AlignmentViewCache
+from app.utils.alignment_store import AlignmentStore
+from app.utils.file_handlers import (process_fasta_file, extract_alignment_pair, extract_alignment_view,
+                                     colour_code_alignment, colour_code_window)
+
+
+def classified_view(store_path, query, subject):
+    """The view as rendered before: classes and stats computed from the rows."""
+    html, stats = colour_code_alignment(extract_alignment_pair(store_path, query, subject), query, subject)
+    return json.dumps({"query": query, "subject": subject, "colour_coded_alignment": html, "stats": stats}).encode()
+
+
+def stored_view(store_path, query, subject):
+    window, classes, stats = extract_alignment_view(store_path, query, subject)
+    html = colour_code_window(window, query, subject, classes)
+    return json.dumps({"query": query, "subject": subject, "colour_coded_alignment": html, "stats": stats}).encode()
+
+
+def cached_view(cache, store_path, query, subject):
+    body = cache.get("session", (query, subject))
+    if body is None:
+        body = stored_view(store_path, query, subject)
+        cache.put("session", (query, subject), body)
+    return body
+
+
+def main(length, views):
+    with tempfile.TemporaryDirectory() as tmp:
+        fasta_path = write_fasta(os.path.join(tmp, "input.fasta"), make_sequences(6, length))
+        store_path = os.path.join(tmp, "alignment_store")
+        process_fasta_file(fasta_path, None, None, "native", 10, 0.5, alignment_store=store_path)
+        with AlignmentStore(store_path) as store:
+            pairs = [(store.ids[entry["query"]], store.ids[entry["subject"]]) for entry in store.index]
+
+        # The user flips between a few of the pairs
+        rng = random.Random(7)
+        flips = [rng.choice(pairs[:4]) for _ in range(views)]
+        cache = AlignmentViewCache(32, 64 * 1024 * 1024)
+        timings, bodies = {}, {}
+        for name, view in [("classified", lambda q, s: classified_view(store_path, q, s)),
+                           ("stored", lambda q, s: stored_view(store_path, q, s)),
+                           ("cached", lambda q, s: cached_view(cache, store_path, q, s))]:
+            with timer(timings, name):
+                bodies[name] = [view(query, subject) for query, subject in flips]
+
+    same = bodies["classified"] == bodies["stored"] == bodies["cached"]
+    print(f"{'columns':>8} {'views':>6} {'classified ms':>14} {'stored ms':>10} {'cached ms':>10} "
+          f"{'hit ratio':>10} {'same':>5}")
+    print(f"{length:>8} {views:>6} {timings['classified'] / views * 1000:>14.2f} "
+          f"{timings['stored'] / views * 1000:>10.2f} {timings['cached'] / views * 1000:>10.3f} "
+          f"{cache.stats()['hit_ratio']:>10.2f} {'ok' if same else 'FAIL':>5}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 200)
@@ -0,0 +1,105 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Results views read from workbooks versus from the statistics store.
+
+    python benchmarks/bench_view_latency.py [length]
+
+For every pair of synthetic panels of 100 and 500 sequences the
+statistics are written both as the workbooks the views used to parse and
+as the statistics store. Reports seconds to read the tables of the all
+results and summary dashboard views from the workbooks with read_excel as
+before, from the store, and to read and render each page from the store.
+"""
+import os
+import sys
+import tempfile
+
+import pandas as pd
+from jinja2 import Environment, FileSystemLoader
+
+from common import timer
+from bench_result_assembly import panel_batch
+from app.utils.file_handlers import (collect_pair_statistics, user_nucleotide_frame, reference_row,
+                                     calculate_transitions_transversions, transratio_table, summary_tables,
+                                     nucleotide_matrices_of)
+
+PANEL_SIZES = [100, 500]
+TEMPLATES = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "app", "templates")
+
+
+def write_workbooks(batch, out_dir):
+    """The workbooks the views read before the statistics store."""
+    ratio_matrix, features, alignment, nucleotide_matrices = collect_pair_statistics([batch])
+    reference_row(ratio_matrix, None).fillna("-").to_excel(os.path.join(out_dir, "transratio.xlsx"))
+    with pd.ExcelWriter(os.path.join(out_dir, "user_nucleotide.xlsx")) as writer:
+        user_nucleotide_frame(nucleotide_matrices).to_excel(writer, sheet_name="User_Nucleotide Matrices", index=False)
+    features.to_excel(os.path.join(out_dir, "summary_features.xlsx"), index=False)
+    alignment.to_excel(os.path.join(out_dir, "summary_alignment.xlsx"), index=False)
+
+
+def excel_all_results(out_dir):
+    trans_matrix = pd.read_excel(os.path.join(out_dir, "transratio.xlsx"), index_col=0)
+    nuc_matrix = {}
+    with pd.ExcelFile(os.path.join(out_dir, "user_nucleotide.xlsx")) as excel:
+        for _, row in excel.parse("User_Nucleotide Matrices").iterrows():
+            nuc_matrix[row["Sequence Pair"]] = {base: row[base] for base in ["A", "T", "G", "C"]}
+    return trans_matrix, nuc_matrix
+
+
+def excel_summary(out_dir):
+    return (pd.read_excel(os.path.join(out_dir, "summary_features.xlsx")),
+            pd.read_excel(os.path.join(out_dir, "summary_alignment.xlsx")))
+
+
+def main(length):
+    # Autoescaped like the Flask app renders them
+    templates = Environment(loader=FileSystemLoader(TEMPLATES), autoescape=True)
+    all_results = templates.get_template("partials/all_results.html")
+    summary_dashboard = templates.get_template("partials/summary_dashboard.html")
+
+    print(f"{'sequences':>10} {'pairs':>7} {'view':>12} {'read_excel s':>13} {'store s':>8} {'page s':>7}")
+    for size in PANEL_SIZES:
+        batch = panel_batch(size, length)
+        with tempfile.TemporaryDirectory() as tmp:
+            store = os.path.join(tmp, "statistics_store")
+            calculate_transitions_transversions(None, store, batches=[batch])
+            write_workbooks(batch, tmp)
+
+            timings = {}
+            with timer(timings, "all_results excel"):
+                excel_all_results(tmp)
+            with timer(timings, "all_results store"):
+                transratio_table(store), nucleotide_matrices_of(store)
+            with timer(timings, "all_results page"):
+                all_results.render(trans_matrix=transratio_table(store), nuc_matrix=nucleotide_matrices_of(store),
+                                   query_header_map=[], approx_matrix=None, reference_id=None)
+            with timer(timings, "summary excel"):
+                excel_summary(tmp)
+            with timer(timings, "summary store"):
+                summary_tables(store)
+            with timer(timings, "summary page"):
+                features, alignment = summary_tables(store)
+                summary_dashboard.render(features_matrix=features, alignment_matrix=alignment)
+
+        for view in ["all_results", "summary"]:
+            print(f"{size:>10} {len(batch[0]):>7} {view:>12} {timings[f'{view} excel']:>13.2f} "
+                  f"{timings[f'{view} store']:>8.3f} {timings[f'{view} page']:>7.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
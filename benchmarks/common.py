@@ -0,0 +1,65 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+#benchmarks/common.py
+import os
+import sys
+import time
+import random
+from contextlib import contextmanager
+
+# Allow "python benchmarks/<script>.py" from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def mutate(sequence, divergence, rng):
+    """Return a copy of sequence with point substitutions and short indels."""
+    bases = list(sequence)
+    for _ in range(int(len(bases) * divergence)):
+        pos = rng.randrange(len(bases))
+        roll = rng.random()
+        if roll < 0.8:
+            bases[pos] = rng.choice("ACGT")
+        elif roll < 0.9:
+            del bases[pos]
+        else:
+            bases.insert(pos, rng.choice("ACGT"))
+    return "".join(bases)
+
+
+def make_sequences(num_sequences, length, divergence=0.02, seed=7):
+    """Related sequences derived from one random ancestor."""
+    rng = random.Random(seed)
+    ancestor = "".join(rng.choice("ACGT") for _ in range(length))
+    return [mutate(ancestor, divergence, rng) for _ in range(num_sequences)]
+
+
+def write_fasta(path, sequences):
+    """Write sequences to path as a FASTA file and return the path."""
+    with open(path, "w") as handle:
+        for i, sequence in enumerate(sequences):
+            handle.write(f">seq{i + 1} synthetic\n")
+            for start in range(0, len(sequence), 70):
+                handle.write(sequence[start:start + 70] + "\n")
+    return path
+
+
+@contextmanager
+def timer(results, label):
+    """Store the wall-clock seconds of the with-block in results[label]."""
+    start = time.perf_counter()
+    yield
+    results[label] = time.perf_counter() - start
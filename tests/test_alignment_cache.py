@@ -0,0 +1,52 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#tests/test_alignment_cache.py
+import random
+import sqlite3
+
+from app.models.alignment_cache import AlignmentCache
+from app.utils.file_handlers import aligner_version
+
+
+def stored_bytes(cache):
+    with sqlite3.connect(cache.db_path) as conn:
+        return conn.execute("SELECT COALESCE(SUM(size), 0) FROM alignment_cache").fetchone()[0]
+
+
+def entries(first, count, length=300):
+    rng = random.Random(first)
+    return [(f"key{i}", "".join(rng.choice("ACGT-") for _ in range(length)),
+             "".join(rng.choice("ACGT-") for _ in range(length)), float(i)) for i in range(first, first + count)]
+
+
+def test_key_depends_on_the_in_process_aligner_version():
+    key = AlignmentCache.make_key("ACGT", "ACGA", "native", 10, 0.5, aligner_version("native"))
+    assert key != AlignmentCache.make_key("ACGT", "ACGA", "native", 10, 0.5, "an older version")
+    assert aligner_version("linear") != aligner_version("native")
+    assert aligner_version("needle") is None
+    assert (AlignmentCache.make_key("ACGT", "ACGA", "needle", 10, 0.5, aligner_version("needle"))
+            == AlignmentCache.make_key("ACGT", "ACGA", "needle", 10, 0.5))
+
+
+def test_running_size_follows_puts_replacements_and_evictions(tmp_path):
+    cache = AlignmentCache(str(tmp_path / "cache.db"), max_bytes=8000)
+    cache.put_many(entries(0, 20))
+    assert cache.stats()["bytes"] == stored_bytes(cache)
+    cache.put_many(entries(10, 20))
+    assert cache.stats()["evictions"] > 0
+    assert cache.stats()["bytes"] == stored_bytes(cache) <= 8000
+
+    # A new process starts from the stored entries
+    assert AlignmentCache(cache.db_path, max_bytes=8000).stats()["bytes"] == stored_bytes(cache)
@@ -0,0 +1,84 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#tests/test_alignment_store.py
+import os
+
+import numpy as np
+import pytest
+
+from app.utils.alignment_store import AlignmentStore, AlignmentStoreWriter
+
+IDS = ["query001", "query002", "query003"]
+DESCRIPTIONS = ["s1 first", "s2 second", "s3 third"]
+# Two classes: matching and differing columns
+CLASS_TABLE = 1 - np.eye(256, dtype=np.uint8)
+
+
+def write(path, qrow, srow, size=3):
+    with AlignmentStoreWriter(path, IDS[:size], DESCRIPTIONS[:size], class_table=CLASS_TABLE) as writer:
+        writer.add([(f"query001 1-{len(qrow)}", qrow), (f"query002 1-{len(srow)}", srow)])
+
+
+def test_reader_keeps_its_store_while_it_is_rewritten(tmp_path):
+    write(tmp_path, "ACGT", "ACGA")
+    with AlignmentStore(tmp_path) as store:
+        write(tmp_path, "TTTTTTTT", "TTTTTTTT")
+        assert store.pair("query001", "query002") == ("ACGT", "ACGA")
+        assert store.classes("query001", "query002").tolist() == [0, 0, 0, 1]
+        assert store.class_counts("query001", "query002").tolist() == [3, 1]
+    with AlignmentStore(tmp_path) as store:
+        assert store.pair("query001", "query002") == ("TTTTTTTT", "TTTTTTTT")
+        assert store.class_counts("query001", "query002").tolist() == [8, 0]
+
+
+def test_failed_rewrite_keeps_the_old_store(tmp_path):
+    write(tmp_path, "ACGT", "ACGA")
+    with pytest.raises(ValueError):
+        with AlignmentStoreWriter(tmp_path, IDS, DESCRIPTIONS, class_table=CLASS_TABLE) as writer:
+            writer.add([("query001 1-8", "TTTTTTTT"), ("query002 1-8", "TTTTTTTT")])
+            writer.add([("query009 1-4", "ACGT"), ("query002 1-4", "ACGT")])
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+    with AlignmentStore(tmp_path) as store:
+        assert len(store) == 1
+        assert store.pair("query001", "query002") == ("ACGT", "ACGA")
+
+
+def test_reader_sees_the_old_pairs_until_an_append_closes(tmp_path):
+    write(tmp_path, "ACGT", "ACGA", size=2)
+    writer = AlignmentStoreWriter(tmp_path, IDS, DESCRIPTIONS, append=True, class_table=CLASS_TABLE)
+    writer.add([("query001 1-4", "ACGG"), ("query003 1-4", "ACGT")])
+    with AlignmentStore(tmp_path) as store:
+        assert len(store) == 1
+        assert store.ids == IDS[:2]
+        assert store.pair("query001", "query003") is None
+        assert store.class_counts("query001", "query002").tolist() == [3, 1]
+    writer.close()
+    with AlignmentStore(tmp_path) as store:
+        assert len(store) == 2
+        assert store.pair("query003", "query001") == ("ACGT", "ACGG")
+        assert store.class_counts("query001", "query003").tolist() == [3, 1]
+
+
+def test_failed_append_keeps_the_store_as_it_was(tmp_path):
+    write(tmp_path, "ACGT", "ACGA")
+    sizes = {name: os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path)}
+    with pytest.raises(ValueError):
+        with AlignmentStoreWriter(tmp_path, IDS, DESCRIPTIONS, append=True, class_table=CLASS_TABLE) as writer:
+            writer.add([("query001 1-4", "ACGG"), ("query003 1-4", "ACGT")])
+            writer.add([("query009 1-4", "ACGT"), ("query002 1-4", "ACGT")])
+    assert {name: os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path)} == sizes
+    with AlignmentStore(tmp_path) as store:
+        assert store.num_classes == 2
+        assert store.pair("query001", "query003") is None
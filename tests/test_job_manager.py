@@ -0,0 +1,60 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#tests/test_job_manager.py
+import time
+
+from flask import Flask
+
+from app.models.job_manager import JobManager
+
+
+def slow_job(progress, steps=4, delay=0.3):
+    for done in range(1, steps + 1):
+        time.sleep(delay)
+        progress(done, steps)
+
+
+def wait_for(job_manager, job_id, status):
+    for _ in range(100):
+        if job_manager.get_job(job_id)["status"] == status:
+            return
+        time.sleep(0.02)
+
+
+def test_watch_ends_after_its_timeout(tmp_path):
+    job_manager = JobManager(Flask(__name__), str(tmp_path / "jobs.db"), workers=1)
+    job_id = job_manager.submit("session", slow_job)
+    wait_for(job_manager, job_id, JobManager.RUNNING)
+
+    start = time.monotonic()
+    snapshots = list(job_manager.watch(job_id, 0.4, min_interval=0.05))
+    assert time.monotonic() - start < 1.0
+    assert snapshots and snapshots[-1]["status"] == JobManager.RUNNING
+
+    snapshots = list(job_manager.watch(job_id, 10, min_interval=0.05))
+    assert snapshots[-1]["status"] == JobManager.DONE
+    assert snapshots[-1]["pairs_done"] == 4
+
+
+def test_watch_reads_a_queued_job_once(tmp_path):
+    job_manager = JobManager(Flask(__name__), str(tmp_path / "jobs.db"), workers=1)
+    job_manager.submit("first", slow_job)
+    job_id = job_manager.submit("second", slow_job, steps=1)
+
+    start = time.monotonic()
+    snapshots = list(job_manager.watch(job_id, 10))
+    assert time.monotonic() - start < 0.5
+    assert [snapshot["status"] for snapshot in snapshots] == [JobManager.QUEUED]
+    job_manager.executor.shutdown(wait=True)
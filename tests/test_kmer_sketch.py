@@ -0,0 +1,54 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#tests/test_kmer_sketch.py
+import random
+
+import numpy as np
+import pytest
+
+from app.utils.kmer_sketch import sketch_sequences, approximate_identity, pairs_above, sampled_pairs_above
+from app.utils.result_store import write_identity, read_identity
+
+
+def family_sketches(families=3, size=40, length=1000, seed=7):
+    rng = random.Random(seed)
+    sequences = []
+    for _ in range(families):
+        base = [rng.choice("ACGT") for _ in range(length)]
+        for _ in range(size):
+            sequence = list(base)
+            for _ in range(rng.randrange(1, length // 50)):
+                sequence[rng.randrange(length)] = rng.choice("ACGT")
+            sequences.append("".join(sequence))
+    return sketch_sequences(sequences)
+
+
+def test_sampled_pairs_estimate_the_pairs_above_threshold():
+    sketches = family_sketches()
+    exact = len(pairs_above(approximate_identity(sketches), 95))
+    pairs, scale = sampled_pairs_above(sketches, 95, sample_rows=30)
+    assert scale == len(sketches) / 60
+    assert len(pairs) * scale == pytest.approx(exact, rel=0.2)
+    assert sampled_pairs_above(sketches, 95, sample_rows=len(sketches)) == (pairs_above(approximate_identity(sketches), 95), 1.0)
+
+
+def test_identity_is_memory_mapped_from_its_archive(tmp_path):
+    identity = approximate_identity(family_sketches(size=5))
+    ids = [f"query{i + 1:03d}" for i in range(len(identity))]
+    write_identity(str(tmp_path / "identity.npz"), ids, identity)
+    read_ids, mapped = read_identity(str(tmp_path / "identity.npz"), mmap=True)
+    assert read_ids == ids
+    assert isinstance(mapped, np.memmap)
+    assert np.array_equal(mapped, identity, equal_nan=True)
@@ -0,0 +1,92 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+#tests/test_native_aligner.py
+import random
+import shutil
+
+import pytest
+from Bio.Align import PairwiseAligner, substitution_matrices
+
+from app.utils.native_aligner import global_align, native_align
+from app.utils.linear_aligner import linear_align
+from app.utils.file_handlers import count_transitions_transversions
+
+GAP_SETTINGS = [(10, 0.5), (16, 4), (5, 2), (1, 0)]
+
+
+def random_pair(case):
+    """A sequence and a diverged, sometimes truncated copy of it, with gap settings."""
+    rng = random.Random(case)
+    qseq = "".join(rng.choice("ACGT") for _ in range(rng.randint(1, 300)))
+    sseq = list(qseq)
+    for _ in range(int(len(sseq) * rng.choice([0.01, 0.05, 0.2]))):
+        pos = rng.randrange(len(sseq))
+        roll = rng.random()
+        if roll < 0.8:
+            sseq[pos] = rng.choice("ACGT")
+        elif roll < 0.9 and len(sseq) > 1:
+            del sseq[pos]
+        else:
+            sseq.insert(pos, rng.choice("ACGT"))
+    sseq = "".join(sseq)
+    if rng.random() < 0.3:
+        sseq = sseq[rng.randint(0, len(sseq) // 3):]
+    return qseq, sseq, rng.choice(GAP_SETTINGS)
+
+
+def reference_score(qseq, sseq, gap_open, gap_extend):
+    """Optimal score from Biopython's PairwiseAligner configured like needle."""
+    aligner = PairwiseAligner(mode="global")
+    aligner.substitution_matrix = substitution_matrices.load("NUC.4.4")
+    aligner.open_gap_score = -gap_open
+    aligner.extend_gap_score = -gap_extend
+    aligner.end_gap_score = 0  # needle default: end gaps are free
+    return aligner.score(qseq, sseq)
+
+
+@pytest.mark.parametrize("case", range(60))
+def test_reaches_reference_score(case):
+    qseq, sseq, (gap_open, gap_extend) = random_pair(case)
+    qaln, saln, score = global_align(qseq, sseq, gap_open, gap_extend)
+
+    assert len(qaln) == len(saln)
+    assert qaln.replace("-", "") == qseq
+    assert saln.replace("-", "") == sseq
+    assert score == pytest.approx(reference_score(qseq, sseq, gap_open, gap_extend))
+
+
+@pytest.mark.skipif(shutil.which("needle") is None, reason="EMBOSS needle not installed")
+@pytest.mark.parametrize("case", range(10))
+def test_reaches_needle_score(case):
+    import psa
+
+    qseq, sseq, (gap_open, gap_extend) = random_pair(case)
+    needle = psa.needle(moltype="nucl", qseq=qseq, sseq=sseq, matrix="EDNAFULL",
+                        gapopen=gap_open, gapextend=gap_extend)
+    # needle prints scores with one decimal
+    assert native_align("q", "s", qseq, sseq, gap_open, gap_extend).score == pytest.approx(needle.score, abs=0.05)
+
+
+@pytest.mark.parametrize("align", [native_align, linear_align])
+def test_lowercase_input_is_aligned_upper_case(align):
+    qseq, sseq, (gap_open, gap_extend) = random_pair(3)
+    lower = align("q", "s", qseq.lower(), sseq.lower(), gap_open, gap_extend)
+    upper = align("q", "s", qseq, sseq, gap_open, gap_extend)
+
+    assert (lower.qaln, lower.saln, lower.score) == (upper.qaln, upper.saln, upper.score)
+    # The statistics reject any base they do not know
+    count_transitions_transversions(lower.qaln, lower.saln)
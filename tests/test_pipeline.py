@@ -0,0 +1,116 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+#tests/test_pipeline.py
+import os
+import random
+import shutil
+
+import pytest
+
+from app.utils.pipeline import run_pipeline, run_append, outputs_fresh, results_lock, result_export
+
+# Result files of a session, named as the upload route names them
+RESULT_FILES = {
+    "alignment_file_path": "alignment.fasta",
+    "user_alignment_file_path": "user_alignment.fasta",
+    "processed_file_path": "alignment_processed.fasta",
+    "nucleotide_matrix_path": "nucleotide.xlsx",
+    "user_nucleotide_matrix_path": "user_nucleotide.xlsx",
+    "transratio_matrix_path": "transratio.xlsx",
+    "summary_features_path": "summary_features.xlsx",
+    "summary_alignment_path": "summary_alignment.xlsx",
+    "alignment_store_path": "alignment_store",
+    "statistics_store_path": "statistics_store",
+}
+
+
+def fasta(first, count, length=200):
+    rng = random.Random(first)
+    base = "".join(rng.choice("ACGT") for _ in range(length))
+    records = []
+    for i in range(first, first + count):
+        sequence = list(base)
+        for _ in range(length // 20):
+            sequence[rng.randrange(length)] = rng.choice("ACGT")
+        records.append(f">s{i} sequence {i}\n{''.join(sequence)}\n")
+    return "".join(records)
+
+
+def session_data(results_dir, upload_path, num_sequences, comparison_mode="full", reference_id=None):
+    os.makedirs(results_dir, exist_ok=True)
+    data = {column: os.path.join(results_dir, name) for column, name in RESULT_FILES.items()}
+    data.update(session_id=os.path.basename(results_dir), upload_file_path=upload_path, psa_program="native",
+                gap_open=10.0, gap_extend=0.5, num_sequences=num_sequences, comparison_mode=comparison_mode,
+                identity_threshold=None, approx_identity_path=None, approx_identity_store_path=None,
+                reference_id=reference_id, fingerprint=None)
+    return data
+
+
+@pytest.mark.parametrize("comparison_mode, reference_id, new_pairs", [("full", None, 4), ("reference", "query001", 1)])
+def test_detached_append_aligns_only_new_pairs(tmp_path, comparison_mode, reference_id, new_pairs):
+    upload_path = tmp_path / "upload.fasta"
+    upload_path.write_text(fasta(0, 4))
+    bundle = session_data(str(tmp_path / "shared" / "bundle"), str(upload_path), 4, comparison_mode, reference_id)
+    run_pipeline(bundle)
+
+    # Detached as SQLiteSessionManager.detach_session_results does: the bundle
+    # is copied into the session's own results directory
+    own_dir = str(tmp_path / "session")
+    shutil.copytree(os.path.dirname(bundle["alignment_file_path"]), own_dir)
+    own = session_data(own_dir, str(upload_path), 4, comparison_mode, reference_id)
+    assert outputs_fresh(own)
+
+    new_path = tmp_path / "append.fasta"
+    new_path.write_text(fasta(4, 1))
+    totals = []
+    assert run_append(own, str(new_path), progress=lambda done, total: totals.append(total)) == 5
+    assert totals and set(totals) == {new_pairs}
+    assert outputs_fresh(dict(own, num_sequences=5))
+
+
+def test_export_does_not_wait_for_a_running_job(tmp_path):
+    upload_path = tmp_path / "upload.fasta"
+    upload_path.write_text(fasta(0, 3))
+    data = session_data(str(tmp_path / "session"), str(upload_path), 3)
+    run_pipeline(data)
+
+    with results_lock(data):
+        with pytest.raises(BlockingIOError):
+            result_export(data, "transratio.xlsx")
+    assert result_export(data, "transratio.xlsx") == data["transratio_matrix_path"]
+    assert os.path.exists(data["transratio_matrix_path"])
+
+
+def test_failed_append_leaves_the_upload_as_it_was(tmp_path):
+    upload_path = tmp_path / "upload.fasta"
+    upload_path.write_text(fasta(0, 3))
+    data = session_data(str(tmp_path / "session"), str(upload_path), 3)
+    run_pipeline(data)
+    new_path = tmp_path / "append.fasta"
+    new_path.write_text(fasta(3, 1))
+
+    def fail(done, total):
+        raise ValueError("alignment failed")
+
+    with pytest.raises(ValueError):
+        run_append(data, str(new_path), progress=fail)
+    assert upload_path.read_text() == fasta(0, 3)
+    assert not list(tmp_path.glob("*.append"))
+
+    assert run_append(data, str(new_path)) == 4
+    assert upload_path.read_text().count(">") == 4
+    assert outputs_fresh(dict(data, num_sequences=4))
@@ -0,0 +1,85 @@
+# Copyright (C) 2025 SharmaG-omics
+#
+# Variantis Production is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#tests/test_sqlite_db.py
+import os
+import threading
+
+import pytest
+from flask import Flask
+
+from app.models.job_manager import JobManager
+from app.models.sqlite_db import SQLiteSessionManager
+from app.utils.pipeline import results_lock
+
+FINGERPRINT = "f" * 64
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(UPLOADS_FOLDER=str(tmp_path / "uploads"), RESULTS_FOLDER=str(tmp_path / "results"),
+                      SHARED_RESULTS_FOLDER=str(tmp_path / "results" / "shared"))
+    with app.app_context():
+        yield app
+
+
+def shared_session(session_manager, session_id, bundle_dir):
+    """Start a session whose results live in the shared bundle."""
+    session_manager.start_session(session_id, "127.0.0.1")
+    paths = [os.path.join(bundle_dir, name) for name in
+             ("alignment.fasta", "user_alignment.fasta", "alignment_processed.fasta", "nucleotide.xlsx",
+              "user_nucleotide.xlsx", "transratio.xlsx", "summary_features.xlsx", "summary_alignment.xlsx")]
+    session_manager.insert_session_data(session_id, os.path.join(bundle_dir, "upload.fasta"), "native", 10, 0.5, 2,
+                                        *paths, fingerprint=FINGERPRINT)
+
+
+def test_ending_a_session_defers_deleting_the_bundle_of_its_job(app, tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    session_manager = SQLiteSessionManager(app, db_path)
+    job_manager = JobManager(app, db_path, workers=1)
+    bundle_dir = os.path.join(app.config["SHARED_RESULTS_FOLDER"], FINGERPRINT)
+    shared_session(session_manager, "session", bundle_dir)
+    session_data = session_manager.get_session_individual_details("session")
+
+    started, release = threading.Event(), threading.Event()
+
+    def job(progress):
+        with results_lock(session_data):
+            started.set()
+            release.wait(10)
+
+    job_manager.submit("session", job)
+    assert started.wait(10)
+    session_manager.end_session("session")
+    assert os.path.isdir(bundle_dir)  # Still written to by the job
+
+    release.set()
+    job_manager.executor.shutdown(wait=True)
+    session_manager._delete_unused_bundle(FINGERPRINT)
+    assert not os.path.exists(bundle_dir)
+
+
+def test_a_queued_job_keeps_its_bundle(app, tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    session_manager = SQLiteSessionManager(app, db_path)
+    JobManager(app, db_path, workers=1)._execute(JobManager.INSERT_JOB_QUERY,
+                                                 ("job", "session", JobManager.QUEUED, os.getpid(), None))
+    bundle_dir = os.path.join(app.config["SHARED_RESULTS_FOLDER"], FINGERPRINT)
+    shared_session(session_manager, "session", bundle_dir)
+    os.makedirs(bundle_dir)
+
+    session_manager.release_bundle(FINGERPRINT)
+    assert os.path.isdir(bundle_dir)
+    assert session_manager.count_bundle_references(FINGERPRINT) == 0